@@ -1,28 +1,114 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_from_directory
-from sqlalchemy import create_engine
+from flask import Flask, current_app, render_template, request, redirect, url_for, session, jsonify, send_from_directory, send_file
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker, scoped_session
 
 import config
-from models.galaxy import Galaxy, Classification, User, SkippedGalaxy
-from services.fits_processor import get_galaxy_images, get_galaxy_image_paths, parse_image_filename, galaxy_data_to_dict
+from models.galaxy import Galaxy, Classification, User, SkippedGalaxy, SubmissionKey, CatalogState, upgrade_schema
+from models.database import get_engine
+from services.navigation import get_navigation_context
+from services.fits_processor import get_galaxy_images, ensure_galaxy_panels, get_contrast_presets, get_galaxy_image_paths, parse_image_filename, split_scaled_filename, get_scaled_filename, galaxy_data_to_dict, get_source_paths, get_tiles_dir, get_galaxy_thumbnail, is_image_current, get_color_images, get_color_source_paths, get_placeholder_image, COLOR_IMAGE_NAMES, FITS_IMAGE_NAMES, SCALED_WIDTHS, THUMBNAIL_WIDTH, PANEL_WIDTH
+from services.tiles import get_tile, get_tile_meta
+from services.panel_data import get_panel_data, get_colormap_luts
+from services.image_cache import touch_access, touch_stored_access, start_gc_thread, parse_size
+from services.image_store import get_image_store
+from services.spatial import find_in_region, find_nearest_unclassified, STATES
+from services.campaign import assign_galaxy, release_assignment
+from services.write_queue import WriteQueue
 import os
+import io
+import atexit
 from datetime import datetime
 import random
 import re
 import unicodedata
 
-app = Flask(__name__)
-app.config.from_object(config)
+# Views are collected here and registered on the app by create_app(), so the
+# endpoint names (url_for('classify'), ...) stay the same as with @app.route
+_routes = []
 
 
-# Set up SQLAlchemy engine and session
-engine = create_engine(app.config['SQLALCHEMY_DATABASE_URI'], echo=True)
-Session = scoped_session(sessionmaker(bind=engine))
+def route(rule, **options):
+    """Register a view for create_app(), like Flask.route"""
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+
+# Bound to the engine of the app by create_app()
+Session = scoped_session(sessionmaker())
+
+# Optional group-commit writer for classification and skip writes
+write_queue = None
+
+IMAGE_DIRECTORIES = (
+    'UPLOAD_FOLDER',
+    'GALAXY_IMAGES_FOLDER',
+    'HELP_IMAGES_FOLDER',
+    'CONNECTION_IMAGES_FOLDER',
+    'EXAMPLES_IMAGES_FOLDER',
+)
+
+
+def ensure_directories(app):
+    """Create the upload and image directories of the app"""
+    for key in IMAGE_DIRECTORIES:
+        os.makedirs(app.config[key], exist_ok=True)
+
+
+def create_app(config_object=config, **overrides):
+    """
+    Create the Flask app.
+    Startup only connects the database engine and registers the views; the
+    schema is created or upgraded by `flask --app app init-db` (or
+    utils/init_db.py), and the scientific stack is imported on the first render.
+    Args:
+        config_object: Module or object with the settings (see config.py)
+        overrides: Settings replacing values of config_object
+    """
+    global write_queue
+
+    app = Flask(__name__)
+    app.config.from_object(config_object)
+    app.config.update(overrides)
+    ensure_directories(app)
+
+    # Set up SQLAlchemy engine and session
+    engine = get_engine(app.config['SQLALCHEMY_DATABASE_URI'])
+    Session.remove()
+    Session.configure(bind=engine)
+
+    if app.config['WRITE_QUEUE_ENABLED'] and write_queue is None:
+        write_queue = WriteQueue(
+            engine,
+            window_ms=app.config['WRITE_QUEUE_WINDOW_MS'],
+            max_batch=app.config['WRITE_QUEUE_MAX_BATCH'],
+        )
+        atexit.register(write_queue.close)
+
+    # Optional background job keeping the rendered image cache within its budget
+    if app.config['IMAGE_CACHE_BUDGET']:
+        start_gc_thread(
+            app.config['GALAXY_IMAGES_FOLDER'],
+            parse_size(app.config['IMAGE_CACHE_BUDGET']),
+            app.config['IMAGE_CACHE_GC_INTERVAL'],
+            default_vmax_percentile=app.config['VMAX_PERCENTILE'],
+            default_vmax_percentile_raw=app.config['VMAX_PERCENTILE_RAW'],
+            store=get_image_store(),
+        )
+
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    app.teardown_appcontext(remove_session)
+
+    @app.cli.command('init-db')
+    def init_db_command():
+        """Create missing tables, columns and indexes"""
+        upgrade_schema(engine)
+        print("Database schema is up to date.")
+
+    return app
 
-# Create tables if they don't exist
-Galaxy.metadata.create_all(engine)
-Classification.metadata.create_all(engine)
-User.metadata.create_all(engine)
 
 CLASSIFY_PARAM_DEFAULTS = {
     'with_redshift': None,
@@ -30,7 +116,8 @@ CLASSIFY_PARAM_DEFAULTS = {
     'skipped': False,
     'valid_redshift': None,
     'lsb_class': None,
-    'morphology': None
+    'morphology': None,
+    'campaign': False
 }
 
 def get_classify_mode_params_from_request():
@@ -40,11 +127,12 @@ def get_classify_mode_params_from_request():
         'classified': CLASSIFY_PARAM_DEFAULTS['classified'],
         'skipped': CLASSIFY_PARAM_DEFAULTS['skipped'],
         'lsb_class': CLASSIFY_PARAM_DEFAULTS['lsb_class'],
-        'morphology': CLASSIFY_PARAM_DEFAULTS['morphology']
+        'morphology': CLASSIFY_PARAM_DEFAULTS['morphology'],
+        'campaign': CLASSIFY_PARAM_DEFAULTS['campaign']
     }
     
     # Process all boolean parameters in a consistent way
-    for param_name in ['with_redshift', 'valid_redshift', 'classified', 'skipped']:
+    for param_name in ['with_redshift', 'valid_redshift', 'classified', 'skipped', 'campaign']:
         param_value = request.args.get(param_name)
         if param_value and param_value.lower() in ('yes', 'true'):
             params[param_name] = True
@@ -84,27 +172,41 @@ def classify_mode_params_to_url_values(query_params):
             
     return redirect_args
 
-@app.teardown_appcontext
+def get_user_state_version(db_session):
+    """Version of the user's classification/skip state, part of navigation cache keys"""
+    return User.get_state_version(db_session, session['user_id'])
+
+def get_navigation_filters(params, classified=None):
+    """Filters of the navigation context; classified has to be None on the classify page for performance reasons"""
+    return dict(
+        skipped=params['skipped'],
+        classified=classified,
+        with_redshift=params['with_redshift'],
+        valid_redshift=params['valid_redshift'],
+        lsb_class=params['lsb_class'],
+        morphology=params['morphology'],
+    )
+
 def remove_session(exception=None):
     Session.remove()
 
 
-@app.route('/')
+@route('/')
 def index():
     """Home page with login form"""
     return render_template('index.html')
 
 
-@app.route('/favicon.ico')
+@route('/favicon.ico')
 def favicon():
     return send_from_directory(
-        os.path.join(app.root_path, 'static'),
+        os.path.join(current_app.root_path, 'static'),
         'favicon.ico',
         mimetype='image/vnd.microsoft.icon'
 )
 
 
-@app.route('/login', methods=['POST'])
+@route('/login', methods=['POST'])
 def login():
     """Handle user login"""
     username = request.form['username']
@@ -124,14 +226,157 @@ def login():
     return redirect(url_for('classify'))
 
 
-@app.route('/logout')
+@route('/logout')
 def logout():
     """Logout the user"""
     session.pop('username', None)
     session.pop('user_id', None)
     return redirect(url_for('index'))
 
-@app.route('/classify')
+def normalize_galaxy_id(galaxy_id):
+    """Convert 'p' to '+' in galaxy IDs (URL friendly form)"""
+    m = re.match(r'^(KiDSDR4_J\d{6}\.\d{3})([p])(\d{6}\.\d{2})$', galaxy_id)
+    if m:
+        return m.group(1) + '+' + m.group(3)
+    return galaxy_id
+
+
+def find_first_galaxy_id(db_session, params):
+    """Galaxy to start with when no ID was given: the next campaign assignment or the first match of the filters"""
+    if params['campaign']:
+        # Galaxy with the fewest votes, leased to this user
+        return assign_galaxy(
+            db_session,
+            user_id=session['user_id'],
+            target_votes=current_app.config['CAMPAIGN_TARGET_VOTES'],
+            lease_seconds=current_app.config['CAMPAIGN_LEASE_SECONDS'],
+        )
+    galaxy = Galaxy.get_next_for_user(
+        session=db_session,
+        user_id=session['user_id'],
+        current_galaxy_id=None,
+        **get_navigation_filters(params, classified=params['classified'])
+    )
+    return galaxy.id if galaxy else None
+
+
+def find_next_galaxy_id(db_session, galaxy_id, params):
+    """Galaxy to show after the user classified or skipped galaxy_id"""
+    if params['campaign']:
+        return find_first_galaxy_id(db_session, params)
+    context = get_navigation_context(
+        db_session,
+        user_id=session['user_id'],
+        galaxy_id=galaxy_id,
+        state_version=get_user_state_version(db_session),
+        chain_version=CatalogState.get_chain_version(db_session),
+        **get_navigation_filters(params, classified=params['classified'])
+    )
+    return context['next_id'] if context else None
+
+
+def build_classify_view(db_session, galaxy_id, params, render_images=True):
+    """
+    Everything the classification page shows for a galaxy.
+    render_images=False lists the image URLs without rendering missing panels,
+    which are then rendered when the browser requests them.
+    Returns: Dictionary of template variables, or None if the galaxy does not exist
+    """
+    # Galaxy, current classification, neighbours and progress in one query
+    context = get_navigation_context(
+        db_session,
+        user_id=session['user_id'],
+        galaxy_id=galaxy_id,
+        state_version=get_user_state_version(db_session),
+        chain_version=CatalogState.get_chain_version(db_session),
+        **get_navigation_filters(params)
+    )
+    if not context:
+        return None
+
+    galaxy = context['galaxy']
+    # Get image paths for this galaxy
+    image_paths = get_galaxy_images(
+        galaxy_id=galaxy.id,
+        data_dirs={
+            'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+            'base_dir': current_app.config['DATA_BASE_DIR'],
+        },
+        vmax_percentile=config.VMAX_PERCENTILE,
+        vmax_percentile_raw=config.VMAX_PERCENTILE_RAW,
+        session=None,
+        galaxy_data=galaxy_data_to_dict(galaxy),
+        render=render_images,
+        )
+
+    url_args = classify_mode_params_to_url_values(params)
+    next_id, previous_id = context['next_id'], context['previous_id']
+    return dict(
+        galaxy=galaxy,
+        next_galaxy={'id': next_id} if next_id else None,
+        previous_galaxy={'id': previous_id} if previous_id else None,
+        image_paths=image_paths,
+        # Widths of the rendered panel sizes, the largest is the full size panel
+        srcset_widths=list(SCALED_WIDTHS) + [PANEL_WIDTH],
+        # Colormaps of client-side rendering, empty when it is disabled
+        colormaps=get_colormap_luts(tuple(config.CLIENT_COLORMAPS)) if config.CLIENT_RENDERING else {},
+        progress=context['progress'],
+        current_classification=context['current_classification'],
+        urls={
+            'classify': url_for('classify', id=galaxy.id, **url_args),
+            'previous': url_for('classify', id=previous_id, **url_args) if previous_id else None,
+            'next': url_for('classify', id=next_id, **url_args) if next_id else None,
+            'submit': url_for('submit_classification', **url_args),
+            'skip': url_for('skip_galaxy', id=galaxy.id, **url_args) if next_id or params['campaign'] else None,
+            'aladin': url_for('aladin', ra=galaxy.ra, dec=galaxy.dec),
+            'panel_data': url_for('galaxy_panel_data', galaxy_id=galaxy.id) if config.CLIENT_RENDERING else None,
+        },
+        with_redshift=params['with_redshift'],
+        classified=params['classified'],
+        skipped=params['skipped'],
+        valid_redshift=params['valid_redshift'],
+        lsb_class=params['lsb_class'],
+        morphology=params['morphology'],
+        campaign=params['campaign'],
+    )
+
+
+def classify_view_to_json(view):
+    """JSON payload of a classification page (see build_classify_view)"""
+    galaxy = view['galaxy']
+    classification = view['current_classification']
+    return {
+        'galaxy': {
+            'id': galaxy.id,
+            'ra': galaxy.ra,
+            'dec': galaxy.dec,
+            'has_redshift': galaxy.redshift_x is not None and galaxy.redshift_y is not None,
+        },
+        'images': [
+            {
+                'base_name': image['base_name'],
+                'title': image['title'],
+                'url': url_for('static', filename=image['path']),
+                'srcset': ', '.join(f"{url_for('static', filename=path)} {width}w" for path, width in image['srcset']),
+                'vmax': None if image['vmax'] is None else float(image['vmax']),
+                'success': bool(image['success']),
+                'flip': bool(image['flip']),
+            }
+            for image in view['image_paths']
+        ],
+        'current_classification': None if classification is None else {
+            'lsb_class': classification.lsb_class,
+            'morphology': classification.morphology,
+            'comments': classification.comments or '',
+            'awesome_flag': bool(classification.awesome_flag),
+            'valid_redshift': bool(classification.valid_redshift),
+        },
+        'progress': view['progress'],
+        'urls': view['urls'],
+    }
+
+
+@route('/classify')
 def classify():
     """Main classification interface"""
     if 'username' not in session:
@@ -143,105 +388,35 @@ def classify():
     with Session() as db_session: 
         # Get a galaxy to classify (either next in sequence or random)
         galaxy_id = request.args.get('id')
-
         if galaxy_id:
-            # Convert 'p' to '+' in galaxy ID if needed
-            pattern = r'^(KiDSDR4_J\d{6}\.\d{3})([p])(\d{6}\.\d{2})$'
-            m = re.match(pattern, galaxy_id)
-            if m:
-                galaxy_id = m.group(1) + '+' + m.group(3)
+            galaxy_id = normalize_galaxy_id(galaxy_id)
         
         if not galaxy_id:
-            # Find the next suitable galaxy
-            galaxy = Galaxy.get_next_for_user(
-                session=db_session,
-                user_id=session['user_id'],
-                current_galaxy_id=None,
-                **params
-            )
+            next_id = find_first_galaxy_id(db_session, params)
             
             # If a suitable galaxy is found, redirect to it with parameters
-            if galaxy:
+            if next_id:
                 redirect_args = classify_mode_params_to_url_values(params)
-                redirect_args['id'] = galaxy.id
+                redirect_args['id'] = next_id
                 return redirect(url_for('classify', **redirect_args))
             else:
                 # No suitable galaxy found
                 return render_template('galaxy_not_found.html')
-        else:
-            # Specific galaxy requested
-            galaxy = Galaxy.get_by_id(
-                session=db_session, 
-                galaxy_id=galaxy_id
-            )
+
+        view = build_classify_view(db_session, galaxy_id, params)
         
         # Handle case when galaxy isn't found
-        if not galaxy:
+        if not view:
             return render_template('galaxy_not_found.html')
 
-        current_classification = db_session.query(Classification).filter_by(
-            user_id=session['user_id'],
-            galaxy_id=galaxy.id
-        ).first()
-        next_galaxy = Galaxy.get_next_for_user(
-            session=db_session,
-            user_id=session['user_id'],
-            current_galaxy_id=galaxy.id,
-            skipped=params['skipped'],
-            classified=None,  # This has to be None for performance reasons
-            with_redshift=params['with_redshift'],
-            valid_redshift=params['valid_redshift'],
-            lsb_class=params['lsb_class'],
-            morphology=params['morphology']
-        )
-        previous_galaxy = Galaxy.get_previous_for_user(
-            session=db_session,
-            user_id=session['user_id'],
-            current_galaxy_id=galaxy.id,
-            skipped=params['skipped'],
-            classified=None,  # This has to be None for performance reasons
-            with_redshift=params['with_redshift'],
-            valid_redshift=params['valid_redshift'],
-            lsb_class=params['lsb_class'],
-            morphology=params['morphology']
-        )
-        # Get image paths for this galaxy
-        image_paths = get_galaxy_images(
-            galaxy_id=galaxy.id,
-            data_dirs={
-                'output_dir': app.config['GALAXY_IMAGES_FOLDER'],
-                'base_dir': app.config['DATA_BASE_DIR'],
-            },
-            vmax_percentile=config.VMAX_PERCENTILE,
-            vmax_percentile_raw=config.VMAX_PERCENTILE_RAW,
-            session=None,
-            galaxy_data=galaxy_data_to_dict(galaxy),
-            )
-        
-        # Calculate progress
-        progress = Classification.get_progress(db_session, session['user_id'])
-        
-        return render_template(
-            'classify.html', 
-            galaxy=galaxy,
-            next_galaxy=next_galaxy,
-            previous_galaxy=previous_galaxy,
-            image_paths=image_paths,
-            progress=progress,
-            current_classification=current_classification,
-            with_redshift=params['with_redshift'],
-            classified=params['classified'],
-            skipped=params['skipped'],
-            valid_redshift=params['valid_redshift'],
-            lsb_class=params['lsb_class'],
-            morphology=params['morphology']
-            )
-
-
-@app.route('/static/galaxy_images/<galaxy_id>/<image_file>')
+        return render_template('classify.html', **view)
+
+
+@route('/static/galaxy_images/<galaxy_id>/<image_file>')
 def serve_galaxy_image(galaxy_id, image_file):
-    """Serve a galaxy image file with optional vmax_percentile parameters"""
+    """Serve a galaxy image file with optional vmax_percentile parameters (or a downscaled copy, *_w<width>.png)"""
     
+    image_file, width = split_scaled_filename(image_file)
     base_name, vmax_percentile, vmax_percentile_raw = parse_image_filename(
         filename=image_file,
         default_vmax_percentile=config.VMAX_PERCENTILE,
@@ -251,64 +426,259 @@ def serve_galaxy_image(galaxy_id, image_file):
     image_paths = get_galaxy_image_paths(
         galaxy_id,
         data_dirs={
-            'output_dir': app.config['GALAXY_IMAGES_FOLDER'],
-            'base_dir': app.config['DATA_BASE_DIR'],
+            'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+            'base_dir': current_app.config['DATA_BASE_DIR'],
         },
         vmax_percentile=vmax_percentile,
         vmax_percentile_raw=vmax_percentile_raw,
     )
     image_path = image_paths.get(base_name)
-    if not image_path:
+    if not image_path or (width is not None and (base_name not in FITS_IMAGE_NAMES or width not in SCALED_WIDTHS)):
         # return 404 if the image file is not found
         return jsonify({'error': 'Image not found'}), 404
+    if width is not None:
+        image_path = os.path.join(os.path.dirname(image_path), get_scaled_filename(os.path.basename(image_path), width))
+
+    if base_name in COLOR_IMAGE_NAMES:
+        # Colour panels are never rendered; in 'source' mode this is the source (or placeholder) itself
+        color_image = get_color_images(
+            galaxy_id,
+            data_dirs={
+                'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+                'base_dir': current_app.config['DATA_BASE_DIR'],
+            },
+        )[base_name]
+        return send_from_directory(os.path.dirname(color_image['file']), os.path.basename(color_image['file']))
+
+    store = get_image_store()
+    if store is not None:
+        exists = store.lookup(galaxy_id, os.path.basename(image_path)) is not None
+    else:
+        exists = os.path.exists(image_path)
 
-    # If the image doesn't exist yet, generate it
-    if not os.path.exists(image_path):
+    # If the image doesn't exist yet or its sources changed, render this panel only
+    if not exists or not is_image_current(image_path):
         data_dirs = {
-            'output_dir': app.config['GALAXY_IMAGES_FOLDER'],
-            'base_dir': app.config['DATA_BASE_DIR'],
+            'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+            'base_dir': current_app.config['DATA_BASE_DIR'],
         }
-        get_galaxy_images(
+        ensure_galaxy_panels(
             galaxy_id,
             data_dirs=data_dirs,
+            panels=[base_name],
             vmax_percentile=vmax_percentile,
-            vmax_percentile_raw=vmax_percentile_raw
+            vmax_percentile_raw=vmax_percentile_raw,
+            presets=get_contrast_presets(base_name, vmax_percentile, vmax_percentile_raw, config.CONTRAST_PRESETS)
+            if config.CONTRAST_PRESETS_ON_DEMAND else None,
         )
+
+    if store is not None:
+        # Sliced out of the mapped pack file
+        entry = store.lookup(galaxy_id, os.path.basename(image_path))
+        data = store.read(galaxy_id, os.path.basename(image_path))
+        if entry is None or data is None:
+            return jsonify({'error': 'Image not found'}), 404
+        touch_stored_access(store, galaxy_id, os.path.basename(image_path))
+        return send_file(io.BytesIO(data), mimetype='image/png', etag=False, last_modified=entry.mtime, conditional=True)
+
+    # Remember when the variant was last served, used by the cache garbage collector
+    touch_access(image_path)
     
     # Serve the image file
     return send_from_directory(os.path.dirname(image_path), os.path.basename(image_path))
 
-@app.route('/submit_classification', methods=['POST'])
-def submit_classification():
-    """Save classification data"""
-    # Extract form data
-    galaxy_id = request.form.get('galaxy_id')
-    raw_lsb = request.form.get('lsb_class')
-    raw_morph = request.form.get('morphology')
-    comments = request.form.get('comments', '')
-    awesome_flag = 'awesome_flag' in request.form
-    valid_redshift = 'valid_redshift' in request.form
-    
-    # Extract query parameters
-    params = get_classify_mode_params_from_request()
-    base_redirect_args = classify_mode_params_to_url_values(params)
 
+@route('/static/color_images/<kind>/<galaxy_id>.png')
+def serve_color_image(kind, galaxy_id):
+    """Serve a colour image straight from DATA_BASE_DIR (COLOR_IMAGE_MODE = 'source'), the APLpy one unflipped"""
+    if kind not in COLOR_IMAGE_NAMES:
+        return jsonify({'error': 'Image not found'}), 404
+    source_path = get_color_source_paths(galaxy_id, current_app.config['DATA_BASE_DIR'])[kind]
+    if not os.path.exists(source_path):
+        # Removed since the page was rendered
+        source_path = get_placeholder_image(current_app.config['GALAXY_IMAGES_FOLDER'], kind)
+    return send_from_directory(os.path.dirname(source_path), os.path.basename(source_path))
+
+
+@route('/galaxy_thumbnail/<galaxy_id>')
+def serve_galaxy_thumbnail(galaxy_id):
+    """Serve a small APLpy thumbnail, made from the colour image without rendering any FITS panel"""
+    width = request.args.get('w', THUMBNAIL_WIDTH, type=int)
+    if width not in SCALED_WIDTHS:
+        return jsonify({'error': 'Unsupported thumbnail width'}), 404
+    thumbnail_path = get_galaxy_thumbnail(
+        galaxy_id,
+        data_dirs={
+            'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+            'base_dir': current_app.config['DATA_BASE_DIR'],
+        },
+        width=width,
+    )
+    touch_access(thumbnail_path)
+    return send_from_directory(os.path.dirname(thumbnail_path), os.path.basename(thumbnail_path))
+
+@route('/panel_data/<galaxy_id>')
+def galaxy_panel_data(galaxy_id):
+    """Serve the quantized FITS panels of a galaxy for client-side rendering (services/panel_data.py)"""
+    if not current_app.config['CLIENT_RENDERING']:
+        return jsonify({'error': 'Client-side rendering is disabled'}), 404
+    with Session() as db_session:
+        galaxy = Galaxy.get_record(session=db_session, galaxy_id=galaxy_id)
+        if not galaxy:
+            return jsonify({'error': 'Galaxy not found'}), 404
+        galaxy_data = galaxy_data_to_dict(galaxy)
+    panel_data = get_panel_data(
+        galaxy_id,
+        data_dirs={
+            'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
+            'base_dir': current_app.config['DATA_BASE_DIR'],
+        },
+        presets=config.CONTRAST_PRESETS,
+        galaxy_data=galaxy_data,
+    )
+    if panel_data is None:
+        return jsonify({'error': 'FITS data not available'}), 404
+    data, mtime = panel_data
+    return send_file(io.BytesIO(data), mimetype='application/octet-stream', etag=False, last_modified=mtime, conditional=True)
+
+def resolve_tile_request(galaxy_id, variant):
+    """Return (tiles_dir, imgblock_path, vmax_percentile_raw) for a tile request, or None"""
+    base_name, _, vmax_percentile_raw = parse_image_filename(
+        filename=variant,
+        default_vmax_percentile=config.VMAX_PERCENTILE,
+        default_vmax_percentile_raw=config.VMAX_PERCENTILE_RAW,
+    )
+    if base_name != 'raw_r_band':
+        return None
+    # Only the contrasts the UI offers: every other value would add a pyramid the image GC does not see
+    if vmax_percentile_raw not in {raw for _, raw in config.CONTRAST_PRESETS}:
+        return None
+
+    with Session() as db_session:
+        galaxy = Galaxy.get_record(session=db_session, galaxy_id=galaxy_id)
+        if not galaxy:
+            return None
+        imgblock_path = get_source_paths(galaxy.id, galaxy.nucleus, current_app.config['DATA_BASE_DIR'])['imgblock']
+
+    tiles_dir = get_tiles_dir(os.path.join(current_app.config['GALAXY_IMAGES_FOLDER'], galaxy_id), vmax_percentile_raw)
+    return tiles_dir, imgblock_path, vmax_percentile_raw
+
+
+@route('/tiles/<galaxy_id>/<variant>/meta.json')
+def galaxy_tile_meta(galaxy_id, variant):
+    """Geometry of the deep-zoom pyramid of the raw r-band panel"""
+    resolved = resolve_tile_request(galaxy_id, variant)
+    if not resolved:
+        return jsonify({'error': 'Tiles not found'}), 404
+    tiles_dir, imgblock_path, vmax_percentile_raw = resolved
+    try:
+        meta = get_tile_meta(tiles_dir, imgblock_path, vmax_percentile_raw, cmap=config.DEFAULT_COLORS[0])
+    except OSError:
+        return jsonify({'error': 'FITS data not available'}), 404
+    return jsonify(meta)
+
+
+@route('/tiles/<galaxy_id>/<variant>/<int:level>/<int:x>_<int:y>.png')
+def galaxy_tile(galaxy_id, variant, level, x, y):
+    """Serve one tile of the raw r-band pyramid, rendering it on first request"""
+    resolved = resolve_tile_request(galaxy_id, variant)
+    if not resolved:
+        return jsonify({'error': 'Tiles not found'}), 404
+    tiles_dir, imgblock_path, vmax_percentile_raw = resolved
+    try:
+        tile_path = get_tile(tiles_dir, imgblock_path, level, x, y, vmax_percentile_raw, cmap=config.DEFAULT_COLORS[0])
+    except OSError:
+        return jsonify({'error': 'FITS data not available'}), 404
+    if not tile_path:
+        return jsonify({'error': 'Tile out of range'}), 404
+    return send_from_directory(os.path.dirname(tile_path), os.path.basename(tile_path))
+
+def parse_classification_form(form):
+    """
+    Validate a submitted classification.
+    Returns: (values, errors) with the values as keyword arguments of
+             Classification.create_or_update and the names of invalid fields
+    """
+    values = {
+        'comments': form.get('comments', ''),
+        'awesome_flag': 'awesome_flag' in form,
+        'valid_redshift': 'valid_redshift' in form,
+    }
     errors = []
     # Validate lsb_class
     try:
-        lsb_class = int(raw_lsb)
-        if lsb_class not in (-1, 0, 1):
+        values['lsb_class'] = int(form.get('lsb_class'))
+        if values['lsb_class'] not in (-1, 0, 1):
             errors.append('lsb_class')
     except (TypeError, ValueError):
         errors.append('lsb_class')
 
     # Validate morphology
     try:
-        morphology = int(raw_morph)
-        if morphology not in (-1, 0, 1, 2):
+        values['morphology'] = int(form.get('morphology'))
+        if values['morphology'] not in (-1, 0, 1, 2):
             errors.append('morphology')
     except (TypeError, ValueError):
         errors.append('morphology')
+    return values, errors
+
+
+def apply_classification(db_session, user_id, galaxy_id, values):
+    """Store a classification and release the user's campaign lease (not committed)"""
+    Classification.create_or_update(
+        session=db_session,
+        user_id=user_id,
+        galaxy_id=galaxy_id,
+        **values
+    )
+    release_assignment(db_session, user_id, galaxy_id)
+    User.bump_state_version(db_session, user_id)
+
+
+def apply_skip(db_session, user_id, galaxy_id, comments):
+    """Mark a galaxy as skipped and release the user's campaign lease (not committed)"""
+    SkippedGalaxy.create_or_update(
+        session=db_session,
+        user_id=user_id,
+        galaxy_id=galaxy_id,
+        comments=comments
+    )
+    release_assignment(db_session, user_id, galaxy_id)
+    User.bump_state_version(db_session, user_id)
+
+
+def commit_write(db_session, write):
+    """
+    Commit a write of the current request, through the group-commit writer when
+    it is enabled. Returns once the write is durable.
+    """
+    if write_queue is not None:
+        write_queue.submit(write).result(timeout=current_app.config['WRITE_QUEUE_TIMEOUT'])
+    else:
+        write(db_session)
+        db_session.commit()
+
+
+def save_classification(db_session, galaxy_id, values):
+    user_id = session['user_id']
+    commit_write(db_session, lambda s: apply_classification(s, user_id, galaxy_id, values))
+
+
+def save_skip(db_session, galaxy_id, comments):
+    user_id = session['user_id']
+    commit_write(db_session, lambda s: apply_skip(s, user_id, galaxy_id, comments))
+
+
+@route('/submit_classification', methods=['POST'])
+def submit_classification():
+    """Save classification data"""
+    # Extract form data
+    galaxy_id = request.form.get('galaxy_id')
+    values, errors = parse_classification_form(request.form)
+    
+    # Extract query parameters
+    params = get_classify_mode_params_from_request()
+    base_redirect_args = classify_mode_params_to_url_values(params)
 
     # If any validation failed, redirect back with error info in query string
     if errors:
@@ -318,30 +688,13 @@ def submit_classification():
     
     with Session() as db_session:
         # Save to database
-        Classification.create_or_update(
-            session=db_session,
-            user_id=session['user_id'],
-            galaxy_id=galaxy_id,
-            lsb_class=lsb_class,
-            morphology=morphology,
-            comments=comments,
-            awesome_flag=awesome_flag,
-            valid_redshift=valid_redshift,
-        )
-        db_session.commit()
-        
-        next_galaxy = Galaxy.get_next_for_user(
-            session=db_session,
-            user_id=session['user_id'], 
-            current_galaxy_id=galaxy_id,
-            with_redshift=params['with_redshift'],
-            classified=params['classified'],
-            skipped=params['skipped'],
-            valid_redshift=params['valid_redshift'],
-            lsb_class=params['lsb_class'],
-            morphology=params['morphology']
-        )
-        next_galaxy_id = next_galaxy.id if next_galaxy else None
+        save_classification(db_session, galaxy_id, values)
+
+        # In campaign mode classify() hands out the next assignment
+        if params['campaign']:
+            return redirect(url_for('classify', **base_redirect_args))
+
+        next_galaxy_id = find_next_galaxy_id(db_session, galaxy_id, params)
 
     redirect_args = dict(base_redirect_args)
     if next_galaxy_id:
@@ -350,7 +703,7 @@ def submit_classification():
     return redirect(url_for('classify', **redirect_args))
 
 
-@app.route('/skip_galaxy', methods=['GET'])
+@route('/skip_galaxy', methods=['GET'])
 def skip_galaxy():
     """Skip the current galaxy and record the reason"""
     if 'username' not in session:
@@ -365,26 +718,12 @@ def skip_galaxy():
     
     with Session() as db_session:
         # Save to database
-        SkippedGalaxy.create_or_update(
-            session=db_session,
-            user_id=session['user_id'],
-            galaxy_id=galaxy_id,
-            comments=comments
-        )
-        db_session.commit()
+        save_skip(db_session, galaxy_id, comments)
 
-        next_galaxy = Galaxy.get_next_for_user(
-            session=db_session,
-            user_id=session['user_id'], 
-            current_galaxy_id=galaxy_id,
-            with_redshift=params['with_redshift'],
-            classified=params['classified'],
-            skipped=params['skipped'],
-            valid_redshift=params['valid_redshift'],
-            lsb_class=params['lsb_class'],
-            morphology=params['morphology']
-        )
-        next_galaxy_id = next_galaxy.id if next_galaxy else None
+        if params['campaign']:
+            return redirect(url_for('classify', **classify_mode_params_to_url_values(params)))
+
+        next_galaxy_id = find_next_galaxy_id(db_session, galaxy_id, params)
 
     # Redirect to next galaxy, preserving query parameters
     redirect_args = classify_mode_params_to_url_values(params)
@@ -394,20 +733,240 @@ def skip_galaxy():
     return redirect(url_for('classify', **redirect_args))
 
 
-@app.route('/skipped_galaxies')
+def next_payload_response(db_session, next_galaxy_id, params):
+    """JSON response carrying the page of the next galaxy, if there is one"""
+    view = build_classify_view(db_session, next_galaxy_id, params) if next_galaxy_id else None
+    return jsonify({'next': classify_view_to_json(view) if view else None})
+
+
+@route('/api/classify')
+def api_classify():
+    """Classification page of a galaxy as JSON (for in-page navigation)"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    params = get_classify_mode_params_from_request()
+    with Session() as db_session:
+        galaxy_id = request.args.get('id')
+        galaxy_id = normalize_galaxy_id(galaxy_id) if galaxy_id else find_first_galaxy_id(db_session, params)
+        view = build_classify_view(db_session, galaxy_id, params) if galaxy_id else None
+        if not view:
+            return jsonify({'error': 'Galaxy not found'}), 404
+        return jsonify(classify_view_to_json(view))
+
+
+@route('/api/submit_classification', methods=['POST'])
+def api_submit_classification():
+    """Store a classification and return the next galaxy's page in the same response"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    galaxy_id = request.form.get('galaxy_id')
+    values, errors = parse_classification_form(request.form)
+    if not galaxy_id:
+        errors.append('galaxy_id')
+    if errors:
+        return jsonify({'errors': errors}), 400
+
+    params = get_classify_mode_params_from_request()
+    with Session() as db_session:
+        save_classification(db_session, galaxy_id, values)
+        return next_payload_response(db_session, find_next_galaxy_id(db_session, galaxy_id, params), params)
+
+
+@route('/api/skip_galaxy', methods=['POST'])
+def api_skip_galaxy():
+    """Skip a galaxy and return the next galaxy's page in the same response"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    galaxy_id = request.form.get('galaxy_id') or request.args.get('id')
+    if not galaxy_id:
+        return jsonify({'errors': ['galaxy_id']}), 400
+
+    params = get_classify_mode_params_from_request()
+    with Session() as db_session:
+        save_skip(db_session, galaxy_id, request.form.get('comments', ''))
+        return next_payload_response(db_session, find_next_galaxy_id(db_session, galaxy_id, params), params)
+
+
+MAX_BATCH_SIZE = 200
+MAX_PREFETCH = 10
+
+
+def parse_batch_item(item):
+    """
+    Validate one entry of a submission batch.
+    Returns: (values, errors); values are keyword arguments of apply_classification
+             (or the comments of a skip)
+    """
+    if item.get('type') == 'skip':
+        return {'comments': str(item.get('comments') or '')}, []
+    if item.get('type') != 'classification':
+        return None, ['type']
+    # Same rules as the form, flags are present only when set
+    form = {name: item.get(name) for name in ('lsb_class', 'morphology')}
+    form['comments'] = str(item.get('comments') or '')
+    for flag in ('awesome_flag', 'valid_redshift'):
+        if item.get(flag):
+            form[flag] = 'on'
+    return parse_classification_form(form)
+
+
+def apply_batch(db_session, user_id, items):
+    """Apply the items of a batch (not committed). Returns the per-item results"""
+    results = []
+    keys = [str(item.get('key') or '') for item in items]
+    applied_keys = SubmissionKey.get_applied(db_session, user_id, [k for k in keys if k])
+    galaxy_ids = {str(item.get('galaxy_id')) for item in items if item.get('galaxy_id')}
+    existing_ids = {row.id for row in db_session.query(Galaxy.id).filter(Galaxy.id.in_(galaxy_ids))} if galaxy_ids else set()
+
+    for key, item in zip(keys, items):
+        if not key:
+            results.append({'key': key, 'status': 'invalid', 'errors': ['key']})
+            continue
+        if key in applied_keys:
+            results.append({'key': key, 'status': 'duplicate'})
+            continue
+        values, errors = parse_batch_item(item)
+        galaxy_id = item.get('galaxy_id')
+        if galaxy_id not in existing_ids:
+            errors.append('galaxy_id')
+        if errors:
+            results.append({'key': key, 'status': 'invalid', 'errors': errors})
+            continue
+
+        if item['type'] == 'skip':
+            apply_skip(db_session, user_id, galaxy_id, values['comments'])
+        else:
+            apply_classification(db_session, user_id, galaxy_id, values)
+        db_session.add(SubmissionKey(key=key, user_id=user_id))
+        applied_keys.add(key)
+        results.append({'key': key, 'status': 'applied'})
+
+    return results
+
+
+@route('/api/batch', methods=['POST'])
+def api_batch():
+    """
+    Apply a batch of classifications and skips in one transaction.
+    Body: {"items": [{"key": ..., "type": "classification" | "skip", "galaxy_id": ..., ...}]}
+    Every item carries a client generated idempotency key; items whose key was
+    already applied are reported as duplicates, so a batch can be retried safely.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+        return jsonify({'error': 'Expected a JSON object with a list of items'}), 400
+    if len(items) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+
+    user_id = session['user_id']
+    with Session() as db_session:
+        try:
+            results = apply_batch(db_session, user_id, items)
+            db_session.commit()
+        except IntegrityError:
+            # A concurrent retry of the same batch stored some of the keys first;
+            # apply it again, those items are now reported as duplicates
+            db_session.rollback()
+            results = apply_batch(db_session, user_id, items)
+            db_session.commit()
+    return jsonify({'results': results})
+
+
+@route('/api/prefetch')
+def api_prefetch():
+    """
+    Pages of the galaxies that follow `after` with the current filters, so the
+    client can keep classifying while its submissions are still queued.
+    In campaign mode this is the user's next assignment only.
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    params = get_classify_mode_params_from_request()
+    after = request.args.get('after')
+    try:
+        count = max(0, min(int(request.args.get('count', 5)), MAX_PREFETCH))
+    except ValueError:
+        return jsonify({'error': 'Invalid count'}), 400
+
+    payloads = []
+    with Session() as db_session:
+        if params['campaign']:
+            galaxy_ids = [find_first_galaxy_id(db_session, params)]
+        else:
+            galaxy_ids = []
+            galaxy_id = normalize_galaxy_id(after) if after else None
+            while len(galaxy_ids) < count:
+                galaxy_id = find_next_galaxy_id(db_session, galaxy_id, params) if galaxy_id \
+                    else find_first_galaxy_id(db_session, params)
+                if not galaxy_id or galaxy_id in galaxy_ids:
+                    break
+                galaxy_ids.append(galaxy_id)
+
+        for galaxy_id in galaxy_ids:
+            if not galaxy_id or galaxy_id == after:
+                continue
+            # URLs only; the images render lazily when the client preloads them
+            view = build_classify_view(db_session, galaxy_id, params, render_images=False)
+            if view:
+                payloads.append(classify_view_to_json(view))
+    return jsonify({'galaxies': payloads})
+
+
+SKIPPED_PAGE_SIZE = 50
+
+
+def encode_keyset_cursor(cursor):
+    """URL value of a (date, id) keyset cursor"""
+    if cursor is None:
+        return None
+    date_value, row_id = cursor
+    return f"{date_value.isoformat()}_{row_id}"
+
+
+def parse_keyset_cursor(value):
+    """Inverse of encode_keyset_cursor; raises ValueError on malformed input"""
+    if not value:
+        return None
+    date_part, _, id_part = value.rpartition('_')
+    return datetime.fromisoformat(date_part), int(id_part)
+
+
+@route('/skipped_galaxies')
 def skipped_galaxies():
     """Show skipped galaxies"""
     if 'username' not in session:
         return redirect(url_for('index'))
-    
+
+    try:
+        before = parse_keyset_cursor(request.args.get('before'))
+    except ValueError:
+        return redirect(url_for('skipped_galaxies'))
+
     with Session() as db_session:
-        # Get skipped galaxies for the user
-        skipped_galaxies = SkippedGalaxy.get_skipped(db_session, session['user_id'])
-        
-        return render_template('skipped_galaxies.html', skipped_galaxies=skipped_galaxies)
+        # One page of skipped galaxies for the user, galaxies loaded in the same query
+        skipped_galaxies, next_cursor = SkippedGalaxy.get_skipped_page(
+            db_session, session['user_id'], before=before, limit=SKIPPED_PAGE_SIZE
+        )
+        skipped_count = SkippedGalaxy.get_skipped_count(db_session, session['user_id'])
+
+        return render_template(
+            'skipped_galaxies.html',
+            skipped_galaxies=skipped_galaxies,
+            skipped_count=skipped_count,
+            next_cursor=encode_keyset_cursor(next_cursor),
+            is_first_page=before is None,
+        )
 
 
-@app.route('/unskip_galaxy', methods=['POST'])
+@route('/unskip_galaxy', methods=['POST'])
 def unskip_galaxy():
     """Unskip a galaxy"""
     if 'username' not in session:
@@ -419,19 +978,112 @@ def unskip_galaxy():
     with Session() as db_session:
         # Remove the skipped galaxy record
         SkippedGalaxy.delete_skipped(db_session, session['user_id'], galaxy_id)
+        User.bump_state_version(db_session, session['user_id'])
         db_session.commit()
     
     # Redirect to skipped galaxies page
     return redirect(url_for('skipped_galaxies'))
 
 
-@app.route('/help')
+HISTORY_PAGE_SIZE = 50
+
+
+def get_history_filters():
+    """Filters of the history view from the query string; invalid values are ignored"""
+    filters = {'lsb_class': None, 'morphology': None, 'awesome_flag': None}
+    for name in ('lsb_class', 'morphology'):
+        try:
+            filters[name] = int(request.args[name])
+        except (KeyError, ValueError):
+            pass
+    awesome = request.args.get('awesome', '').lower()
+    if awesome in ('yes', 'true'):
+        filters['awesome_flag'] = True
+    elif awesome in ('no', 'false'):
+        filters['awesome_flag'] = False
+    return filters
+
+
+def load_history_page():
+    """
+    Page of the current user's classification history selected by the query string.
+    Returns: (classifications, filters, next cursor string) or None for an invalid cursor
+    """
+    filters = get_history_filters()
+    try:
+        before = parse_keyset_cursor(request.args.get('before'))
+        limit = max(1, min(int(request.args.get('limit', HISTORY_PAGE_SIZE)), 500))
+    except ValueError:
+        return None
+    with Session() as db_session:
+        rows, next_cursor = Classification.get_history_page(
+            db_session, session['user_id'], before=before, limit=limit, **filters
+        )
+    return rows, filters, encode_keyset_cursor(next_cursor)
+
+
+@route('/history')
+def history():
+    """Browse all classifications of the current user"""
+    if 'username' not in session:
+        return redirect(url_for('index'))
+
+    page = load_history_page()
+    if page is None:
+        return redirect(url_for('history'))
+    classifications, filters, next_cursor = page
+
+    # Filters as query values, kept when following the "Older" link
+    filter_args = {k: v for k, v in request.args.items() if k in ('lsb_class', 'morphology', 'awesome')}
+    return render_template(
+        'history.html',
+        classifications=classifications,
+        filters=filters,
+        filter_args=filter_args,
+        next_cursor=next_cursor,
+        is_first_page=not request.args.get('before'),
+        lsb_class_options=current_app.config['LSB_CLASS_OPTIONS'],
+        morphology_options=current_app.config['MORPHOLOGY_OPTIONS'],
+    )
+
+
+@route('/api/history')
+def api_history():
+    """Classification history as JSON; follow `next` (the `before` cursor) for older pages"""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    page = load_history_page()
+    if page is None:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    classifications, _, next_cursor = page
+    return jsonify({
+        'classifications': [
+            {
+                'id': c.id,
+                'galaxy_id': c.galaxy_id,
+                'ra': c.galaxy.ra if c.galaxy else None,
+                'dec': c.galaxy.dec if c.galaxy else None,
+                'lsb_class': c.lsb_class,
+                'morphology': c.morphology,
+                'awesome_flag': bool(c.awesome_flag),
+                'valid_redshift': bool(c.valid_redshift),
+                'comments': c.comments,
+                'date_classified': c.date_classified.isoformat() if c.date_classified else None,
+            }
+            for c in classifications
+        ],
+        'next': next_cursor,
+    })
+
+
+@route('/help')
 def help():
     """Help page with examples and tips"""
     category = request.args.get('category', 'examples')
     
     # Get all image names from examples directory
-    examples_dir = os.path.join(app.config['EXAMPLES_IMAGES_FOLDER'], )
+    examples_dir = os.path.join(current_app.config['EXAMPLES_IMAGES_FOLDER'], )
     example_images = []
     
     if os.path.exists(examples_dir):
@@ -448,7 +1100,7 @@ def help():
     return render_template('help.html', category=category, example_images=example_images, example_descriptions=dict())
 
 
-@app.route('/results')
+@route('/results')
 def results():
     """Show results/statistics for the current user"""
     if 'username' not in session:
@@ -461,12 +1113,73 @@ def results():
         return render_template('results.html', stats=user_stats)
 
 
-@app.route('/aladin/<ra>/<dec>')
+def get_float_args(*names):
+    """Float query parameters; raises ValueError if any is missing or invalid"""
+    return tuple(float(request.args[name]) for name in names)
+
+
+@route('/api/region')
+def region():
+    """
+    Galaxies in a cone (ra, dec, radius) or box (ra_min, ra_max, dec_min, dec_max),
+    optionally filtered by the user's classification state and redshift markers
+    """
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+
+    params = get_classify_mode_params_from_request()
+    state = request.args.get('state')
+    if state is not None and state not in STATES:
+        return jsonify({'error': f'Invalid state, expected one of {", ".join(STATES)}'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 500)), 5000)
+        if 'radius' in request.args:
+            cone, box = get_float_args('ra', 'dec', 'radius'), None
+        else:
+            cone, box = None, get_float_args('ra_min', 'ra_max', 'dec_min', 'dec_max')
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Expected ra, dec and radius or ra_min, ra_max, dec_min and dec_max (degrees)'}), 400
+
+    with Session() as db_session:
+        result = find_in_region(
+            db_session, session['user_id'], cone=cone, box=box, state=state,
+            with_redshift=params['with_redshift'], limit=limit,
+        )
+    return jsonify(result)
+
+
+@route('/nearest_unclassified')
+def nearest_unclassified():
+    """Jump to the nearest galaxy to (ra, dec) that the user has not classified or skipped yet"""
+    if 'username' not in session:
+        return redirect(url_for('index'))
+
+    params = get_classify_mode_params_from_request()
+    try:
+        ra, dec = get_float_args('ra', 'dec')
+    except (KeyError, ValueError):
+        return jsonify({'error': 'Expected ra and dec (degrees)'}), 400
+
+    with Session() as db_session:
+        galaxy_id, _ = find_nearest_unclassified(
+            db_session, session['user_id'], ra, dec, with_redshift=params['with_redshift']
+        )
+    if galaxy_id is None:
+        return render_template('galaxy_not_found.html')
+
+    redirect_args = classify_mode_params_to_url_values(params)
+    redirect_args['id'] = galaxy_id
+    return redirect(url_for('classify', **redirect_args))
+
+
+@route('/aladin/<ra>/<dec>')
 def aladin(ra, dec):
     """Open Aladin viewer in a new tab"""
     aladin_url = f"https://aladin.unistra.fr/AladinLite/?target={ra} {dec}&fov=0.1"
     return render_template('aladin.html', aladin_url=aladin_url)
 
+app = create_app()
+
 if __name__ == '__main__':
     app.run(debug=True)
 
@@ -0,0 +1,276 @@
+# asgi.py
+#
+# Asyncio image-serving path. Cached galaxy images are streamed without
+# occupying a worker, missing renders are pushed to a process pool and
+# awaited, so a slow FITS render never blocks requests for cached files.
+#
+# Run the image app on its own (e.g. behind a proxy routing
+# /static/galaxy_images/ to it):
+#     uvicorn asgi:image_app
+# or together with the Flask app (requires asgiref):
+#     uvicorn asgi:application
+
+import os
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
+from email.utils import formatdate
+from functools import partial
+from urllib.parse import unquote
+
+import config
+from services.fits_processor import (
+    parse_image_filename, split_scaled_filename, get_scaled_filename, get_galaxy_image_paths, get_color_images,
+    is_image_current, COLOR_IMAGE_NAMES, FITS_IMAGE_NAMES, SCALED_WIDTHS
+)
+from services.image_cache import touch_access, touch_stored_access
+from services.image_store import get_image_store
+
+IMAGE_URL_PREFIX = '/static/galaxy_images/'
+CHUNK_SIZE = 256 * 1024
+
+def render_galaxy_variant(galaxy_id, base_name, vmax_percentile, vmax_percentile_raw):
+    """
+    Render one panel of a galaxy for one contrast setting, or for all contrast
+    presets if it is one of them (CONTRAST_PRESETS_ON_DEMAND).
+    Runs inside the render process pool, which has its own engine (see models/database.py).
+    """
+    from models.database import get_sessionmaker
+    from models.galaxy import Galaxy
+    from services.fits_processor import ensure_galaxy_panels, get_contrast_presets, galaxy_data_to_dict
+
+    with get_sessionmaker()() as session:
+        galaxy = Galaxy.get_record(session, galaxy_id)
+        if not galaxy:
+            return False
+        galaxy_data = galaxy_data_to_dict(galaxy)
+
+    ensure_galaxy_panels(
+        galaxy_id,
+        data_dirs={
+            'output_dir': config.GALAXY_IMAGES_FOLDER,
+            'base_dir': config.DATA_BASE_DIR,
+        },
+        panels=[base_name],
+        vmax_percentile=vmax_percentile,
+        vmax_percentile_raw=vmax_percentile_raw,
+        galaxy_data=galaxy_data,
+        presets=get_contrast_presets(base_name, vmax_percentile, vmax_percentile_raw, config.CONTRAST_PRESETS)
+        if config.CONTRAST_PRESETS_ON_DEMAND else None,
+    )
+    return True
+
+
+def _open_image(path, touch=True):
+    """Open an image for sending; blocking, runs in the default thread pool"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None
+    st = os.fstat(f.fileno())
+    if touch:
+        touch_access(path)
+    return f, 0, st.st_size, st.st_mtime
+
+
+def _open_color_image(galaxy_id, base_name):
+    """Open a colour panel, prepared according to COLOR_IMAGE_MODE; it may be a source file, so it is not touched"""
+    data_dirs = {'output_dir': config.GALAXY_IMAGES_FOLDER, 'base_dir': config.DATA_BASE_DIR}
+    return _open_image(get_color_images(galaxy_id, data_dirs)[base_name]['file'], touch=False)
+
+
+def _open_packed_image(store, path):
+    """Open the pack file holding an image (IMAGE_STORE = 'pack'); the image is a byte range of it"""
+    galaxy_id, filename = os.path.basename(os.path.dirname(path)), os.path.basename(path)
+    opened = store.open_range(galaxy_id, filename)
+    if opened is None:
+        return None
+    touch_stored_access(store, galaxy_id, filename)
+    f, offset, entry = opened
+    return f, offset, entry.size, entry.mtime
+
+
+class ImageApp:
+    """ASGI application serving /static/galaxy_images/<galaxy_id>/<image_file>"""
+
+    def __init__(self, render_workers=None):
+        self.render_workers = render_workers or config.ASYNC_RENDER_WORKERS
+        self.render_pool = None
+        self.in_flight = {}  # (galaxy_id, base_name, vmax, vmax_raw) -> asyncio.Future
+
+    def start(self):
+        if self.render_pool is None:
+            self.render_pool = ProcessPoolExecutor(max_workers=self.render_workers)
+
+    def stop(self):
+        if self.render_pool is not None:
+            self.render_pool.shutdown(wait=False, cancel_futures=True)
+            self.render_pool = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self.handle(scope, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def render(self, galaxy_id, base_name, vmax_percentile, vmax_percentile_raw):
+        """Render in the process pool; concurrent requests for the same panel variant share one render"""
+        self.start()
+        key = (galaxy_id, base_name, vmax_percentile, vmax_percentile_raw)
+        future = self.in_flight.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(
+                self.render_pool, render_galaxy_variant, galaxy_id, base_name, vmax_percentile, vmax_percentile_raw
+            )
+            self.in_flight[key] = future
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(future)
+
+    async def handle(self, scope, send):
+        if scope['method'] not in ('GET', 'HEAD'):
+            await send_json(send, 405, {'error': 'Method not allowed'})
+            return
+
+        path = unquote(scope['path'])
+        parts = path[len(IMAGE_URL_PREFIX):].split('/') if path.startswith(IMAGE_URL_PREFIX) else []
+        if len(parts) != 2 or not all(parts) or '..' in parts:
+            await send_json(send, 404, {'error': 'Image not found'})
+            return
+        galaxy_id, image_file = parts
+
+        image_file, width = split_scaled_filename(image_file)
+        base_name, vmax_percentile, vmax_percentile_raw = parse_image_filename(
+            filename=image_file,
+            default_vmax_percentile=config.VMAX_PERCENTILE,
+            default_vmax_percentile_raw=config.VMAX_PERCENTILE_RAW,
+        )
+        image_path = get_galaxy_image_paths(
+            galaxy_id,
+            data_dirs={'output_dir': config.GALAXY_IMAGES_FOLDER},
+            vmax_percentile=vmax_percentile,
+            vmax_percentile_raw=vmax_percentile_raw,
+        ).get(base_name)
+        if not image_path or (width is not None and (base_name not in FITS_IMAGE_NAMES or width not in SCALED_WIDTHS)):
+            await send_json(send, 404, {'error': 'Image not found'})
+            return
+        if width is not None:
+            image_path = os.path.join(os.path.dirname(image_path), get_scaled_filename(os.path.basename(image_path), width))
+
+        loop = asyncio.get_running_loop()
+        store = get_image_store()
+        open_rendered = _open_image if store is None else partial(_open_packed_image, store)
+        if base_name in COLOR_IMAGE_NAMES:
+            # Never rendered, so no trip to the render pool
+            opened = await loop.run_in_executor(None, _open_color_image, galaxy_id, base_name)
+        elif not await loop.run_in_executor(None, is_image_current, image_path):
+            # Sources changed since the render (e.g. GALFIT rerun): render again before serving
+            opened = None
+        else:
+            opened = await loop.run_in_executor(None, open_rendered, image_path)
+        if opened is None:
+            try:
+                found = await self.render(galaxy_id, base_name, vmax_percentile, vmax_percentile_raw)
+            except Exception as e:
+                await send_json(send, 500, {'error': f'Rendering failed: {e}'})
+                return
+            opened = await loop.run_in_executor(None, open_rendered, image_path) if found else None
+            if opened is None:
+                await send_json(send, 404, {'error': 'Image not found'})
+                return
+
+        f, offset, size, mtime = opened
+        try:
+            await send_file(scope, send, f, size, mtime, offset)
+        finally:
+            f.close()
+
+
+async def send_file(scope, send, f, size, mtime, offset=0):
+    """Send `size` bytes of an open file from `offset`, using the server's zero-copy extension when available"""
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'image/png'),
+            (b'content-length', str(size).encode()),
+            (b'last-modified', formatdate(mtime, usegmt=True).encode()),
+            (b'cache-control', b'no-cache'),
+        ],
+    })
+    if scope['method'] == 'HEAD':
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+
+    if 'http.response.zerocopysend' in scope.get('extensions', {}):
+        # The server passes the descriptor to sendfile(2)
+        await send({'type': 'http.response.zerocopysend', 'file': f, 'offset': offset, 'count': size})
+        return
+
+    loop = asyncio.get_running_loop()
+    f.seek(offset)
+    remaining = size
+    while True:
+        chunk = await loop.run_in_executor(None, f.read, min(CHUNK_SIZE, remaining))
+        remaining -= len(chunk)
+        more = remaining > 0 and len(chunk) > 0
+        await send({'type': 'http.response.body', 'body': chunk, 'more_body': more})
+        if not more:
+            return
+
+
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class Dispatcher:
+    """Route galaxy images to the async image app and everything else to Flask"""
+
+    def __init__(self, image_app, flask_app):
+        self.image_app = image_app
+        self.flask_app = flask_app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.image_app(scope, receive, send)
+        elif scope['type'] == 'http' and scope['path'].startswith(IMAGE_URL_PREFIX):
+            await self.image_app(scope, receive, send)
+        else:
+            await self.flask_app(scope, receive, send)
+
+
+image_app = ImageApp()
+
+
+def __getattr__(name):
+    # Built lazily so that `uvicorn asgi:image_app` does not import Flask
+    if name == 'application':
+        try:
+            from asgiref.wsgi import WsgiToAsgi
+        except ImportError:
+            raise ImportError("Mounting the Flask app requires asgiref (pip install asgiref)")
+        from app import app as flask_app
+        global application
+        application = Dispatcher(image_app, WsgiToAsgi(flask_app))
+        return application
+    raise AttributeError(name)
@@ -24,19 +24,19 @@ SQLALCHEMY_DATABASE_URI = os.environ.get(
 )
 SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+# Connection pool of the shared engine (models/database.py), per process
+SQLALCHEMY_POOL_SIZE = int(os.environ.get('LSBMORPH_DB_POOL_SIZE', 5))
+SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('LSBMORPH_DB_MAX_OVERFLOW', 10))
+SQLALCHEMY_POOL_RECYCLE = 3600  # seconds
+SQLALCHEMY_ECHO = os.environ.get('LSBMORPH_SQL_ECHO', '').lower() in ('1', 'true', 'yes')
+
 # Directory settings
 UPLOAD_FOLDER = os.path.join(BASE_DIR, 'static/uploads')
 GALAXY_IMAGES_FOLDER = os.path.join(BASE_DIR, 'static/galaxy_images')
 HELP_IMAGES_FOLDER = os.path.join(BASE_DIR, 'static/images/tips')
 CONNECTION_IMAGES_FOLDER = os.path.join(BASE_DIR, 'static/images/connection')
 EXAMPLES_IMAGES_FOLDER = os.path.join(BASE_DIR, 'static/images/examples')
-
-# Ensure all required directories exist
-os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-os.makedirs(GALAXY_IMAGES_FOLDER, exist_ok=True)
-os.makedirs(HELP_IMAGES_FOLDER, exist_ok=True)
-os.makedirs(CONNECTION_IMAGES_FOLDER, exist_ok=True)
-os.makedirs(EXAMPLES_IMAGES_FOLDER, exist_ok=True)
+# (created by create_app() in app.py)
 
 # Image processing settings
 FITS_PERCENTILE_LIMITS = {
@@ -75,3 +75,83 @@ DEFAULT_COLORS = ['viridis', 'red', 'black']  # [cmap, ellipse_color, redshift_m
 
 VMAX_PERCENTILE = 99.0
 VMAX_PERCENTILE_RAW = 99.7
+
+# (vmax_percentile, vmax_percentile_raw) steps of the contrast button, the
+# first one is the default above. The classification page passes them to
+# static/js/main.js; image requests for a preset render the panel at every
+# preset in one pass, and utils/generate_images.py --presets pre-renders them
+CONTRAST_PRESETS = [
+    (VMAX_PERCENTILE, VMAX_PERCENTILE_RAW),
+    (99.5, 99.7),
+    (99.9, 99.9),
+    (99.95, 99.95),
+    (80.0, 90.0),
+    (90.0, 99.0),
+]
+# A missing preset variant of a panel renders the panel at every preset at once:
+# the first contrast click waits for all of them, the following ones are cached
+CONTRAST_PRESETS_ON_DEMAND = os.environ.get('LSBMORPH_CONTRAST_PRESETS_ON_DEMAND', '1').lower() in ('1', 'true', 'yes')
+
+# Client-side rendering: the classification page loads the quantized FITS
+# panels of a galaxy once (services/panel_data.py) and applies the contrast
+# presets and colormaps in the browser, without renders or further requests.
+# The rendered PNGs stay the first view and the fallback.
+CLIENT_RENDERING = os.environ.get('LSBMORPH_CLIENT_RENDERING', '1').lower() in ('1', 'true', 'yes')
+# Colormaps of the colormap selector, the first is the one of the rendered PNGs
+CLIENT_COLORMAPS = [DEFAULT_COLORS[0], 'gray', 'gray_r', 'magma', 'cividis']
+
+# Missing or unreadable source files are remembered for this long before the
+# data disk is checked again (services/source_cache.py)
+SOURCE_NEGATIVE_CACHE_TTL = int(os.environ.get('LSBMORPH_SOURCE_NEGATIVE_CACHE_TTL', 600))  # seconds
+
+# A served image found current against its recorded sources is not checked
+# again for this long (services/render_deps.py)
+RENDER_DEPS_CHECK_TTL = int(os.environ.get('LSBMORPH_RENDER_DEPS_CHECK_TTL', 60))  # seconds
+
+# Take source availability from the source_files index (utils/index_sources.py)
+# instead of probing DATA_BASE_DIR; keep the index updated when enabled
+SOURCE_INDEX_ENABLED = os.environ.get('LSBMORPH_SOURCE_INDEX', '').lower() in ('1', 'true', 'yes')
+
+# How the colour panels (APLpy, Lupton) get to the browser; they never change
+# with the contrast and are not part of the render:
+#   'copy'   - copied into GALAXY_IMAGES_FOLDER once per galaxy (APLpy flipped on copy)
+#   'link'   - symlinked into GALAXY_IMAGES_FOLDER, no copies
+#   'source' - served straight from DATA_BASE_DIR, nothing written
+# With 'link' and 'source' the APLpy image is flipped in the browser (CSS)
+COLOR_IMAGE_MODE = os.environ.get('LSBMORPH_COLOR_IMAGE_MODE', 'copy')
+
+# Storage of the rendered FITS panels (services/image_store.py):
+#   'files' - one PNG per panel and contrast in GALAXY_IMAGES_FOLDER/<galaxy_id>/
+#   'pack'  - appended to sharded pack files in IMAGE_PACK_FOLDER with an SQLite
+#             offset index; migrate existing images with utils/pack_images.py.
+#             Best combined with COLOR_IMAGE_MODE = 'source'.
+IMAGE_STORE = os.environ.get('LSBMORPH_IMAGE_STORE', 'files')
+IMAGE_PACK_FOLDER = os.environ.get('LSBMORPH_IMAGE_PACK_DIR', os.path.join(BASE_DIR, 'image_packs'))
+IMAGE_PACK_SHARDS = int(os.environ.get('LSBMORPH_IMAGE_PACK_SHARDS', 64))  # Fixed once the store exists
+
+# Rendered image cache maintenance (see utils/gc_images.py).
+# Budget like '20G'; when set, the web app also runs the collector periodically.
+IMAGE_CACHE_BUDGET = os.environ.get('LSBMORPH_IMAGE_CACHE_BUDGET')
+IMAGE_CACHE_GC_INTERVAL = int(os.environ.get('LSBMORPH_IMAGE_CACHE_GC_INTERVAL', 3600))  # seconds
+
+# Deep-zoom tiles of the raw r-band panel are rendered lazily on request;
+# set to True to pre-generate them in utils/generate_images.py
+GENERATE_TILES = False
+
+# Render processes of the asyncio image app (asgi.py)
+ASYNC_RENDER_WORKERS = int(os.environ.get('LSBMORPH_ASYNC_RENDER_WORKERS', os.cpu_count() or 2))
+
+# Memory-mapped catalog snapshot shared by all web workers (utils/build_catalog.py)
+CATALOG_SNAPSHOT_DIR = os.environ.get('LSBMORPH_CATALOG_DIR', os.path.join(BASE_DIR, 'catalog'))
+
+# Campaign mode (/classify?campaign=true): independent classifications wanted
+# per galaxy, and how long a handed-out galaxy stays reserved for its user
+CAMPAIGN_TARGET_VOTES = int(os.environ.get('LSBMORPH_CAMPAIGN_TARGET_VOTES', 3))
+CAMPAIGN_LEASE_SECONDS = int(os.environ.get('LSBMORPH_CAMPAIGN_LEASE_SECONDS', 600))
+
+# Group commit of classification/skip writes (services/write_queue.py): writes
+# arriving within the window are committed in one transaction by one thread
+WRITE_QUEUE_ENABLED = os.environ.get('LSBMORPH_WRITE_QUEUE', '').lower() in ('1', 'true', 'yes')
+WRITE_QUEUE_WINDOW_MS = float(os.environ.get('LSBMORPH_WRITE_QUEUE_WINDOW_MS', 5))
+WRITE_QUEUE_MAX_BATCH = 256
+WRITE_QUEUE_TIMEOUT = 30  # seconds a request waits for its write
@@ -0,0 +1,77 @@
+# models/database.py
+#
+# One pooled engine per database URL for the whole process. The web app, the
+# render fallbacks in services/ and the scripts in utils/ all go through
+# get_engine()/get_sessionmaker(), so a connection pool is set up once and
+# reused instead of a new engine (and connection) per call.
+
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import config
+
+_engines = {}
+_sessionmakers = {}
+_lock = threading.Lock()
+
+
+def _engine_options(url):
+    options = {
+        'echo': config.SQLALCHEMY_ECHO,
+        'pool_pre_ping': True,
+    }
+    if url.startswith('sqlite') and (':memory:' in url or url.rstrip('/') == 'sqlite:'):
+        # In-memory SQLite uses a single connection per thread, there is no pool to size
+        return options
+    options.update(
+        pool_size=config.SQLALCHEMY_POOL_SIZE,
+        max_overflow=config.SQLALCHEMY_MAX_OVERFLOW,
+        pool_recycle=config.SQLALCHEMY_POOL_RECYCLE,
+    )
+    return options
+
+
+def get_engine(url=None):
+    """
+    Return the process wide engine of a database URL, created on first use.
+    Args:
+        url: SQLAlchemy database URL, defaults to config.SQLALCHEMY_DATABASE_URI
+    """
+    url = url or config.SQLALCHEMY_DATABASE_URI
+    engine = _engines.get(url)
+    if engine is None:
+        with _lock:
+            engine = _engines.get(url)
+            if engine is None:
+                engine = create_engine(url, **_engine_options(url))
+                _engines[url] = engine
+    return engine
+
+
+def get_sessionmaker(url=None):
+    """Return the session factory bound to get_engine(url)"""
+    url = url or config.SQLALCHEMY_DATABASE_URI
+    factory = _sessionmakers.get(url)
+    if factory is None:
+        factory = sessionmaker(bind=get_engine(url))
+        _sessionmakers[url] = factory
+    return factory
+
+
+def engine_count():
+    """Number of engines created in this process"""
+    return len(_engines)
+
+
+def _reset_pools_after_fork():
+    # A forked child (render pool, pre-forking server) must not reuse the
+    # parent's connections; it opens its own on first use
+    for engine in _engines.values():
+        engine.dispose(close=False)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_pools_after_fork)
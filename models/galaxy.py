@@ -1,15 +1,27 @@
+from collections import namedtuple
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, ForeignKey, Index, inspect, text, or_, and_
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, joinedload
 
 Base = declarative_base()
 
+# Read-only, session independent copies of rows (safe to cache between requests)
+GalaxyRecord = namedtuple('GalaxyRecord', [
+    'id', 'ra', 'dec', 'x', 'y', 'redshift_x', 'redshift_y', 'r_r', 'q', 'pa', 'nucleus', 'position'
+])
+ClassificationRecord = namedtuple('ClassificationRecord', [
+    'lsb_class', 'morphology', 'comments', 'awesome_flag', 'valid_redshift', 'date_classified'
+])
+
 class User(Base):
     __tablename__ = 'users'
     
     id = Column(Integer, primary_key=True)
     username = Column(String, unique=True, nullable=False)
+    # Bumped with every change of the user's classifications or skips, part of
+    # the navigation cache keys (services/navigation.py); shared by all sessions
+    state_version = Column(Integer, nullable=False, default=0, server_default='0')
     
     classifications = relationship("Classification", back_populates="user")
     skipped_galaxies = relationship("SkippedGalaxy", back_populates="user")
@@ -28,10 +40,27 @@ class User(Base):
     def get_by_id(cls, session, user_id):
         """Get user by ID"""
         return session.query(cls).filter(cls.id == user_id).first()
+
+    @classmethod
+    def get_state_version(cls, session, user_id):
+        """Current state version of a user, 0 for an unknown user"""
+        version = session.query(cls.state_version).filter(cls.id == user_id).scalar()
+        return version or 0
+
+    @classmethod
+    def bump_state_version(cls, session, user_id):
+        """Invalidate the user's cached navigation contexts in every worker and session (not committed)"""
+        session.query(cls).filter(cls.id == user_id).update(
+            {cls.state_version: cls.state_version + 1}, synchronize_session=False
+        )
     
 
 class Galaxy(Base):
     __tablename__ = 'galaxies'
+    __table_args__ = (
+        # Campaign scheduling: fewest votes first, chain order within
+        Index('ix_galaxies_vote_count_position', 'vote_count', 'position'),
+    )
     
     id = Column(String, primary_key=True)  # Galaxy ID from catalog
     ra = Column(Float, nullable=False)
@@ -46,6 +75,8 @@ class Galaxy(Base):
     nucleus = Column(Boolean)  # 1 if galaxy has nucleus
     previous_id = Column(String, ForeignKey('galaxies.id'), nullable=True)
     next_id = Column(String, ForeignKey('galaxies.id'), nullable=True)
+    position = Column(Integer, index=True)  # Rank in the previous_id/next_id chain
+    vote_count = Column(Integer, nullable=False, default=0, server_default='0')  # Number of classifications
     
     # Fixed relationship setup for circular self-referencing
     previous = relationship(
@@ -309,10 +340,77 @@ class Galaxy(Base):
         """Get galaxy by ID"""
         return session.query(cls).filter(cls.id == galaxy_id).first()
 
+    @classmethod
+    def get_record(cls, session, galaxy_id):
+        """
+        Get the catalog data of a galaxy by ID, for reading only.
+        Served as a GalaxyRecord from the memory-mapped catalog snapshot when
+        one was built (utils/build_catalog.py), as a Galaxy from the database otherwise.
+        """
+        from services.catalog import get_catalog
+        catalog = get_catalog()
+        if catalog is not None:
+            record = catalog.get(galaxy_id)
+            if record is not None:
+                return record
+        return cls.get_by_id(session, galaxy_id)
+
+    @classmethod
+    def rebuild_positions(cls, session):
+        """Recompute the position column from the previous_id/next_id chain (set-based)"""
+        session.execute(text("DROP TABLE IF EXISTS galaxy_chain"))
+        session.execute(text("""
+            CREATE TEMPORARY TABLE galaxy_chain AS
+            WITH RECURSIVE chain(id, depth, head) AS (
+                SELECT id, 0, id FROM galaxies WHERE previous_id IS NULL
+                UNION ALL
+                SELECT g.id, chain.depth + 1, chain.head
+                FROM galaxies g JOIN chain ON g.previous_id = chain.id
+                WHERE chain.depth < (SELECT COUNT(*) FROM galaxies)
+            )
+            SELECT id, ROW_NUMBER() OVER (ORDER BY head, depth) - 1 AS position FROM chain
+        """))
+        session.execute(text("CREATE INDEX galaxy_chain_id ON galaxy_chain (id)"))
+        session.execute(text("""
+            UPDATE galaxies SET position = (
+                SELECT galaxy_chain.position FROM galaxy_chain WHERE galaxy_chain.id = galaxies.id
+            )
+        """))
+        session.execute(text("DROP TABLE galaxy_chain"))
+
+    @classmethod
+    def add_vote(cls, session, galaxy_id, delta=1):
+        """Adjust the vote count of a galaxy in place (no read-modify-write race)"""
+        session.query(cls).filter(cls.id == galaxy_id).update(
+            {cls.vote_count: cls.vote_count + delta}, synchronize_session=False
+        )
+
+    @classmethod
+    def recount_votes(cls, session):
+        """Recompute vote_count from the classifications (set-based), e.g. after a bulk import"""
+        session.execute(text("""
+            UPDATE galaxies SET vote_count = (
+                SELECT COUNT(*) FROM classifications WHERE classifications.galaxy_id = galaxies.id
+            )
+        """))
+
+    def to_record(self):
+        """Detached copy of the galaxy"""
+        return GalaxyRecord(
+            id=self.id, ra=self.ra, dec=self.dec, x=self.x, y=self.y,
+            redshift_x=self.redshift_x, redshift_y=self.redshift_y,
+            r_r=self.r_r, q=self.q, pa=self.pa, nucleus=self.nucleus, position=self.position,
+        )
+
 
 class SkippedGalaxy(Base):
     # list of galaxies that are skiped for the suer
     __tablename__ = 'skipped_galaxies'
+    __table_args__ = (
+        Index('ix_skipped_galaxies_user_galaxy', 'user_id', 'galaxy_id'),
+        # Skipped page: newest first, keyset on (date_skipped, id)
+        Index('ix_skipped_galaxies_user_date', 'user_id', 'date_skipped', 'id'),
+    )
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
     galaxy_id = Column(String, ForeignKey('galaxies.id'), nullable=False)
@@ -340,6 +438,34 @@ class SkippedGalaxy(Base):
         """Get all skipped galaxies for a user"""
         return session.query(cls).filter(cls.user_id == user_id).all()
     
+    @classmethod
+    def get_skipped_page(cls, session, user_id, before=None, limit=50):
+        """
+        One page of the user's skipped galaxies, most recently skipped first.
+        Args:
+            before: (date_skipped, id) of the last row of the previous page, or None for the first page
+            limit: Page size
+        Returns: (skipped entries with their galaxy loaded, cursor of the next page or None)
+        """
+        query = (
+            session.query(cls)
+            .options(joinedload(cls.galaxy))
+            .filter(cls.user_id == user_id)
+        )
+        if before is not None:
+            before_date, before_id = before
+            query = query.filter(or_(
+                cls.date_skipped < before_date,
+                and_(cls.date_skipped == before_date, cls.id < before_id),
+            ))
+
+        rows = query.order_by(cls.date_skipped.desc(), cls.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].date_skipped, rows[-1].id)
+        return rows, next_cursor
+
     @classmethod
     def get_skipped_count(cls, session, user_id):
         """Get count of skipped galaxies for a user"""
@@ -384,6 +510,11 @@ class SkippedGalaxy(Base):
 
 class Classification(Base):
     __tablename__ = 'classifications'
+    __table_args__ = (
+        Index('ix_classifications_user_galaxy', 'user_id', 'galaxy_id'),
+        # History pages: newest first, keyset on (date_classified, id)
+        Index('ix_classifications_user_date', 'user_id', 'date_classified', 'id'),
+    )
     
     id = Column(Integer, primary_key=True)
     user_id = Column(Integer, ForeignKey('users.id'), nullable=False)
@@ -415,6 +546,7 @@ class Classification(Base):
             sky_bkg = 'masked' # Or determine based on logic
         )
         session.add(new_classification)
+        Galaxy.add_vote(session, galaxy_id)
     
     @classmethod
     def update(cls, session, classification_id, lsb_class, morphology, comments, awesome_flag, valid_redshift):
@@ -462,6 +594,7 @@ class Classification(Base):
             )
             session.add(new_classification)
             session.flush()  # To get the ID without committing
+            Galaxy.add_vote(session, galaxy_id)
             return new_classification
 
     @classmethod
@@ -503,9 +636,46 @@ class Classification(Base):
                 )
                 session.add(new_classification)
                 session.flush()  # To get the ID without committing
+                Galaxy.add_vote(session, galaxy_id)
                 return new_classification
             return None
 
+    @classmethod
+    def get_history_page(cls, session, user_id, before=None, limit=50, lsb_class=None, morphology=None, awesome_flag=None):
+        """
+        One page of the user's classifications, newest first.
+        Keyset pagination: the cost of a page does not depend on how deep it is.
+        Args:
+            before: (date_classified, id) of the last row of the previous page, or None for the first page
+            limit: Page size
+            lsb_class, morphology, awesome_flag: Optional filters
+        Returns: (classifications with their galaxy loaded, cursor of the next page or None)
+        """
+        query = (
+            session.query(cls)
+            .options(joinedload(cls.galaxy))
+            .filter(cls.user_id == user_id)
+        )
+        if lsb_class is not None:
+            query = query.filter(cls.lsb_class == lsb_class)
+        if morphology is not None:
+            query = query.filter(cls.morphology == morphology)
+        if awesome_flag is not None:
+            query = query.filter(cls.awesome_flag == awesome_flag)
+        if before is not None:
+            before_date, before_id = before
+            query = query.filter(or_(
+                cls.date_classified < before_date,
+                and_(cls.date_classified == before_date, cls.id < before_id),
+            ))
+
+        rows = query.order_by(cls.date_classified.desc(), cls.id.desc()).limit(limit + 1).all()
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = (rows[-1].date_classified, rows[-1].id)
+        return rows, next_cursor
+
     @classmethod
     def get_progress(cls, session, user_id):
         """Get classification progress for a user"""
@@ -555,5 +725,122 @@ class Classification(Base):
         return stats
 
 
+class GalaxyAssignment(Base):
+    # Short leases of campaign galaxies, at most one user per galaxy at a time
+    __tablename__ = 'galaxy_assignments'
+
+    galaxy_id = Column(String, ForeignKey('galaxies.id'), primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class SubmissionKey(Base):
+    # Idempotency keys of applied batch submissions, so a retried batch is not applied twice.
+    # Keys are generated by the browser, so they are only unique per user
+    __tablename__ = 'submission_keys'
+
+    user_id = Column(Integer, ForeignKey('users.id'), primary_key=True)
+    key = Column(String, primary_key=True)
+    date_applied = Column(DateTime, default=datetime.now)
+
+    @classmethod
+    def get_applied(cls, session, user_id, keys):
+        """Subset of keys already applied for the user"""
+        if not keys:
+            return set()
+        rows = session.query(cls.key).filter(cls.user_id == user_id, cls.key.in_(keys))
+        return {row.key for row in rows}
 
 
+class CatalogState(Base):
+    # Catalog-wide counters, a single row
+    __tablename__ = 'catalog_state'
+
+    id = Column(Integer, primary_key=True)
+    chain_version = Column(Integer, nullable=False, default=0, server_default='0')
+
+    @classmethod
+    def get_chain_version(cls, session):
+        """Version of the previous_id/next_id chain, 0 before it was first changed"""
+        version = session.query(cls.chain_version).filter(cls.id == 1).scalar()
+        return version or 0
+
+    @classmethod
+    def bump_chain_version(cls, session):
+        """Invalidate the cached navigation contexts of all users in every worker (not committed)"""
+        updated = session.query(cls).filter(cls.id == 1).update(
+            {cls.chain_version: cls.chain_version + 1}, synchronize_session=False
+        )
+        if not updated:
+            session.add(cls(id=1, chain_version=1))
+
+
+class SourceFile(Base):
+    # Source data available under DATA_BASE_DIR (utils/index_sources.py)
+    __tablename__ = 'source_files'
+    __table_args__ = (
+        Index('ix_source_files_galaxy_kind', 'galaxy_id', 'kind'),
+    )
+
+    id = Column(Integer, primary_key=True)
+    galaxy_id = Column(String, nullable=False)
+    kind = Column(String, nullable=False)  # Key of get_source_paths(): imgblock, mask, aplpy, ...
+    component = Column(String)  # single/double for imgblocks, None otherwise
+    path = Column(String, nullable=False, unique=True)  # Relative to DATA_BASE_DIR
+    size = Column(Integer, nullable=False)
+    mtime = Column(Float, nullable=False)
+
+
+class SourceDirectory(Base):
+    # Directories indexed into source_files; unchanged mtime means nothing to rescan
+    __tablename__ = 'source_directories'
+
+    path = Column(String, primary_key=True)  # Relative to DATA_BASE_DIR
+    mtime = Column(Float, nullable=False)
+    file_count = Column(Integer, nullable=False, default=0)
+    date_scanned = Column(DateTime, default=datetime.now)
+
+
+def upgrade_schema(engine):
+    """
+    Create missing tables, columns and indexes of an existing database.
+    create_all() only creates whole tables, columns added later are handled here.
+    """
+    Base.metadata.create_all(engine)
+
+    inspector = inspect(engine)
+    galaxy_columns = {c['name'] for c in inspector.get_columns('galaxies')}
+    user_columns = {c['name'] for c in inspector.get_columns('users')}
+    submission_key_pk = inspector.get_pk_constraint('submission_keys')['constrained_columns']
+    with engine.begin() as connection:
+        if submission_key_pk == ['key']:
+            # Primary key was the key alone: copy the table aside and create it with (user_id, key)
+            connection.execute(text("CREATE TABLE submission_keys_old AS SELECT * FROM submission_keys"))
+            connection.execute(text("DROP TABLE submission_keys"))
+            SubmissionKey.__table__.create(connection)
+            connection.execute(text("""
+                INSERT INTO submission_keys (user_id, key, date_applied)
+                SELECT user_id, key, date_applied FROM submission_keys_old
+            """))
+            connection.execute(text("DROP TABLE submission_keys_old"))
+        if 'state_version' not in user_columns:
+            connection.execute(text("ALTER TABLE users ADD COLUMN state_version INTEGER NOT NULL DEFAULT 0"))
+        if 'position' not in galaxy_columns:
+            connection.execute(text("ALTER TABLE galaxies ADD COLUMN position INTEGER"))
+        if 'vote_count' not in galaxy_columns:
+            connection.execute(text("ALTER TABLE galaxies ADD COLUMN vote_count INTEGER NOT NULL DEFAULT 0"))
+            connection.execute(text("""
+                UPDATE galaxies SET vote_count = (
+                    SELECT COUNT(*) FROM classifications WHERE classifications.galaxy_id = galaxies.id
+                )
+            """))
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(connection, checkfirst=True)
+
+    from sqlalchemy.orm import Session
+    with Session(engine) as session:
+        missing = session.query(Galaxy.id).filter(Galaxy.position.is_(None)).first()
+        if missing:
+            Galaxy.rebuild_positions(session)
+            session.commit()
@@ -0,0 +1,31 @@
+# services/atomic_files.py
+#
+# Files in the output directories are written under a temporary name next to
+# their final path and moved into place with os.replace(), so readers never
+# see a partial file. The temporary name must be unique per writer, not just
+# per process: the threads of a threaded Flask worker or of the executor in
+# asgi.py may write the same file at the same time.
+
+import os
+import tempfile
+
+
+def make_tmp_path(path, suffix='.tmp'):
+    """
+    Create a new, empty and uniquely named file next to path.
+    Returns: Its path; write it and os.replace() it over path
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or '.', prefix=f"{os.path.basename(path)}.", suffix=suffix,
+    )
+    os.close(fd)
+    # mkstemp creates the file private to the owner, the output is served by the web server
+    os.chmod(tmp_path, 0o644)
+    return tmp_path
+
+
+def make_tmp_link_path(path):
+    """Unique unused name next to path for os.link()/os.symlink(), to be os.replace()d over path"""
+    tmp_path = make_tmp_path(path)
+    os.remove(tmp_path)
+    return tmp_path
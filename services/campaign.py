@@ -0,0 +1,89 @@
+# services/campaign.py
+#
+# Assignment scheduler for classification campaigns with several classifiers.
+# Every galaxy should end up with CAMPAIGN_TARGET_VOTES independent
+# classifications: galaxies with the fewest votes are handed out first, and a
+# short lease (one row per galaxy in galaxy_assignments) keeps two users from
+# being served the same galaxy at once.
+#
+# Picking a candidate walks ix_galaxies_vote_count_position from the lowest
+# vote count and stops at the first few free galaxies, so a request never
+# scans the whole table.
+
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import select, exists
+from sqlalchemy.exc import IntegrityError
+
+from models.galaxy import Galaxy, Classification, SkippedGalaxy, GalaxyAssignment
+
+# Candidates fetched per attempt; picking one at random spreads concurrent
+# users over several galaxies instead of all racing for the first one
+CANDIDATE_POOL = 8
+MAX_CLAIM_ATTEMPTS = 5
+
+
+def _candidates(session, user_id, target_votes, now):
+    """IDs of the next free galaxies for a user, all with the lowest vote count available"""
+    query = (
+        select(Galaxy.id, Galaxy.vote_count)
+        .where(Galaxy.vote_count < target_votes)
+        .where(~exists().where(Classification.galaxy_id == Galaxy.id, Classification.user_id == user_id))
+        .where(~exists().where(SkippedGalaxy.galaxy_id == Galaxy.id, SkippedGalaxy.user_id == user_id))
+        .where(~exists().where(GalaxyAssignment.galaxy_id == Galaxy.id, GalaxyAssignment.expires_at > now))
+        .order_by(Galaxy.vote_count, Galaxy.position)
+        .limit(CANDIDATE_POOL)
+    )
+    rows = session.execute(query).all()
+    return [row.id for row in rows if row.vote_count == rows[0].vote_count]
+
+
+def assign_galaxy(session, user_id, target_votes, lease_seconds):
+    """
+    Lease the next campaign galaxy to a user.
+    A user holding an unexpired lease keeps it (the lease is renewed).
+    Args:
+        session: SQLAlchemy session
+        user_id: ID of the user
+        target_votes: Number of classifications each galaxy should receive
+        lease_seconds: Lease duration
+    Returns: Galaxy ID, or None when the campaign has nothing left for the user
+    """
+    now = datetime.now()
+    expires_at = now + timedelta(seconds=lease_seconds)
+
+    current = session.query(GalaxyAssignment).filter(
+        GalaxyAssignment.user_id == user_id, GalaxyAssignment.expires_at > now
+    ).first()
+    if current:
+        current.expires_at = expires_at
+        session.commit()
+        return current.galaxy_id
+
+    for _ in range(MAX_CLAIM_ATTEMPTS):
+        candidates = _candidates(session, user_id, target_votes, now)
+        if not candidates:
+            return None
+        galaxy_id = random.choice(candidates)
+
+        # An expired lease of someone else may still occupy the row
+        session.query(GalaxyAssignment).filter(
+            GalaxyAssignment.galaxy_id == galaxy_id, GalaxyAssignment.expires_at <= now
+        ).delete(synchronize_session=False)
+        session.add(GalaxyAssignment(galaxy_id=galaxy_id, user_id=user_id, expires_at=expires_at))
+        try:
+            session.commit()
+            return galaxy_id
+        except IntegrityError:
+            # Another user claimed it in the meantime
+            session.rollback()
+    return None
+
+
+def release_assignment(session, user_id, galaxy_id):
+    """Drop the user's lease on a galaxy after it was classified or skipped (not committed)"""
+    session.query(GalaxyAssignment).filter(
+        GalaxyAssignment.user_id == user_id, GalaxyAssignment.galaxy_id == galaxy_id
+    ).delete(synchronize_session=False)
+
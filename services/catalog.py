@@ -0,0 +1,202 @@
+# services/catalog.py
+#
+# Read-only snapshot of the galaxy catalog for the web workers.
+# The catalog never changes after ingest, so it is written once into a
+# columnar NumPy file which every worker memory-maps read-only; the pages are
+# shared through the OS page cache by all gunicorn processes. Rebuilding it
+# replaces the manifest, which the workers notice on their next access.
+#
+# Layout of CATALOG_SNAPSHOT_DIR:
+#   catalog.json             manifest naming the current pair of files
+#   galaxies-<version>.npy   structured array, one row per galaxy
+#   id_index-<version>.npy   uint64 array of shape (2, N): id hashes (sorted)
+#                            and the matching rows, both contiguous
+
+import os
+import json
+import time
+import hashlib
+import threading
+
+import numpy as np
+
+from models.galaxy import GalaxyRecord
+
+MANIFEST_FILENAME = 'catalog.json'
+
+
+def catalog_dtype(id_length):
+    return np.dtype([
+        ('id', f'S{id_length}'),
+        ('ra', '<f8'),
+        ('dec', '<f8'),
+        ('x', '<f8'),
+        ('y', '<f8'),
+        ('redshift_x', '<f8'),
+        ('redshift_y', '<f8'),
+        ('r_r', '<f8'),
+        ('q', '<f8'),
+        ('pa', '<f8'),
+        ('nucleus', '?'),
+        ('position', '<i4'),
+    ])
+
+
+def id_hash(galaxy_id):
+    """Stable 64-bit hash of a galaxy ID"""
+    digest = hashlib.blake2b(galaxy_id.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little')
+
+
+def _nan_if_none(value):
+    return np.nan if value is None else value
+
+
+def write_catalog_snapshot(galaxies, snapshot_dir):
+    """
+    Write a catalog snapshot.
+    Args:
+        galaxies: Iterable of Galaxy rows (or GalaxyRecords)
+        snapshot_dir: Output directory (CATALOG_SNAPSHOT_DIR)
+    Returns: Number of galaxies written
+    """
+    galaxies = list(galaxies)
+    id_length = max([len(g.id.encode('utf-8')) for g in galaxies] + [1])
+    table = np.zeros(len(galaxies), dtype=catalog_dtype(id_length))
+    for row, g in enumerate(galaxies):
+        table[row] = (
+            g.id.encode('utf-8'), g.ra, g.dec, _nan_if_none(g.x), _nan_if_none(g.y),
+            _nan_if_none(g.redshift_x), _nan_if_none(g.redshift_y),
+            _nan_if_none(g.r_r), _nan_if_none(g.q), _nan_if_none(g.pa),
+            bool(g.nucleus), -1 if g.position is None else g.position,
+        )
+
+    hashes = np.array([id_hash(g.id) for g in galaxies], dtype='<u8')
+    order = np.argsort(hashes, kind='stable')
+    index = np.stack([hashes[order], order.astype('<u8')])
+
+    os.makedirs(snapshot_dir, exist_ok=True)
+    version = f"{int(time.time())}-{os.getpid()}"
+    galaxies_file = f"galaxies-{version}.npy"
+    index_file = f"id_index-{version}.npy"
+    np.save(os.path.join(snapshot_dir, galaxies_file), table)
+    np.save(os.path.join(snapshot_dir, index_file), index)
+
+    # Switch readers over atomically, then drop older versions
+    manifest_path = os.path.join(snapshot_dir, MANIFEST_FILENAME)
+    with open(f"{manifest_path}.tmp", 'w') as f:
+        json.dump({'galaxies': galaxies_file, 'index': index_file, 'count': len(galaxies)}, f)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    for name in os.listdir(snapshot_dir):
+        if name.endswith('.npy') and name not in (galaxies_file, index_file):
+            os.remove(os.path.join(snapshot_dir, name))
+    return len(galaxies)
+
+
+class CatalogSnapshot:
+    """Memory-mapped, read-only view of a catalog snapshot"""
+
+    def __init__(self, snapshot_dir):
+        with open(os.path.join(snapshot_dir, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+        self.galaxies = np.load(os.path.join(snapshot_dir, manifest['galaxies']), mmap_mode='r')
+        self.index = np.load(os.path.join(snapshot_dir, manifest['index']), mmap_mode='r')
+        # Contiguous row views, searchsorted works on them without copying
+        self.index_hashes = self.index[0]
+        self.index_rows = self.index[1]
+
+    def __len__(self):
+        return len(self.galaxies)
+
+    def find_row(self, galaxy_id):
+        """Row number of a galaxy, or None"""
+        key = np.uint64(id_hash(galaxy_id))
+        start = int(np.searchsorted(self.index_hashes, key, side='left'))
+        encoded = galaxy_id.encode('utf-8')
+        # Walk the (practically always single entry) run of equal hashes
+        for i in range(start, len(self.index_hashes)):
+            if self.index_hashes[i] != key:
+                break
+            row = int(self.index_rows[i])
+            if self.galaxies['id'][row] == encoded:
+                return row
+        return None
+
+    def record(self, row):
+        """GalaxyRecord of a row"""
+        r = self.galaxies[row]
+
+        def value(name):
+            v = float(r[name])
+            return None if np.isnan(v) else v
+
+        return GalaxyRecord(
+            id=r['id'].decode('utf-8'),
+            ra=float(r['ra']), dec=float(r['dec']),
+            x=value('x'), y=value('y'),
+            redshift_x=value('redshift_x'), redshift_y=value('redshift_y'),
+            r_r=value('r_r'), q=value('q'), pa=value('pa'),
+            nucleus=bool(r['nucleus']),
+            position=int(r['position']) if r['position'] >= 0 else None,
+        )
+
+    def get(self, galaxy_id):
+        """GalaxyRecord of a galaxy, or None"""
+        row = self.find_row(galaxy_id)
+        return None if row is None else self.record(row)
+
+    def has_redshift_mask(self):
+        """Boolean array, True where the galaxy has both redshift marker coordinates"""
+        return ~np.isnan(self.galaxies['redshift_x']) & ~np.isnan(self.galaxies['redshift_y'])
+
+    def filter_redshift(self, rows, with_redshift):
+        """Subset of rows with (True) or without (False) redshift markers"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if with_redshift is None:
+            return rows
+        has_redshift = (~np.isnan(self.galaxies['redshift_x'][rows])
+                        & ~np.isnan(self.galaxies['redshift_y'][rows]))
+        return rows[has_redshift if with_redshift else ~has_redshift]
+
+
+_snapshot = None
+_snapshot_signature = False  # Manifest the snapshot was loaded from; False before the first load
+_snapshot_lock = threading.Lock()
+
+
+def _manifest_signature(snapshot_dir):
+    """Changes whenever the manifest is replaced, None if there is none"""
+    try:
+        st = os.stat(os.path.join(snapshot_dir, MANIFEST_FILENAME))
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def get_catalog(snapshot_dir=None):
+    """
+    Return the process wide CatalogSnapshot, or None if no snapshot was built.
+    Loaded lazily on first use (after gunicorn forks), and again when the
+    manifest changed since (utils/build_catalog.py was run again).
+    """
+    global _snapshot, _snapshot_signature
+    if snapshot_dir is None:
+        import config
+        snapshot_dir = config.CATALOG_SNAPSHOT_DIR
+    signature = _manifest_signature(snapshot_dir)
+    if signature == _snapshot_signature:
+        return _snapshot
+    with _snapshot_lock:
+        if signature != _snapshot_signature:
+            if signature is None:
+                _snapshot = None
+                _snapshot_signature = None
+            else:
+                try:
+                    _snapshot = CatalogSnapshot(snapshot_dir)
+                    _snapshot_signature = signature
+                except (OSError, ValueError, KeyError):
+                    # Caught between the manifest and the data files of a rebuild:
+                    # keep the previous snapshot and try again on the next access
+                    pass
+    return _snapshot
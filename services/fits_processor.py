@@ -1,21 +1,49 @@
 # services/fits_processor.py
 
 import os
+import io
+import stat
+import json
 import numpy as np
-from astropy.io import fits
-from astropy.visualization import ZScaleInterval, AsinhStretch
-import matplotlib
-matplotlib.use('Agg')  # Set the backend to non-interactive
-import matplotlib.pyplot as plt
-from matplotlib.patches import Ellipse
-from PIL import Image
 import shutil
 import re
+from collections import Counter
+from functools import cached_property
+
+from services.source_cache import get_negative_cache
+from services.render_deps import (
+    render_settings_key, read_dependencies, record_dependencies, check_dependencies, locked_dependencies,
+    get_check_cache, DEPS_FILENAME
+)
+from services.image_store import get_image_store
+from services.atomic_files import make_tmp_path, make_tmp_link_path
+
+# astropy, matplotlib and PIL are imported inside the render functions:
+# processes that only resolve paths or serve cached images never load them
 
 # Constants
 ONE_JANSKY_ARCSEC_KIDS = 10 ** (0.4 * 23.9) / (0.2 ** 2)
 OUTPUT_DPI = 100
 Y_AXIS_RATIO = 0.9  # Same as original code
+THUMBNAIL_WIDTH = 128  # List pages (skipped galaxies)
+MEDIUM_WIDTH = 320  # Panels on small screens
+PANEL_WIDTH = 600  # Full size panels: 6 inch figures at OUTPUT_DPI (the tight crop may be a bit narrower)
+# Downscaled copies written next to every rendered panel, <variant>_w<width>.png (srcset)
+SCALED_WIDTHS = (THUMBNAIL_WIDTH, MEDIUM_WIDTH)
+DEFAULT_COLORS = ['viridis', 'red', 'black']  # [cmap, ellipse_color, redshift_marker]
+
+# Panels rendered from the imgblock, and pre-made colour images that never change with the contrast
+FITS_IMAGE_NAMES = ("masked_r_band", "galfit_model", "residual", "raw_r_band")
+COLOR_IMAGE_NAMES = ("aplpy", "lupton")
+
+# Per-process render metrics: panels drawn, panels skipped because they were
+# up to date or not requested (a full re-render would have drawn them),
+# imgblocks opened, figures laid out (one per panel, saved once per contrast)
+# and panel data files encoded for the browser (services/panel_data.py)
+render_counters = Counter(panels_rendered=0, panels_avoided=0, fits_loads=0, figures=0, panel_data_encoded=0)
+
+class SourceUnavailable(Exception):
+    """A source file is known to be missing or unreadable (see services/source_cache.py)"""
 
 def ensure_dir(path):
     """Make sure directory exists"""
@@ -43,6 +71,35 @@ def get_image_filename(base_name, vmax_percentile, vmax_percentile_raw):
     else:
         return f"{base_name}.png"
     
+def get_tiles_dir(galaxy_dir, vmax_percentile_raw):
+    """
+    Directory holding the deep-zoom tile pyramid of the raw r-band panel.
+    Args:
+        galaxy_dir: Output directory of the galaxy
+        vmax_percentile_raw: Percentile for raw image
+    Returns: Path like <galaxy_dir>/tiles/raw_r_band_vmax99p7
+    """
+    variant = os.path.splitext(get_image_filename('raw_r_band', None, vmax_percentile_raw))[0]
+    return os.path.join(galaxy_dir, 'tiles', variant)
+
+def get_scaled_filename(filename, width):
+    """Filename of a downscaled copy, e.g. residual_vmax99p0_w128.png for residual_vmax99p0.png"""
+    return f"{os.path.splitext(filename)[0]}_w{width}.png"
+
+def get_scaled_filenames(filename, widths=SCALED_WIDTHS):
+    """Filenames of all downscaled copies of a rendered panel"""
+    return [get_scaled_filename(filename, width) for width in widths]
+
+def split_scaled_filename(filename):
+    """
+    Inverse of get_scaled_filename().
+    Returns: (filename of the full size image, width), width is None for a full size image
+    """
+    m = re.match(r'^(.*)_w([0-9]+)\.png$', filename)
+    if m:
+        return f"{m.group(1)}.png", int(m.group(2))
+    return filename, None
+
 def get_expected_vmax_percentile(base_name, default_vmax_percentile=99.0, default_vmax_percentile_raw=99.7):
     """
     Get the expected vmax percentile based on the base name.
@@ -91,7 +148,7 @@ def parse_image_filename(filename, default_vmax_percentile=99.0, default_vmax_pe
         return base_name, default_vmax_percentile, default_vmax_percentile_raw
 
     
-def get_galaxy_images(galaxy_id, data_dirs=None, colors=None, add_titles=False, vmax_percentile=99.0, vmax_percentile_raw=99.7, session=None, galaxy_data=None):
+def get_galaxy_images(galaxy_id, data_dirs=None, colors=None, add_titles=False, vmax_percentile=99.0, vmax_percentile_raw=99.7, session=None, galaxy_data=None, generate_tiles=False, presets=None, render=True):
     """
     Get paths to processed images for a galaxy.
     If images don't exist, generate them.
@@ -105,8 +162,12 @@ def get_galaxy_images(galaxy_id, data_dirs=None, colors=None, add_titles=False,
         vmax_percentile_raw: Percentile for raw image
         session: SQLAlchemy session for database access
         galaxy_data: Dictionary with galaxy parameters (if available)
+        generate_tiles: Also write the deep-zoom tile pyramid of the raw r-band panel
+        presets: Also render these (vmax_percentile, vmax_percentile_raw) pairs in the same pass
+        render: False only lists the images, nothing is rendered or copied; each one
+                is then made when it is requested (serve_galaxy_image in app.py)
     
-    Returns: List of dictionaries with image info
+    Returns: List of dictionaries with image info, for vmax_percentile and vmax_percentile_raw
     """
     if data_dirs is None:
         from flask import current_app
@@ -114,73 +175,258 @@ def get_galaxy_images(galaxy_id, data_dirs=None, colors=None, add_titles=False,
             'output_dir': current_app.config['GALAXY_IMAGES_FOLDER'],
             'base_dir': current_app.config['DATA_BASE_DIR'],
         }
-    
-    if colors is None:
-        colors = ['viridis', 'red', 'black']  # Default colors
-    
-    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
-
-    ensure_dir(galaxy_dir)
 
-    # List of base image names in order
-    base_image_names = [
-        "masked_r_band",
-        "galfit_model",
-        "residual",
-        "raw_r_band",
-        "aplpy",
-        "lupton"
-    ]
-
-    expected_images = {
-        name: get_image_filename(name, vmax_percentile, vmax_percentile_raw)
-        for name in base_image_names
-    }
-
-    all_exist = all(os.path.exists(os.path.join(galaxy_dir, img)) for img in expected_images.values())
-    
-    generate_results = None
-
-    if not all_exist:
-        # Get galaxy data
-        if galaxy_data is None:
-            galaxy_data = get_galaxy_data(
-                galaxy_id=galaxy_id,
-                session=session
-                )
-        
-        # Generate images
-        generate_results = generate_galaxy_images(
-            galaxy_id=galaxy_id,
-            output_dir=galaxy_dir,
-            galaxy=galaxy_data,
+    generate_results = {}
+    if render:
+        generate_results = ensure_galaxy_panels(
+            galaxy_id,
             data_dirs=data_dirs,
             colors=colors,
             add_titles=add_titles,
             vmax_percentile=vmax_percentile,
-            vmax_percentile_raw=vmax_percentile_raw
+            vmax_percentile_raw=vmax_percentile_raw,
+            session=session,
+            galaxy_data=galaxy_data,
+            generate_tiles=generate_tiles,
+            presets=[(vmax_percentile, vmax_percentile_raw)] + list(presets or []),
         )
+    color_images = get_color_images(galaxy_id, data_dirs, install=render)
     
     # Return paths and titles
-    titles = {
-        "masked_r_band": 'Masked r-Band', 
-        "galfit_model": 'GalfitModel', 
-        "residual": 'Residual', 
-        "raw_r_band": 'Raw r-band', 
-        "aplpy": 'APLpy', 
-        "lupton": 'Zoomed out'
-    }
+    titles = dict(PANEL_TITLES, aplpy='APLpy', lupton='Zoomed out')
+    filenames = {name: get_image_filename(name, vmax_percentile, vmax_percentile_raw) for name in FITS_IMAGE_NAMES}
     
     return [
         {
-            'path': f'galaxy_images/{galaxy_id}/{image_filename}', 
+            'path': f'galaxy_images/{galaxy_id}/{filenames[image_base]}', 
+            # (path, width) candidates for srcset, smallest first
+            'srcset': [
+                (f'galaxy_images/{galaxy_id}/{get_scaled_filename(filenames[image_base], width)}', width)
+                for width in SCALED_WIDTHS
+            ] + [(f'galaxy_images/{galaxy_id}/{filenames[image_base]}', PANEL_WIDTH)],
             'title': titles[image_base], 
             'base_name': image_base,
-            'success': generate_results[image_base]['success'] if generate_results else True,
-            'vmax': generate_results[image_base]['vmax'] if generate_results else get_expected_vmax_percentile(image_base, vmax_percentile, vmax_percentile_raw),
+            'success': generate_results[filenames[image_base]]['success'] if filenames[image_base] in generate_results else True,
+            'vmax': generate_results[filenames[image_base]]['vmax'] if filenames[image_base] in generate_results else get_expected_vmax_percentile(image_base, vmax_percentile, vmax_percentile_raw),
+            'flip': False,
+        }
+        for image_base in FITS_IMAGE_NAMES
+    ] + [
+        {
+            'path': color_images[image_base]['path'],
+            'srcset': [],  # Pre-made at their own size
+            'title': titles[image_base],
+            'base_name': image_base,
+            'success': True,
+            'vmax': None,
+            'flip': color_images[image_base]['flip'],
         }
-        for image_base, image_filename in expected_images.items()
+        for image_base in COLOR_IMAGE_NAMES
+    ]
+
+def panel_variants(panels, presets):
+    """
+    Files of the given panels at each contrast preset.
+    Presets sharing a raw percentile share the raw r-band file.
+    Returns: {filename: (base_name, vmax_percentile, vmax_percentile_raw)}
+    """
+    variants = {}
+    for vmax_percentile, vmax_percentile_raw in presets:
+        for name in panels:
+            filename = get_image_filename(name, vmax_percentile, vmax_percentile_raw)
+            variants.setdefault(filename, (name, vmax_percentile, vmax_percentile_raw))
+    return variants
+
+def get_contrast_presets(base_name, vmax_percentile, vmax_percentile_raw, presets):
+    """
+    Contrasts to render along with a requested panel variant: all presets if
+    the variant is one of them (the contrast button steps through the others
+    next), None for any other contrast
+    """
+    filename = get_image_filename(base_name, vmax_percentile, vmax_percentile_raw)
+    return presets if filename in panel_variants([base_name], presets) else None
+
+def ensure_galaxy_panels(galaxy_id, data_dirs, panels=FITS_IMAGE_NAMES, colors=None, add_titles=False, vmax_percentile=99.0, vmax_percentile_raw=99.7, session=None, galaxy_data=None, generate_tiles=False, presets=None):
+    """
+    Render those of the given FITS panels that are missing or stale; the
+    others, and panels not asked for, are left alone.
+    
+    Args:
+        galaxy_id: ID of the galaxy
+        data_dirs: Dictionary with paths to data directories
+        panels: Base names of the panels needed, e.g. only the one an image request asks for
+        presets: (vmax_percentile, vmax_percentile_raw) pairs to render in one pass, from one
+                 imgblock load (e.g. config.CONTRAST_PRESETS); defaults to the single given pair,
+                 which also selects the tiled raw panel
+        Other arguments as in get_galaxy_images()
+    
+    Returns: {filename: dict(path, title, vmax, success)} of the panels rendered now
+    """
+    if colors is None:
+        colors = DEFAULT_COLORS
+    if presets is None:
+        presets = [(vmax_percentile, vmax_percentile_raw)]
+    
+    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
+    store = get_image_store()
+    if store is None:
+        ensure_dir(galaxy_dir)
+
+    # Only the FITS panels are rendered; the colour panels are taken from the source
+    variants = panel_variants(panels, presets)
+
+    if store is not None:
+        # One index query instead of a stat per file
+        packed = store.list(galaxy_id)
+        def exists(img):
+            return img in packed
+    else:
+        def exists(img):
+            return os.path.exists(os.path.join(galaxy_dir, img))
+    existing_images = [img for img in variants if exists(img)]
+
+    # Existing images made from sources that changed since are rendered again
+    settings_key = render_settings_key(colors, add_titles)
+    deps = read_galaxy_dependencies(galaxy_id, galaxy_dir)
+    stale, unknown = check_dependencies(deps, existing_images, settings_key)
+    to_render = {img: variant for img, variant in variants.items() if img not in existing_images or img in stale}
+
+    # Current panels without all downscaled copies (evicted, or rendered before
+    # there were any) are scaled down again; a placeholder is retried instead
+    to_scale = []
+    for img in existing_images:
+        if img in to_render or all(exists(name) for name in get_scaled_filenames(img)):
+            continue
+        if store is not None:
+            rendered = packed[img].pack is not None
+        else:
+            rendered = os.stat(os.path.join(galaxy_dir, img)).st_nlink == 1
+        if rendered:
+            to_scale.append(img)
+        else:
+            to_render[img] = variants[img]
+
+    raw_filename = get_image_filename('raw_r_band', vmax_percentile, vmax_percentile_raw)
+    render_tiles = generate_tiles and (
+        raw_filename in stale
+        or not os.path.exists(os.path.join(get_tiles_dir(galaxy_dir, vmax_percentile_raw), 'meta.json'))
+    )
+    if not to_render and not to_scale and not render_tiles and not unknown:
+        return {}
+
+    # Get galaxy data
+    if galaxy_data is None:
+        galaxy_data = get_galaxy_data(
+            galaxy_id=galaxy_id,
+            session=session
+            )
+    source_paths = get_source_paths(galaxy_id, galaxy_data['Nucleus'], data_dirs['base_dir'])
+
+    if stale:
+        # Sources are known to have changed, do not trust earlier failures
+        missing_sources = get_negative_cache()
+        for path in source_paths.values():
+            missing_sources.forget(path)
+
+    from services.source_index import resolve_source_paths
+    # The paths the render reads, None for files the source index does not list
+    used_paths = resolve_source_paths(galaxy_id, galaxy_data['Nucleus'], data_dirs['base_dir'])
+
+    # A pack store renders into a private staging directory first
+    render_dir = galaxy_dir if store is None else get_staging_dir(data_dirs['output_dir'], galaxy_id)
+    ensure_dir(render_dir)
+    generate_results = {}
+    if to_render or render_tiles:
+        generate_results = render_panels(
+            galaxy_id=galaxy_id,
+            output_dir=render_dir,
+            galaxy=galaxy_data,
+            data_dirs=data_dirs,
+            colors=colors,
+            variants=to_render,
+            add_titles=add_titles,
+            generate_tiles=render_tiles,
+            vmax_percentile_raw=vmax_percentile_raw,
+            source_paths=used_paths,
+        )
+        # Rendering all panels of every preset whenever one was missing or stale would have drawn these too
+        render_counters['panels_avoided'] += len(panel_variants(FITS_IMAGE_NAMES, presets)) - len(to_render)
+
+    for img in to_scale:
+        src = os.path.join(galaxy_dir, img) if store is None else io.BytesIO(store.read(galaxy_id, img))
+        save_scaled_variants(src, os.path.join(render_dir, img))
+
+    # Panels rendered before dependency tracking are adopted with the current sources
+    recorded = [
+        (variants[img][0], name)
+        for img in dict.fromkeys(list(to_render) + to_scale + unknown)
+        for name in [img] + get_scaled_filenames(img)
     ]
+    # Placeholders, just linked or adopted, must not count as made from the current sources
+    placeholders = [img for img, result in generate_results.items() if not result['success']]
+    for img in unknown:
+        if store is not None:
+            is_placeholder = packed[img].pack is None
+        else:
+            is_placeholder = os.stat(os.path.join(galaxy_dir, img)).st_nlink > 1
+        if is_placeholder:
+            placeholders.append(img)
+    placeholders = {name for img in placeholders for name in [img] + get_scaled_filenames(img)}
+    if store is None:
+        record_dependencies(galaxy_dir, recorded, source_paths, settings_key,
+                            used_paths=used_paths, placeholders=placeholders)
+    else:
+        if render_tiles:
+            # Tiles stay plain files in the galaxy directory
+            tiles_dir = get_tiles_dir(galaxy_dir, vmax_percentile_raw)
+            ensure_dir(os.path.dirname(tiles_dir))
+            shutil.rmtree(tiles_dir, ignore_errors=True)
+            os.replace(get_tiles_dir(render_dir, vmax_percentile_raw), tiles_dir)
+        # Files that were not written (the full panel of a rescaled one) are skipped
+        written = [name for img in list(to_render) + to_scale for name in [img] + get_scaled_filenames(img)]
+        with locked_dependencies(galaxy_dir):
+            # Re-read under the lock: another render may have packed its records since
+            record_dependencies(render_dir, recorded, source_paths, settings_key,
+                                deps=read_galaxy_dependencies(galaxy_id, galaxy_dir),
+                                used_paths=used_paths, placeholders=placeholders)
+            store.pack_directory(
+                galaxy_id, render_dir, written + [DEPS_FILENAME],
+                placeholders=get_placeholder_paths(data_dirs['output_dir']),
+            )
+        shutil.rmtree(render_dir, ignore_errors=True)
+
+    return generate_results
+
+def is_image_current(image_path, colors=None, add_titles=False):
+    """
+    False if a rendered image is older than its recorded sources or render settings.
+    Images without a dependency record count as current. Current results are
+    cached for config.RENDER_DEPS_CHECK_TTL seconds.
+    """
+    if colors is None:
+        colors = DEFAULT_COLORS
+    filename = os.path.basename(image_path)
+    galaxy_dir = os.path.dirname(image_path)
+    settings_key = render_settings_key(colors, add_titles)
+    checks = get_check_cache()
+    if checks.is_current((image_path, settings_key)):
+        return True
+    stale, _ = check_dependencies(
+        read_galaxy_dependencies(os.path.basename(galaxy_dir), galaxy_dir),
+        [filename],
+        settings_key,
+    )
+    if not stale:
+        checks.add((image_path, settings_key))
+    return not stale
+
+def read_galaxy_dependencies(galaxy_id, galaxy_dir):
+    """Dependency records of a galaxy's rendered images, from the pack store when IMAGE_STORE = 'pack'"""
+    store = get_image_store()
+    if store is None:
+        return read_dependencies(galaxy_dir)
+    data = store.read(galaxy_id, DEPS_FILENAME)
+    return json.loads(data) if data else {}
 
 def galaxy_data_to_dict(galaxy):
     return {
@@ -196,14 +442,19 @@ def galaxy_data_to_dict(galaxy):
     }
 
 def get_galaxy_data(galaxy_id, session=None):
-    """Get galaxy data from the database"""
+    """Get galaxy data from the catalog snapshot, or the database if there is none"""
+    from services.catalog import get_catalog
+    catalog = get_catalog()
+    if catalog is not None:
+        record = catalog.get(galaxy_id)
+        if record is not None:
+            return galaxy_data_to_dict(record)
+
     from models.galaxy import Galaxy
-    from flask import current_app
-    from sqlalchemy import create_engine
-    from sqlalchemy.orm import sessionmaker
+    from models.database import get_sessionmaker
+    from flask import current_app, has_app_context
 
-    engine = create_engine(current_app.config['SQLALCHEMY_DATABASE_URI'])
-    Session = sessionmaker(bind=engine)
+    Session = get_sessionmaker(current_app.config['SQLALCHEMY_DATABASE_URI'] if has_app_context() else None)
 
     def fetch(session):
         galaxy = session.query(Galaxy).filter_by(id=galaxy_id).first()
@@ -233,222 +484,510 @@ def sad_emoji():
         [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
     ])
 
-def generate_galaxy_images(galaxy_id, output_dir, galaxy, data_dirs, colors, add_titles=False, vmax_percentile=99.0, vmax_percentile_raw=99.7):
+PLACEHOLDER_TITLES = {
+    'fits': "Missing FITS data",
+    'aplpy': "APLpy color image not available",
+    'lupton': "Lupton RGB image not available",
+}
+
+def get_placeholder_paths(output_dir):
+    """Paths of all shared placeholders of an output directory (whether drawn yet or not)"""
+    return [os.path.join(output_dir, f"placeholder_{kind}.png") for kind in PLACEHOLDER_TITLES]
+
+def get_staging_dir(output_dir, galaxy_id):
+    """Private render directory of this process and thread, emptied into the pack store afterwards"""
+    import threading
+    return os.path.join(output_dir, '.staging', f"{galaxy_id}.{os.getpid()}.{threading.get_ident()}")
+
+def get_placeholder_image(output_dir, kind):
     """
-    Generate all six images for a galaxy and save them as PNG files
-    
+    Shared placeholder for panels whose source is missing, rendered once per output directory.
+    Args:
+        output_dir: Root of the rendered images (GALAXY_IMAGES_FOLDER)
+        kind: 'fits', 'aplpy' or 'lupton'
+    Returns: Path of the placeholder PNG
+    """
+    path = os.path.join(output_dir, f"placeholder_{kind}.png")
+    if not os.path.exists(path):
+        import matplotlib
+        matplotlib.use('Agg')  # Set the backend to non-interactive
+        import matplotlib.pyplot as plt
+
+        ensure_dir(output_dir)
+        fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
+        ax = fig.add_axes([0, 0, 1, 1])
+        ax.imshow(sad_emoji(), cmap='binary')
+        ax.set_title(PLACEHOLDER_TITLES[kind])
+        ax.set_yticks([])
+        ax.set_xticks([])
+        tmp_path = make_tmp_path(path, suffix='.tmp.png')
+        fig.savefig(tmp_path, bbox_inches='tight')
+        plt.close(fig)
+        os.replace(tmp_path, path)
+    return path
+
+def link_placeholder(placeholder_path, dest_path):
+    """Put a placeholder at dest_path as a hard link (a copy where links are not possible)"""
+    try:
+        if os.path.samefile(placeholder_path, dest_path):
+            return
+    except OSError:
+        pass
+    tmp_path = make_tmp_link_path(dest_path)
+    try:
+        os.link(placeholder_path, tmp_path)
+    except OSError:
+        shutil.copyfile(placeholder_path, tmp_path)
+    os.replace(tmp_path, dest_path)
+
+def unlink_placeholder(dest_path):
+    """Remove a linked placeholder before an image is written to its path; writing through the link would change the shared file"""
+    try:
+        if os.stat(dest_path).st_nlink > 1:
+            os.remove(dest_path)
+    except FileNotFoundError:
+        pass
+
+def get_source_paths(galaxy_id, nucleus, base_dir):
+    """
+    Get paths to the source data of a galaxy.
     Args:
         galaxy_id: Galaxy ID string
-        output_dir: Directory to save images to
-        galaxy: Dictionary with galaxy parameters
-        data_dirs: Dictionary with paths to data directories
-        colors: List of [cmap, ellipse_color, redshift_color]
+        nucleus: Nucleus flag of the galaxy (selects the GALFIT component type)
+        base_dir: Base directory of the galaxy data (DATA_BASE_DIR)
+    Returns: Dictionary with imgblock, unmasked_imgblock, mask, aplpy and lupton paths
     """
-    base_dir = data_dirs['base_dir']
-    
     # Determine component type based on nucleus
-    if galaxy['Nucleus'] == 1:
+    if nucleus == 1:
         component_type = 'double_component'
     else:
         component_type = 'single_component'
+
+    return {
+        'imgblock': os.path.join(base_dir, 'r_imgblocks', component_type, f"imgblock_{galaxy_id}.fits"),
+        'unmasked_imgblock': os.path.join(base_dir, 'r_imgblocks', f"{component_type}_unmasked", f"imgblock_{galaxy_id}.fits"),
+        'mask': os.path.join(base_dir, 'masks_r', f"mask{galaxy_id}.fits"),
+        **get_color_source_paths(galaxy_id, base_dir),
+    }
+
+def get_color_source_paths(galaxy_id, base_dir):
+    """Paths of the pre-made colour images of a galaxy; unlike the imgblock they do not depend on the component type"""
+    return {
+        'aplpy': os.path.join(base_dir, 'color_images/aplpy', f"{galaxy_id}.png"),
+        'lupton': os.path.join(base_dir, 'color_images/Lupton_RGB_Images', f"{galaxy_id}.png"),
+    }
+
+def _color_image_outdated(src_path, dest_path, mode):
+    """True if dest_path does not hold the colour image in the form the mode asks for"""
+    try:
+        st = os.lstat(dest_path)
+    except FileNotFoundError:
+        return True
+    if stat.S_ISLNK(st.st_mode):
+        return mode != 'link' or os.readlink(dest_path) != src_path
+    # A copy is replaced in 'link' mode, if it is the linked placeholder, or when the source is newer
+    if mode == 'link' or st.st_nlink > 1:
+        return True
+    try:
+        return st.st_mtime < os.stat(src_path).st_mtime
+    except OSError:
+        raise SourceUnavailable(src_path)
+
+def _install_color_image(base_name, src_path, dest_path, mode):
+    """
+    Put a colour image at dest_path: a symlink to the source ('link') or a copy, the APLpy one flipped once ('copy').
+    Raises SourceUnavailable if the source cannot be read, OSError if writing dest_path failed.
+    """
+    if mode == 'link':
+        tmp_path = make_tmp_link_path(dest_path)
+        os.symlink(src_path, tmp_path)
+    elif base_name == 'aplpy':
+        from PIL import Image
+        try:
+            with Image.open(src_path) as img:
+                flipped = img.transpose(Image.FLIP_TOP_BOTTOM)
+        except (OSError, ValueError):
+            raise SourceUnavailable(src_path)
+        tmp_path = make_tmp_path(dest_path)
+        with flipped:
+            flipped.save(tmp_path, format='PNG')
+    else:
+        try:
+            src = open(src_path, 'rb')
+        except OSError:
+            raise SourceUnavailable(src_path)
+        tmp_path = make_tmp_path(dest_path)
+        with src, open(tmp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+    # Replacing the directory entry never writes through a linked placeholder
+    os.replace(tmp_path, dest_path)
+
+def get_color_images(galaxy_id, data_dirs, mode=None, install=True):
+    """
+    Colour panels of a galaxy. They are not part of the FITS render and,
+    depending on COLOR_IMAGE_MODE, are
+        'copy':   copied into the galaxy directory once, the APLpy image flipped on copy
+        'link':   symlinked into the galaxy directory
+        'source': served straight from DATA_BASE_DIR (serve_color_image in app.py)
+    In 'link' and 'source' mode the APLpy image is flipped by the browser
+    ('flip', CSS class flip-vertical) instead of being re-encoded.
+    Args:
+        galaxy_id: ID of the galaxy
+        data_dirs: Dictionary with paths to data directories
+        mode: 'copy', 'link' or 'source', defaults to config.COLOR_IMAGE_MODE
+        install: False only reports the paths; the files are then installed when
+                 they are requested (serve_galaxy_image in app.py)
+    Returns: {base_name: {'path': path under static/, 'file': local file, 'flip': bool}}
+    """
+    if mode is None:
+        import config
+        mode = config.COLOR_IMAGE_MODE
+
+    missing_sources = get_negative_cache()
+    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
+    images = {}
+    for base_name, src_path in get_color_source_paths(galaxy_id, data_dirs['base_dir']).items():
+        available = missing_sources.exists(src_path)
+        if mode == 'source':
+            if available:
+                path, file_path = f"color_images/{base_name}/{galaxy_id}.png", src_path
+            else:
+                file_path = get_placeholder_image(data_dirs['output_dir'], base_name)
+                path = f"galaxy_images/{os.path.basename(file_path)}"
+        else:
+            filename = get_image_filename(base_name, None, None)
+            path, file_path = f"galaxy_images/{galaxy_id}/{filename}", os.path.join(galaxy_dir, filename)
+            if available and install:
+                try:
+                    if _color_image_outdated(src_path, file_path, mode):
+                        ensure_dir(galaxy_dir)
+                        _install_color_image(base_name, src_path, file_path, mode)
+                except SourceUnavailable as e:
+                    print(f"Error handling color image {src_path} for {galaxy_id}: {e}")
+                    missing_sources.mark_bad(src_path)
+                    available = False
+                except OSError as e:
+                    # Only writing the copy failed (e.g. a full disk); the source is fine, and
+                    # another thread or worker may have installed the image in the meantime
+                    print(f"Could not install color image {src_path} for {galaxy_id}: {e}")
+            if not available and install:
+                ensure_dir(galaxy_dir)
+                link_placeholder(get_placeholder_image(data_dirs['output_dir'], base_name), file_path)
+
+        images[base_name] = dict(
+            path=path,
+            file=file_path,
+            flip=available and mode != 'copy' and base_name == 'aplpy',
+        )
+    return images
+
+class PanelContext:
+    """
+    Decoded FITS data of one galaxy, shared by the panel renderers.
+    Everything is read and derived on first use, so rendering a single
+    panel decodes only what that panel needs, and rendering several decodes
+    the imgblock once.
+    """
+
+    def __init__(self, galaxy_id, galaxy, source_paths):
+        self.galaxy_id = galaxy_id
+        self.galaxy = galaxy
+        self.source_paths = source_paths
+        self._vmax = {}
+
+    @cached_property
+    def imgblock(self):
+        from astropy.io import fits
+        path = self.source_paths['imgblock']
+        if path is None or get_negative_cache().is_bad(path):
+            raise SourceUnavailable(path)
+        render_counters['fits_loads'] += 1
+        try:
+            return fits.open(path)
+        except (OSError, ValueError) as e:
+            self._source_failed(path, e)
+
+    def _source_failed(self, path, error):
+        """Remember an imgblock that cannot be opened or read as bad; the panels become placeholders"""
+        print(f"Error reading FITS data of {self.galaxy_id} from {path}: {error}")
+        get_negative_cache().mark_bad(path)
+        raise SourceUnavailable(path) from error
+
+    def _hdu_data(self, index):
+        """Data of an imgblock extension (read lazily by astropy, so read errors surface here)"""
+        hdul = self.imgblock
+        try:
+            return hdul[index].data
+        except (OSError, ValueError, IndexError) as e:
+            self._source_failed(self.source_paths['imgblock'], e)
+
+    @cached_property
+    def mask(self):
+        from astropy.io import fits
+        mask_path = self.source_paths['mask']
+        missing_sources = get_negative_cache()
+        try:
+            if mask_path is None or missing_sources.is_bad(mask_path):
+                raise SourceUnavailable(mask_path)
+            return fits.getdata(mask_path)
+        except Exception as e:
+            if not isinstance(e, SourceUnavailable):
+                print(f"Error loading mask file for {self.galaxy_id}: {e}")
+                missing_sources.mark_bad(mask_path)
+            return np.zeros_like(self._hdu_data(1))
+
+    @cached_property
+    def raw(self):
+        return self._hdu_data(1) * ONE_JANSKY_ARCSEC_KIDS
+
+    @cached_property
+    def masked(self):
+        return self._hdu_data(1) * np.logical_not(self.mask) * ONE_JANSKY_ARCSEC_KIDS
+
+    @cached_property
+    def model(self):
+        return self._hdu_data(2) * ONE_JANSKY_ARCSEC_KIDS
+
+    @cached_property
+    def residual(self):
+        return self._hdu_data(3) * ONE_JANSKY_ARCSEC_KIDS
+
+    def masked_vmax(self, vmax_percentile):
+        """Scaling of the masked, model and residual panels"""
+        self.prepare_vmax(vmax_percentiles=[vmax_percentile])
+        return self._vmax[('masked', vmax_percentile)]
+
+    def raw_vmax(self, vmax_percentile_raw):
+        """Scaling of the raw panel"""
+        self.prepare_vmax(vmax_percentiles_raw=[vmax_percentile_raw])
+        return self._vmax[('raw', vmax_percentile_raw)]
+
+    def prepare_vmax(self, vmax_percentiles=(), vmax_percentiles_raw=()):
+        """Scalings of several contrast presets, from one sorted copy of each array"""
+        for kind, percentiles in (('masked', vmax_percentiles), ('raw', vmax_percentiles_raw)):
+            missing = sorted({p for p in percentiles if (kind, p) not in self._vmax})
+            if not missing:
+                continue
+            data = getattr(self, kind)
+            if len(missing) > 1:
+                # Selecting from ordered data is cheap; scalar calls keep the values of a single render
+                data = np.sort(data, axis=None)
+            for p in missing:
+                self._vmax[(kind, p)] = np.percentile(data, p)
+
+    def close(self):
+        if 'imgblock' in self.__dict__:
+            self.imgblock.close()
+
+def _draw_panel(ctx, outputs, data, colors, title, add_titles=False, mask_contour=False, redshift_marker=False):
+    """
+    Plot one panel with the model ellipse and save it as PNG.
+    The figure is laid out once and saved for every contrast in outputs,
+    a list of (dest_path, vmax).
+    """
+    import matplotlib
+    matplotlib.use('Agg')  # Set the backend to non-interactive
+    import matplotlib.pyplot as plt
+    from matplotlib.patches import Ellipse
+
+    galaxy = ctx.galaxy
+    fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
+    ax = fig.add_axes([0, 0, 1, 1])
+    render_counters['figures'] += 1
     
-    # Paths to FITS files
-    imgblock_path = os.path.join(base_dir, 'r_imgblocks', component_type, f"imgblock_{galaxy_id}.fits")
-    unmasked_imgblock_path = os.path.join(base_dir, 'r_imgblocks', f"{component_type}_unmasked", f"imgblock_{galaxy_id}.fits")
-    mask_path = os.path.join(base_dir, 'masks_r', f"mask{galaxy_id}.fits")
+    # Plot image
+    image = ax.imshow(data, vmax=outputs[0][1], cmap=colors[0])
     
-    # Source paths for pre-generated color images
-    aplpy_src = os.path.join(base_dir, 'color_images/aplpy', f"{galaxy_id}.png")
-    lupton_src = os.path.join(base_dir, 'color_images/Lupton_RGB_Images', f"{galaxy_id}.png")
+    # For masked image, also show mask contour
+    if mask_contour:
+        ax.contour(ctx.mask, [0.5], colors=[colors[2]], zorder=1)
+        
+    # Add ellipse for galaxy model
+    ellipse = Ellipse(
+        (galaxy['X'], galaxy['Y']),
+        width=(galaxy['r_r'] * 2 / 0.2),
+        height=(galaxy['r_r'] * 2 / 0.2) * galaxy['q'],
+        angle=galaxy['PA'] + 90, linewidth=1.5,
+        color=colors[1], fill=False, linestyle='-', label='Modelled galaxy'
+    )
+    ax.add_patch(ellipse)
     
-    # Destination paths for all images
-    masked_band_dest = os.path.join(output_dir, get_image_filename('masked_r_band', vmax_percentile, vmax_percentile_raw))
-    galfit_model_dest = os.path.join(output_dir, get_image_filename('galfit_model', vmax_percentile, vmax_percentile_raw))
-    residual_dest = os.path.join(output_dir, get_image_filename('residual', vmax_percentile, vmax_percentile_raw))
-    raw_band_dest = os.path.join(output_dir, get_image_filename('raw_r_band', vmax_percentile, vmax_percentile_raw))
-    aplpy_dest = os.path.join(output_dir, get_image_filename('aplpy', vmax_percentile, vmax_percentile_raw))
-    lupton_dest = os.path.join(output_dir, get_image_filename('lupton', vmax_percentile, vmax_percentile_raw))
+    # Add redshift marker if available
+    if redshift_marker:
+        ax.plot(
+            [galaxy['X'], galaxy['RedshiftX']], 
+            [galaxy['Y'], galaxy['RedshiftY']], 
+            lw=2, ls='--', c=colors[2]
+        )
+        ax.scatter(
+            galaxy['RedshiftX'], 
+            galaxy['RedshiftY'], 
+            c=colors[2], marker='x', s=150
+        )
+    if add_titles:
+        ax.set_title(title)
+    ax.set_yticks([])
+    ax.set_xticks([])
+    ax.set_frame_on(False)
     
-    results = dict()
+    # Save figure; vmin stays at the data minimum imshow scaled to. The
+    # contrast does not move anything, so the tight bounding box is measured once
+    try:
+        bbox = fig.get_tightbbox(fig.canvas.get_renderer()).padded(0)
+        for dest_path, vmax in outputs:
+            image.set_clim(vmax=vmax)
+            unlink_placeholder(dest_path)
+            fig.savefig(dest_path, bbox_inches=bbox)
+    finally:
+        plt.close(fig)
+
+def render_masked_r_band(ctx, outputs, colors, add_titles=False):
+    _draw_panel(ctx, [(path, ctx.masked_vmax(v)) for path, v, _ in outputs], ctx.masked, colors,
+                PANEL_TITLES['masked_r_band'], add_titles, mask_contour=True)
+
+def render_galfit_model(ctx, outputs, colors, add_titles=False):
+    _draw_panel(ctx, [(path, ctx.masked_vmax(v)) for path, v, _ in outputs], ctx.model, colors,
+                PANEL_TITLES['galfit_model'], add_titles)
+
+def render_residual(ctx, outputs, colors, add_titles=False):
+    _draw_panel(ctx, [(path, ctx.masked_vmax(v)) for path, v, _ in outputs], ctx.residual, colors,
+                PANEL_TITLES['residual'], add_titles)
+
+def render_raw_r_band(ctx, outputs, colors, add_titles=False):
+    _draw_panel(ctx, [(path, ctx.raw_vmax(vr)) for path, _, vr in outputs], ctx.raw, colors,
+                PANEL_TITLES['raw_r_band'], add_titles, redshift_marker=True)
+
+PANEL_TITLES = {
+    'masked_r_band': 'Masked r-Band',
+    'galfit_model': 'GalfitModel',
+    'residual': 'Residual',
+    'raw_r_band': 'Raw r-band',
+}
+
+# Renderers take the PanelContext, a list of (dest_path, vmax_percentile, vmax_percentile_raw)
+# contrasts to save, the colours and add_titles
+PANEL_RENDERERS = {
+    'masked_r_band': render_masked_r_band,
+    'galfit_model': render_galfit_model,
+    'residual': render_residual,
+    'raw_r_band': render_raw_r_band,
+}
+
+def save_scaled_variants(src, dest_path, widths=SCALED_WIDTHS):
+    """
+    Write the downscaled copies of a rendered panel next to dest_path.
+    Args:
+        src: Path or file object of the full size PNG
+        dest_path: Path of the full size panel, the copies are named by get_scaled_filename()
+        widths: Widths of the copies in pixels
+    """
+    from PIL import Image
+
+    output_dir, filename = os.path.split(dest_path)
+    with Image.open(src) as img:
+        img.load()
+        for width in widths:
+            path = os.path.join(output_dir, get_scaled_filename(filename, width))
+            height = max(1, round(img.height * width / img.width))
+            unlink_placeholder(path)
+            img.resize((width, height), Image.LANCZOS).save(path, format='PNG')
+
+def render_panels(galaxy_id, output_dir, galaxy, data_dirs, colors, variants, add_titles=False, generate_tiles=False, vmax_percentile_raw=99.7, source_paths=None):
+    """
+    Render FITS panels of a galaxy and save them as PNG files.
+    Each panel has its own renderer (PANEL_RENDERERS); they share one
+    PanelContext, so the imgblock is opened and decoded once, the
+    percentiles of all contrasts come from one sorted copy per array and
+    every panel is laid out once for all its contrasts. The downscaled
+    copies (SCALED_WIDTHS) are made from each PNG right after it is saved.
+    
+    Args:
+        galaxy_id: Galaxy ID string
+        output_dir: Directory to save images to
+        galaxy: Dictionary with galaxy parameters
+        data_dirs: Dictionary with paths to data directories
+        colors: List of [cmap, ellipse_color, redshift_color]
+        variants: Files to render, {filename: (base_name, vmax_percentile, vmax_percentile_raw)}
+                  (see panel_variants())
+        generate_tiles: Also write the deep-zoom tile pyramid of the raw r-band panel
+        vmax_percentile_raw: Percentile of the tiled raw panel
+        source_paths: resolve_source_paths() of the galaxy, looked up if None
+    Returns: {filename: dict(path, title, vmax, success)} of the rendered panels
+    """
+    if source_paths is None:
+        from services.source_index import resolve_source_paths
+
+        # Paths are None for files known to be unavailable (source index)
+        source_paths = resolve_source_paths(galaxy_id, galaxy['Nucleus'], data_dirs['base_dir'])
+    outputs = {}
+    for filename, (base_name, vmax, vmax_raw) in variants.items():
+        outputs.setdefault(base_name, []).append((os.path.join(output_dir, filename), vmax, vmax_raw))
     
-    # Check for available FITS data
+    results = dict()
+    ctx = PanelContext(galaxy_id, galaxy, source_paths)
     try:
-        imgblock = fits.open(imgblock_path)
-        
-        # Get mask data
-        try:
-            mask_data = fits.getdata(mask_path)
-        except Exception as e:
-            print(f"Error loading mask file for {galaxy_id}: {e}")
-            mask_data = np.zeros_like(imgblock[1].data)
-        
-        # Calculate masked image
-        masked_data = imgblock[1].data * np.logical_not(mask_data) * ONE_JANSKY_ARCSEC_KIDS
-        
-        # Calculate contrast values for different image types
-        vmax = np.percentile(masked_data, vmax_percentile)
-        
-        # Set image scaling
-        vmax_values = [
-            vmax,  # masked band
-            vmax,  # galfit model
-            vmax,  # residual
-            np.percentile(imgblock[1].data * ONE_JANSKY_ARCSEC_KIDS, vmax_percentile_raw),  # raw band
-            0,     # aplpy (not used)
-            0      # lupton (not used)
-        ]
-        
-        # Generate the FITS-based images
-        for i, (base_name, dest_path, title, percentile) in enumerate([
-            ('masked_r_band', masked_band_dest, 'Masked r-Band', vmax_percentile),
-            ('galfit_model', galfit_model_dest, 'GalfitModel', vmax_percentile),
-            ('residual', residual_dest, 'Residual', vmax_percentile),
-            ('raw_r_band', raw_band_dest, 'Raw r-band', vmax_percentile_raw)
-        ]):
-            if i == 0:
-                data = masked_data
-            elif i == 1:
-                data = imgblock[2].data * ONE_JANSKY_ARCSEC_KIDS
-            elif i == 2:
-                data = imgblock[3].data * ONE_JANSKY_ARCSEC_KIDS
-            elif i == 3:
-                data = imgblock[1].data * ONE_JANSKY_ARCSEC_KIDS
-            
-            fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
-            ax = fig.add_axes([0, 0, 1, 1])
-            
-            # Plot image
-            im = ax.imshow(data, vmax=vmax_values[i], cmap=colors[0])
-            
-            # For masked image, also show mask contour
-            if i == 0:
-                cont = ax.contour(mask_data, [0.5], colors=[colors[2]], zorder=1)
-                
-            # Add ellipse for galaxy model
-            ellipse = Ellipse(
-                (galaxy['X'], galaxy['Y']),
-                width=(galaxy['r_r'] * 2 / 0.2),
-                height=(galaxy['r_r'] * 2 / 0.2) * galaxy['q'],
-                angle=galaxy['PA'] + 90, linewidth=1.5,
-                color=colors[1], fill=False, linestyle='-', label='Modelled galaxy'
+        if generate_tiles:
+            from services.tiles import generate_tile_pyramid, source_signature
+            generate_tile_pyramid(
+                ctx.raw,
+                tiles_dir=get_tiles_dir(output_dir, vmax_percentile_raw),
+                vmax=ctx.raw_vmax(vmax_percentile_raw),
+                cmap=colors[0],
+                signature=source_signature(ctx.source_paths['imgblock']),
             )
-            ax.add_patch(ellipse)
-            
-            # Add redshift marker if available
-            if i == 3:
-                ax.plot(
-                    [galaxy['X'], galaxy['RedshiftX']], 
-                    [galaxy['Y'], galaxy['RedshiftY']], 
-                    lw=2, ls='--', c=colors[2]
-                )
-                ax.scatter(
-                    galaxy['RedshiftX'], 
-                    galaxy['RedshiftY'], 
-                    c=colors[2], marker='x', s=150
+
+        ctx.prepare_vmax(
+            vmax_percentiles=[v for name in outputs if name != 'raw_r_band' for _, v, _ in outputs[name]],
+            vmax_percentiles_raw=[vr for _, _, vr in outputs.get('raw_r_band', [])],
+        )
+        for base_name in FITS_IMAGE_NAMES:
+            if base_name not in outputs:
+                continue
+            PANEL_RENDERERS[base_name](ctx, outputs[base_name], colors, add_titles)
+            render_counters['panels_rendered'] += len(outputs[base_name])
+            for dest_path, vmax, vmax_raw in outputs[base_name]:
+                save_scaled_variants(dest_path, dest_path)
+                results[os.path.basename(dest_path)] = dict(
+                    path=dest_path,
+                    title=PANEL_TITLES[base_name],
+                    vmax=get_expected_vmax_percentile(base_name, vmax, vmax_raw),
+                    success=True,
                 )
-            if add_titles:
-                ax.set_title(title)
-            ax.set_yticks([])
-            ax.set_xticks([])
-            ax.set_frame_on(False)
-            
-            # Save figure
-            fig.savefig(dest_path, bbox_inches='tight', pad_inches=0)
-            plt.close(fig)
-
-            results[base_name] = dict(
-                path=dest_path,
-                title=title,
-                vmax=percentile,
-                success=True,
-            )
 
-        
     except Exception as e:
-        print(f"Error processing FITS data for {galaxy_id}: {e}")
-        # Create placeholder images for missing FITS data
-        for base_name, dest_path in [
-            ('masked_r_band', masked_band_dest),
-            ('galfit_model', galfit_model_dest),
-            ('residual', residual_dest),
-            ('raw_r_band', raw_band_dest)
-        ]:
-            fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.imshow(sad_emoji(), cmap='binary')
-            t = f"Missing FITS data\n{dest_path.split('/')[-1]}"
-            ax.set_title(t)
-            ax.set_yticks([])
-            ax.set_xticks([])
-            fig.savefig(dest_path, bbox_inches='tight')
-            plt.close(fig)
-
-            results[base_name] = dict(
-                path=dest_path,
-                title=t,
+        # Unreadable sources were marked bad by PanelContext; anything else (a full
+        # disk, a plotting error) is not the source's fault and is retried next time
+        if not isinstance(e, SourceUnavailable):
+            print(f"Error processing FITS data for {galaxy_id}: {e}")
+        # Link the shared placeholder in place of the FITS panels
+        placeholder = get_placeholder_image(data_dirs['output_dir'], 'fits')
+        for filename in variants:
+            for name in [filename] + get_scaled_filenames(filename):
+                link_placeholder(placeholder, os.path.join(output_dir, name))
+            results[filename] = dict(
+                path=os.path.join(output_dir, filename),
+                title=PLACEHOLDER_TITLES['fits'],
                 vmax=0,
                 success=False,
             )
-    
-    # Handle color images (copy from source if available, or create placeholder)
-    try:
-        if os.path.exists(aplpy_src):
-            # If it's a PNG, flip up-down and save to destination
-            with Image.open(aplpy_src) as img:
-                flipped_img = img.transpose(Image.FLIP_TOP_BOTTOM)
-                flipped_img.save(aplpy_dest)
-        else:
-            fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.imshow(sad_emoji(), cmap='binary')
-            ax.set_title("APLpy color image not available")
-            ax.set_yticks([])
-            ax.set_xticks([])
-            fig.savefig(aplpy_dest, bbox_inches='tight')
-            plt.close(fig)
-
-        results['aplpy'] = dict(
-            path=aplpy_dest,
-            title='APLpy',
-            vmax=0,
-            success=True,
-        )
-            
-        if os.path.exists(lupton_src):
-            # Copy directly
-            shutil.copy(lupton_src, lupton_dest)
-        else:
-            fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.imshow(sad_emoji(), cmap='binary')
-            ax.set_title("Lupton RGB image not available")
-            ax.set_yticks([])
-            ax.set_xticks([])
-            fig.savefig(lupton_dest, bbox_inches='tight')
-            plt.close(fig)
-
-        results['lupton'] = dict(
-            path=lupton_dest,
-            title='Lupton RGB',
-            vmax=0,
-            success=True,
-        )
-            
-    except Exception as e:
-        print(f"Error handling color images for {galaxy_id}: {e}")
-        # Create placeholders for both color images if there was an error
-        for dest_path, title in [(aplpy_dest, "APLpy"), (lupton_dest, "Lupton RGB")]:
-            fig = plt.figure(figsize=(6, 6*Y_AXIS_RATIO), dpi=OUTPUT_DPI)
-            ax = fig.add_axes([0, 0, 1, 1])
-            ax.imshow(sad_emoji(), cmap='binary')
-            ax.set_title(f"{title} image error")
-            ax.set_yticks([])
-            ax.set_xticks([])
-            fig.savefig(dest_path, bbox_inches='tight')
-            plt.close(fig)
+    finally:
+        ctx.close()
     
     return results
 
+def generate_galaxy_images(galaxy_id, output_dir, galaxy, data_dirs, colors, add_titles=False, vmax_percentile=99.0, vmax_percentile_raw=99.7, generate_tiles=False):
+    """
+    Render all four FITS panels of a galaxy (see render_panels()).
+    The colour panels are not rendered, see get_color_images().
+    """
+    return render_panels(
+        galaxy_id, output_dir, galaxy, data_dirs, colors,
+        variants=panel_variants(FITS_IMAGE_NAMES, [(vmax_percentile, vmax_percentile_raw)]),
+        add_titles=add_titles,
+        generate_tiles=generate_tiles,
+        vmax_percentile_raw=vmax_percentile_raw,
+    )
+
 def get_galaxy_image_paths(galaxy_id, data_dirs=None, vmax_percentile=99.0, vmax_percentile_raw=99.7):
     """
     Return the expected image paths for a given galaxy, without creating the images.
@@ -467,16 +1006,68 @@ def get_galaxy_image_paths(galaxy_id, data_dirs=None, vmax_percentile=99.0, vmax
 
     galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
 
-    base_image_names = [
-        "masked_r_band",
-        "galfit_model",
-        "residual",
-        "raw_r_band",
-        "aplpy",
-        "lupton"
-    ]
     expected_images = {
         name: os.path.join(galaxy_dir, get_image_filename(name, vmax_percentile, vmax_percentile_raw))
-        for name in base_image_names
+        for name in FITS_IMAGE_NAMES + COLOR_IMAGE_NAMES
     }
     return expected_images
+
+def get_thumbnail_filename(base_name, width=THUMBNAIL_WIDTH):
+    """Filename of a downscaled panel, e.g. aplpy_w128.png"""
+    return get_scaled_filename(f"{base_name}.png", width)
+
+def get_placeholder_thumbnail(output_dir, width=THUMBNAIL_WIDTH):
+    """Shared thumbnail for galaxies without a colour image, drawn once per output directory"""
+    path = os.path.join(output_dir, get_thumbnail_filename('placeholder', width))
+    if not os.path.exists(path):
+        from PIL import Image
+        ensure_dir(output_dir)
+        pixels = ((1 - sad_emoji()) * 255).astype(np.uint8)
+        height = int(round(width * Y_AXIS_RATIO))
+        tmp_path = make_tmp_path(path)
+        Image.fromarray(pixels).resize((width, height), Image.NEAREST).save(tmp_path, format='PNG')
+        os.replace(tmp_path, path)
+    return path
+
+def get_galaxy_thumbnail(galaxy_id, data_dirs, width=THUMBNAIL_WIDTH):
+    """
+    Path of a small APLpy thumbnail of a galaxy, created on first use.
+    The thumbnail is made from the colour image alone (the rendered panel if
+    it exists, the source PNG otherwise), so it never triggers a FITS render.
+    Args:
+        galaxy_id: ID of the galaxy
+        data_dirs: Dictionary with paths to data directories
+        width: Thumbnail width in pixels
+    Returns: Path of the thumbnail, or of the shared placeholder
+    """
+    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
+    thumbnail_path = os.path.join(galaxy_dir, get_thumbnail_filename('aplpy', width))
+    if os.path.exists(thumbnail_path):
+        return thumbnail_path
+
+    from PIL import Image
+
+    rendered = os.path.join(galaxy_dir, get_image_filename('aplpy', None, None))
+    source = None
+    try:
+        if os.path.isfile(rendered) and not os.path.islink(rendered):
+            img = Image.open(rendered)
+        else:
+            # The colour images do not depend on the galaxy parameters, no lookup needed
+            source = get_color_source_paths(galaxy_id, data_dirs['base_dir'])['aplpy']
+            if get_negative_cache().is_bad(source):
+                return get_placeholder_thumbnail(data_dirs['output_dir'], width)
+            with Image.open(source) as src:
+                img = src.transpose(Image.FLIP_TOP_BOTTOM)  # Same orientation as the rendered panel
+        with img:
+            img.thumbnail((width, width))
+            ensure_dir(galaxy_dir)
+            tmp_path = make_tmp_path(thumbnail_path)
+            img.save(tmp_path, format='PNG')
+        os.replace(tmp_path, thumbnail_path)
+    except (OSError, ValueError) as e:
+        print(f"No thumbnail for {galaxy_id}: {e}")
+        if source is not None:
+            get_negative_cache().mark_bad(source)
+        return get_placeholder_thumbnail(data_dirs['output_dir'], width)
+    return thumbnail_path
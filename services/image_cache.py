@@ -0,0 +1,227 @@
+# services/image_cache.py
+#
+# Maintenance of the rendered image cache in GALAXY_IMAGES_FOLDER.
+# Every contrast selection in the UI renders a new set of *_vmax*.png files;
+# this module tracks when files were last served and evicts the least
+# recently served non-default variants once the cache exceeds a disk budget.
+# With IMAGE_STORE = 'pack' the variants live in the pack store instead; the
+# last served time is kept in its index and evicted entries are compacted away.
+
+import os
+import re
+import time
+import threading
+
+from services.fits_processor import parse_image_filename, split_scaled_filename
+
+# Only update the access time if it is older than this (seconds), so that
+# serving a popular image does not write inode metadata on every request.
+ACCESS_TIME_RESOLUTION = 3600
+
+GC_LOCK_FILENAME = '.gc.lock'
+
+_SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+
+
+def parse_size(value):
+    """
+    Parse a human readable size such as '500M' or '20G' into bytes.
+    Args:
+        value: Integer or string with an optional K/M/G/T suffix
+    Returns: Size in bytes (int)
+    """
+    if isinstance(value, (int, float)):
+        return int(value)
+    m = re.match(r'^\s*([0-9.]+)\s*([KMGT]?)i?B?\s*$', str(value).upper())
+    if not m:
+        raise ValueError(f"Invalid size '{value}'")
+    return int(float(m.group(1)) * _SIZE_UNITS[m.group(2)])
+
+
+def format_size(num_bytes):
+    """Format a byte count for reports"""
+    for unit in ['B', 'KiB', 'MiB', 'GiB']:
+        if abs(num_bytes) < 1024:
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} TiB"
+
+
+def touch_access(path, now=None):
+    """
+    Record that an image was served.
+    The access time is set explicitly (keeping the modification time), which
+    also works on filesystems mounted with noatime/relatime.
+    """
+    now = time.time() if now is None else now
+    try:
+        st = os.stat(path)
+        if now - st.st_atime > ACCESS_TIME_RESOLUTION:
+            os.utime(path, (now, st.st_mtime))
+    except OSError:
+        pass
+
+
+def touch_stored_access(store, galaxy_id, filename, now=None):
+    """touch_access() for an image in the pack store (services/image_store.py)"""
+    try:
+        store.touch(galaxy_id, filename, now=now, resolution=ACCESS_TIME_RESOLUTION)
+    except Exception as e:
+        print(f"Could not record access of {galaxy_id}/{filename}: {e}")
+
+
+def is_pinned(filename, default_vmax_percentile, default_vmax_percentile_raw):
+    """
+    Return True if the image must never be evicted.
+    Pinned are the default contrast variants and images without a contrast
+    variant (the colour images), with their downscaled copies.
+    """
+    filename, _ = split_scaled_filename(filename)
+    base_name, vmax_percentile, vmax_percentile_raw = parse_image_filename(
+        filename,
+        default_vmax_percentile=default_vmax_percentile,
+        default_vmax_percentile_raw=default_vmax_percentile_raw,
+    )
+    if '_vmax' not in filename:
+        return True
+    if base_name == 'raw_r_band':
+        return vmax_percentile_raw == default_vmax_percentile_raw
+    return vmax_percentile == default_vmax_percentile
+
+
+def scan_cache(output_dir, default_vmax_percentile, default_vmax_percentile_raw, store=None):
+    """
+    Scan the image cache, and the pack store if one is given.
+    Returns: (total_bytes, pinned_bytes, evictable) where evictable is a list
+             of (atime, size, path, packed) tuples of non-pinned variants;
+             packed is (galaxy_id, filename) for an image in the store, None for a file
+    """
+    total_bytes = pinned_bytes = 0
+    evictable = []
+    for galaxy_entry in os.scandir(output_dir):
+        if galaxy_entry.name.startswith('.') or not galaxy_entry.is_dir():
+            continue
+        for entry in os.scandir(galaxy_entry.path):
+            if not entry.is_file() or not entry.name.endswith('.png'):
+                continue
+            if entry.is_symlink():
+                # Colour image linked from DATA_BASE_DIR (COLOR_IMAGE_MODE = 'link')
+                continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            if st.st_nlink > 1:
+                # Linked shared placeholder, takes no space of its own
+                continue
+            total_bytes += st.st_size
+            if is_pinned(entry.name, default_vmax_percentile, default_vmax_percentile_raw):
+                pinned_bytes += st.st_size
+            else:
+                evictable.append((st.st_atime, st.st_size, entry.path, None))
+
+    if store is not None:
+        for galaxy_id, filename, size, served in store.served_images():
+            if not filename.endswith('.png'):
+                continue
+            total_bytes += size
+            if is_pinned(filename, default_vmax_percentile, default_vmax_percentile_raw):
+                pinned_bytes += size
+            else:
+                evictable.append((served, size, f"{galaxy_id}/{filename}", (galaxy_id, filename)))
+    return total_bytes, pinned_bytes, evictable
+
+
+def collect_garbage(output_dir, budget_bytes, default_vmax_percentile, default_vmax_percentile_raw,
+                    dry_run=False, store=None):
+    """
+    Evict least recently served non-default variants until the cache fits
+    into budget_bytes.
+    Args:
+        output_dir: Image cache directory (GALAXY_IMAGES_FOLDER)
+        budget_bytes: Disk budget for the whole cache
+        default_vmax_percentile: Pinned vmax percentile (VMAX_PERCENTILE)
+        default_vmax_percentile_raw: Pinned raw vmax percentile (VMAX_PERCENTILE_RAW)
+        dry_run: Only report what would be removed
+        store: PackStore holding the rendered images (IMAGE_STORE = 'pack'), if any
+    Returns: Dictionary with the report
+    """
+    total_bytes, pinned_bytes, evictable = scan_cache(
+        output_dir, default_vmax_percentile, default_vmax_percentile_raw, store=store
+    )
+    evictable.sort(key=lambda item: item[:3])
+
+    remaining = total_bytes
+    reclaimed_bytes = evicted_files = 0
+    packed_evictions = {}  # galaxy_id -> filenames
+    for atime, size, path, packed in evictable:
+        if remaining <= budget_bytes:
+            break
+        if packed is not None:
+            packed_evictions.setdefault(packed[0], []).append(packed[1])
+        elif not dry_run:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+        remaining -= size
+        reclaimed_bytes += size
+        evicted_files += 1
+
+    if packed_evictions and not dry_run:
+        for galaxy_id, filenames in packed_evictions.items():
+            store.delete(galaxy_id, filenames)
+        # Dropping the entries from the index frees nothing until their shards are rewritten
+        for shard in sorted({store.shard_of(galaxy_id) for galaxy_id in packed_evictions}):
+            store.compact(shard)
+
+    return {
+        'total_bytes': total_bytes,
+        'pinned_bytes': pinned_bytes,
+        'evictable_bytes': sum(item[1] for item in evictable),
+        'budget_bytes': budget_bytes,
+        'reclaimed_bytes': reclaimed_bytes,
+        'evicted_files': evicted_files,
+        'remaining_bytes': remaining,
+        'over_budget': remaining > budget_bytes,
+        'dry_run': dry_run,
+    }
+
+
+def _run_locked(output_dir, func):
+    """Run func only if no other process is collecting garbage right now"""
+    import fcntl
+
+    with open(os.path.join(output_dir, GC_LOCK_FILENAME), 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            return func()
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def start_gc_thread(output_dir, budget_bytes, interval, default_vmax_percentile, default_vmax_percentile_raw,
+                    store=None):
+    """
+    Start a daemon thread enforcing the budget every `interval` seconds.
+    Safe to call from every web worker, only one of them collects at a time.
+    """
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                report = _run_locked(output_dir, lambda: collect_garbage(
+                    output_dir, budget_bytes, default_vmax_percentile, default_vmax_percentile_raw, store=store
+                ))
+                if report and report['evicted_files']:
+                    print(f"Image cache GC: evicted {report['evicted_files']} files, "
+                          f"reclaimed {format_size(report['reclaimed_bytes'])}")
+            except Exception as e:
+                print(f"Image cache GC failed: {e}")
+
+    thread = threading.Thread(target=loop, name='image-cache-gc', daemon=True)
+    thread.start()
+    return thread
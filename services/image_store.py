@@ -0,0 +1,344 @@
+# services/image_store.py
+#
+# Packed storage of rendered images (IMAGE_STORE = 'pack'). Instead of one
+# file per panel and contrast variant under GALAXY_IMAGES_FOLDER/<galaxy_id>/,
+# the PNGs are appended to a few sharded pack files and found through an
+# SQLite offset index, so millions of galaxies cost a few hundred files:
+#
+#     IMAGE_PACK_FOLDER/index.sqlite      (galaxy_id, filename) -> pack, offset, size
+#     IMAGE_PACK_FOLDER/<shard>.<gen>.pack appended PNG data
+#
+# Renders still write PNG files, into a private staging directory that
+# pack_directory() empties into the store afterwards. Reads map
+# the pack file and slice the image out; the ASGI image app hands the byte
+# range to sendfile. A re-rendered variant is appended again, compact()
+# rewrites a shard without the superseded bytes.
+
+import os
+import mmap
+import time
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+from services.render_claims import galaxy_shard
+
+INDEX_FILENAME = 'index.sqlite'
+DEFAULT_SHARDS = 64
+MAX_OPEN_MAPS = 32
+
+# A stored image; pack is None for a galaxy showing a shared placeholder file
+PackEntry = namedtuple('PackEntry', 'pack offset size mtime placeholder')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS images (
+    galaxy_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    pack TEXT,
+    offset INTEGER,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    placeholder TEXT,
+    served REAL,
+    PRIMARY KEY (galaxy_id, filename)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_images_pack ON images (pack);
+CREATE TABLE IF NOT EXISTS shards (
+    shard INTEGER PRIMARY KEY,
+    pack TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class PackStore:
+    """Rendered images of all galaxies in sharded, append-only pack files"""
+
+    def __init__(self, root, shard_count=DEFAULT_SHARDS):
+        self.root = root
+        self._local = threading.local()
+        self._maps = OrderedDict()  # pack -> mmap
+        self._maps_lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+        db = self._db()
+        db.executescript(_SCHEMA)
+        if 'served' not in [row[1] for row in db.execute("PRAGMA table_info(images)")]:
+            # Index created before the garbage collector tracked pack entries
+            db.execute("ALTER TABLE images ADD COLUMN served REAL")
+        db.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('shard_count', ?)", (str(shard_count),))
+        # The shard of a galaxy must not change once packs exist
+        self.shard_count = int(db.execute("SELECT value FROM meta WHERE key = 'shard_count'").fetchone()[0])
+
+    def _db(self):
+        """SQLite connection of the current thread (and process: connections do not survive a fork)"""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(os.path.join(self.root, INDEX_FILENAME), timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db, self._local.pid = db, os.getpid()
+        return db
+
+    # Lookups
+
+    def lookup(self, galaxy_id, filename):
+        """PackEntry of an image, None if it is not stored"""
+        row = self._db().execute(
+            "SELECT pack, offset, size, mtime, placeholder FROM images WHERE galaxy_id = ? AND filename = ?",
+            (galaxy_id, filename),
+        ).fetchone()
+        return None if row is None else PackEntry(*row)
+
+    def list(self, galaxy_id):
+        """All stored images of a galaxy: {filename: PackEntry}"""
+        rows = self._db().execute(
+            "SELECT filename, pack, offset, size, mtime, placeholder FROM images WHERE galaxy_id = ?",
+            (galaxy_id,),
+        )
+        return {row[0]: PackEntry(*row[1:]) for row in rows}
+
+    def galaxy_ids(self):
+        """Galaxies with stored images"""
+        return [row[0] for row in self._db().execute("SELECT DISTINCT galaxy_id FROM images ORDER BY galaxy_id")]
+
+    def _map(self, pack, end):
+        """Read-only map of a pack file covering at least `end` bytes"""
+        with self._maps_lock:
+            mapped = self._maps.get(pack)
+            if mapped is not None and len(mapped) >= end:
+                self._maps.move_to_end(pack)
+                return mapped
+        with open(os.path.join(self.root, pack), 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._maps_lock:
+            self._maps[pack] = mapped
+            self._maps.move_to_end(pack)
+            while len(self._maps) > MAX_OPEN_MAPS:
+                self._maps.popitem(last=False)
+        return mapped
+
+    def read_entry(self, entry):
+        """Bytes of a stored image"""
+        if entry.pack is None:
+            with open(entry.placeholder, 'rb') as f:
+                return f.read()
+        return self._map(entry.pack, entry.offset + entry.size)[entry.offset:entry.offset + entry.size]
+
+    def read(self, galaxy_id, filename):
+        """Bytes of a stored image, None if it is not stored"""
+        for _ in range(2):
+            entry = self.lookup(galaxy_id, filename)
+            if entry is None:
+                return None
+            try:
+                return self.read_entry(entry)
+            except FileNotFoundError:
+                # The shard was compacted between lookup and read
+                continue
+        return None
+
+    def open_range(self, galaxy_id, filename):
+        """
+        Open the file holding a stored image, for sendfile.
+        Returns: (open file, offset, PackEntry), None if the image is not stored
+        """
+        for _ in range(2):
+            entry = self.lookup(galaxy_id, filename)
+            if entry is None:
+                return None
+            try:
+                if entry.pack is None:
+                    return open(entry.placeholder, 'rb'), 0, entry
+                return open(os.path.join(self.root, entry.pack), 'rb'), entry.offset, entry
+            except FileNotFoundError:
+                continue
+        return None
+
+    # Writes
+
+    def _lock_shard(self, shard):
+        """Exclusive lock of a shard's pack file across processes"""
+        import fcntl
+        lock_file = open(os.path.join(self.root, f"{shard:03d}.lock"), 'w')
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _current_pack(self, db, shard):
+        row = db.execute("SELECT pack FROM shards WHERE shard = ?", (shard,)).fetchone()
+        if row is not None:
+            return row[0]
+        pack = f"{shard:03d}.0.pack"
+        db.execute("INSERT INTO shards (shard, pack) VALUES (?, ?)", (shard, pack))
+        return pack
+
+    def put(self, galaxy_id, images):
+        """
+        Store images of a galaxy, replacing earlier versions.
+        Args:
+            galaxy_id: ID of the galaxy
+            images: {filename: bytes, or the path of a shared placeholder (str)}
+        """
+        shard = galaxy_shard(galaxy_id, self.shard_count)
+        now = time.time()
+        lock_file = self._lock_shard(shard)
+        try:
+            db = self._db()
+            pack = self._current_pack(db, shard)
+            rows = []
+            with open(os.path.join(self.root, pack), 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                for filename, data in images.items():
+                    if isinstance(data, str):
+                        rows.append((galaxy_id, filename, None, None, os.path.getsize(data), now, data, now))
+                        continue
+                    rows.append((galaxy_id, filename, pack, f.tell(), len(data), now, None, now))
+                    f.write(data)
+            # The index only points at data that is written
+            db.execute('BEGIN')
+            db.executemany(
+                "INSERT OR REPLACE INTO images (galaxy_id, filename, pack, offset, size, mtime, placeholder, served) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            db.execute('COMMIT')
+        finally:
+            lock_file.close()
+
+    def pack_directory(self, galaxy_id, galaxy_dir, filenames, placeholders=(), remove=True):
+        """
+        Move rendered files of a galaxy into the store.
+        Files hard linked to one of `placeholders` are stored as a reference to it.
+        Args:
+            galaxy_id: ID of the galaxy
+            galaxy_dir: Directory the files were rendered into
+            filenames: Files to move; missing ones are skipped
+            placeholders: Paths of the shared placeholder images
+            remove: Remove the files once they are stored
+        Returns: Number of files stored
+        """
+        images = {}
+        for filename in filenames:
+            path = os.path.join(galaxy_dir, filename)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            placeholder = None
+            if st.st_nlink > 1:
+                placeholder = next((p for p in placeholders if os.path.exists(p) and os.path.samefile(p, path)), None)
+            if placeholder is not None:
+                images[filename] = placeholder
+            else:
+                with open(path, 'rb') as f:
+                    images[filename] = f.read()
+        if not images:
+            return 0
+
+        self.put(galaxy_id, images)
+        if remove:
+            for filename in images:
+                os.remove(os.path.join(galaxy_dir, filename))
+        return len(images)
+
+    def touch(self, galaxy_id, filename, now=None, resolution=0):
+        """Record that an image was served, unless that was recorded less than `resolution` seconds ago"""
+        now = time.time() if now is None else now
+        self._db().execute(
+            "UPDATE images SET served = ? WHERE galaxy_id = ? AND filename = ? AND (served IS NULL OR served < ?)",
+            (now, galaxy_id, filename, now - resolution),
+        )
+
+    def served_images(self):
+        """(galaxy_id, filename, size, last served time) of all images stored in packs"""
+        return self._db().execute(
+            "SELECT galaxy_id, filename, size, COALESCE(served, mtime) FROM images WHERE pack IS NOT NULL"
+        ).fetchall()
+
+    def shard_of(self, galaxy_id):
+        return galaxy_shard(galaxy_id, self.shard_count)
+
+    def delete(self, galaxy_id, filenames=None):
+        """Drop images of a galaxy from the index (all if filenames is None); compact() frees the space"""
+        db = self._db()
+        if filenames is None:
+            db.execute("DELETE FROM images WHERE galaxy_id = ?", (galaxy_id,))
+        else:
+            db.executemany("DELETE FROM images WHERE galaxy_id = ? AND filename = ?",
+                           [(galaxy_id, filename) for filename in filenames])
+
+    def compact(self, shard):
+        """
+        Rewrite a shard's pack file with only the images the index points at.
+        Readers holding the old file keep reading it until they are done.
+        Returns: Bytes reclaimed
+        """
+        lock_file = self._lock_shard(shard)
+        try:
+            db = self._db()
+            row = db.execute("SELECT pack FROM shards WHERE shard = ?", (shard,)).fetchone()
+            if row is None:
+                return 0
+            old_pack = row[0]
+            old_path = os.path.join(self.root, old_pack)
+            generation = int(old_pack.split('.')[1]) + 1
+            new_pack = f"{shard:03d}.{generation}.pack"
+
+            entries = db.execute(
+                "SELECT galaxy_id, filename, offset, size FROM images WHERE pack = ? ORDER BY offset", (old_pack,)
+            ).fetchall()
+            moved = []
+            with open(old_path, 'rb') as src, open(os.path.join(self.root, new_pack), 'wb') as dst:
+                for galaxy_id, filename, offset, size in entries:
+                    src.seek(offset)
+                    moved.append((new_pack, dst.tell(), galaxy_id, filename))
+                    dst.write(src.read(size))
+                new_size = dst.tell()
+
+            db.execute('BEGIN')
+            db.executemany("UPDATE images SET pack = ?, offset = ? WHERE galaxy_id = ? AND filename = ?", moved)
+            db.execute("UPDATE shards SET pack = ? WHERE shard = ?", (new_pack, shard))
+            db.execute('COMMIT')
+
+            reclaimed = os.path.getsize(old_path) - new_size
+            os.remove(old_path)
+            with self._maps_lock:
+                self._maps.pop(old_pack, None)
+            return reclaimed
+        finally:
+            lock_file.close()
+
+    def stats(self):
+        """Dictionary with the number of images and galaxies, live and total pack bytes"""
+        db = self._db()
+        images, galaxies, live_bytes = db.execute(
+            "SELECT COUNT(*), COUNT(DISTINCT galaxy_id), COALESCE(SUM(size), 0) FROM images WHERE pack IS NOT NULL"
+        ).fetchone()
+        placeholders = db.execute("SELECT COUNT(*) FROM images WHERE pack IS NULL").fetchone()[0]
+        packs = [row[0] for row in db.execute("SELECT pack FROM shards")]
+        pack_bytes = sum(os.path.getsize(os.path.join(self.root, p)) for p in packs
+                         if os.path.exists(os.path.join(self.root, p)))
+        return {
+            'images': images,
+            'placeholders': placeholders,
+            'galaxies': galaxies,
+            'packs': len(packs),
+            'live_bytes': live_bytes,
+            'pack_bytes': pack_bytes,
+        }
+
+
+_store = None
+
+
+def get_image_store():
+    """Return the process wide PackStore, None when rendered images are plain files (IMAGE_STORE = 'files')"""
+    global _store
+    import config
+    if config.IMAGE_STORE != 'pack':
+        return None
+    if _store is None:
+        _store = PackStore(config.IMAGE_PACK_FOLDER, shard_count=config.IMAGE_PACK_SHARDS)
+    return _store
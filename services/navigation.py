@@ -0,0 +1,172 @@
+# services/navigation.py
+#
+# Everything classify() needs about the current galaxy, fetched in one query:
+# the galaxy, the user's classification of it, the previous and next galaxy
+# matching the active filters, and the user's progress.
+
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import select, func, and_, exists
+from sqlalchemy.orm import aliased
+
+from models.galaxy import Galaxy, Classification, SkippedGalaxy, GalaxyRecord, ClassificationRecord
+
+FILTER_NAMES = ('skipped', 'classified', 'with_redshift', 'valid_redshift', 'lsb_class', 'morphology')
+
+
+def _neighbour_subquery(current, user_id, direction, skipped=False, classified=None, with_redshift=None,
+                        valid_redshift=None, lsb_class=None, morphology=None):
+    """
+    Correlated scalar subquery returning the id of the nearest galaxy in chain
+    order (before or after `current`) matching the filters. Same semantics as
+    Galaxy.get_next_for_user/get_previous_for_user, but resolved with one
+    index range scan on galaxies.position instead of a row-by-row walk.
+    """
+    candidate = aliased(Galaxy)
+    classification = aliased(Classification)
+
+    query = select(candidate.id).outerjoin(
+        classification,
+        and_(classification.galaxy_id == candidate.id, classification.user_id == user_id),
+    )
+    if direction > 0:
+        query = query.where(candidate.position > current.position).order_by(candidate.position.asc())
+    else:
+        query = query.where(candidate.position < current.position).order_by(candidate.position.desc())
+
+    if skipped is not None:
+        is_skipped = exists().where(
+            SkippedGalaxy.user_id == user_id, SkippedGalaxy.galaxy_id == candidate.id
+        )
+        query = query.where(is_skipped if skipped else ~is_skipped)
+
+    if classified is True:
+        query = query.where(classification.id.isnot(None))
+    elif classified is False:
+        query = query.where(classification.id.is_(None))
+
+    if isinstance(lsb_class, int):
+        query = query.where(classification.lsb_class == lsb_class)
+    if isinstance(morphology, int):
+        query = query.where(classification.morphology == morphology)
+
+    if with_redshift is True:
+        query = query.where(candidate.redshift_x.isnot(None), candidate.redshift_y.isnot(None))
+    elif with_redshift is False:
+        query = query.where(candidate.redshift_x.is_(None), candidate.redshift_y.is_(None))
+
+    if valid_redshift is not None:
+        query = query.where(
+            candidate.redshift_x.isnot(None),
+            candidate.redshift_y.isnot(None),
+            classification.valid_redshift == valid_redshift,
+        )
+
+    return query.limit(1).correlate(current).scalar_subquery()
+
+
+def build_navigation_context(session, user_id, galaxy_id, **filters):
+    """
+    Fetch the navigation context of a galaxy in a single round trip.
+    Args:
+        session: SQLAlchemy session
+        user_id: ID of the user
+        galaxy_id: ID of the current galaxy
+        filters: skipped, classified, with_redshift, valid_redshift, lsb_class, morphology
+    Returns: Dictionary with galaxy, current_classification, next_id, previous_id
+             and progress, or None if the galaxy does not exist
+    """
+    current = aliased(Galaxy)
+    classification = aliased(Classification)
+
+    query = (
+        select(
+            current.id, current.ra, current.dec, current.x, current.y,
+            current.redshift_x, current.redshift_y, current.r_r, current.q, current.pa,
+            current.nucleus, current.position,
+            classification.id.label('classification_id'),
+            classification.lsb_class, classification.morphology, classification.comments,
+            classification.awesome_flag, classification.valid_redshift, classification.date_classified,
+            _neighbour_subquery(current, user_id, 1, **filters).label('next_id'),
+            _neighbour_subquery(current, user_id, -1, **filters).label('previous_id'),
+            select(func.count(Classification.id)).where(Classification.user_id == user_id)
+                .scalar_subquery().label('classified_count'),
+            select(func.count(Galaxy.id)).scalar_subquery().label('total'),
+        )
+        .outerjoin(classification, and_(
+            classification.galaxy_id == current.id, classification.user_id == user_id
+        ))
+        .where(current.id == galaxy_id)
+    )
+    row = session.execute(query).first()
+    if row is None:
+        return None
+
+    galaxy = GalaxyRecord(**{name: getattr(row, name) for name in GalaxyRecord._fields})
+    current_classification = None
+    if row.classification_id is not None:
+        current_classification = ClassificationRecord(
+            **{name: getattr(row, name) for name in ClassificationRecord._fields}
+        )
+    total = row.total
+    return {
+        'galaxy': galaxy,
+        'current_classification': current_classification,
+        'next_id': row.next_id,
+        'previous_id': row.previous_id,
+        'progress': {
+            'classified_count': row.classified_count,
+            'total': total,
+            'percentage': (row.classified_count / total) * 100 if total > 0 else 0,
+        },
+    }
+
+
+class NavigationCache:
+    """
+    LRU cache of navigation contexts keyed by (user, user state version,
+    chain version, galaxy, filters). Writes that change a user's state bump
+    the version, which makes all of that user's cached contexts unreachable;
+    reordering the chain does the same for all users.
+    """
+
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+
+_cache = NavigationCache()
+
+
+def get_navigation_context(session, user_id, galaxy_id, state_version=0, chain_version=0, **filters):
+    """
+    Cached variant of build_navigation_context.
+    Args:
+        state_version: Counter of the user's state (User.state_version in the
+                       database), bumped whenever the user's classifications or skips change
+        chain_version: Counter of the galaxy chain (CatalogState.chain_version in the
+                       database), bumped by utils/reorder_galaxies.py
+    """
+    key = (user_id, state_version, chain_version, galaxy_id) + tuple(filters.get(name) for name in FILTER_NAMES)
+    context = _cache.get(key)
+    if context is None:
+        context = build_navigation_context(session, user_id, galaxy_id, **filters)
+        if context is not None:
+            _cache.put(key, context)
+    return context
@@ -0,0 +1,238 @@
+# services/panel_data.py
+#
+# Quantized FITS panels for drawing in the browser (CLIENT_RENDERING).
+# The four panels of a galaxy are stored together in one small binary file,
+# <galaxy_id>/panels.lsbq next to the rendered PNGs (or in the pack store):
+#
+#     b'LSBQ', uint32 header length, JSON header (padded to 8 bytes),
+#     then per panel height x width uint16 codes, little endian, row by row
+#
+# A pixel is offset + code * scale, NaN pixels are NAN_CODE. Codes span the
+# panel minimum (the vmin of the rendered panel) up to a percentile above every
+# contrast preset; brighter pixels are saturated by every preset anyway, so
+# the 16 bits go to the range that is actually displayed. The header also
+# carries the ellipse, redshift marker and mask contour, which lets
+# static/js/main.js redraw a panel at any contrast and colormap without the
+# server. The rendered PNGs stay the first view and the fallback.
+
+import os
+import json
+import time
+import base64
+import shutil
+import struct
+from functools import lru_cache
+
+import numpy as np
+
+from services.fits_processor import (
+    PanelContext, SourceUnavailable, get_source_paths, get_galaxy_data, read_galaxy_dependencies,
+    get_staging_dir, ensure_dir, render_counters, DEFAULT_COLORS, OUTPUT_DPI, PANEL_WIDTH, Y_AXIS_RATIO
+)
+from services.render_deps import (
+    render_settings_key, record_dependencies, check_dependencies, locked_dependencies, DEPS_FILENAME
+)
+from services.source_cache import get_negative_cache
+from services.image_store import get_image_store
+from services.atomic_files import make_tmp_path
+
+PANEL_DATA_FILENAME = 'panels.lsbq'
+PANEL_DATA_MAGIC = b'LSBQ'
+# Bump when the layout of the file changes
+PANEL_DATA_VERSION = 1
+NAN_CODE = 65535
+# Lowest percentile the codes reach up to; raised to the brightest contrast preset if that is higher
+QUANTIZE_PERCENTILE = 99.99
+
+# Panel, PanelContext array it shows and the panel whose percentile sets its
+# contrast (the masked panel scales the model and residual, see the renderers)
+PANEL_ARRAYS = (
+    ('masked_r_band', 'masked', 'masked_r_band'),
+    ('galfit_model', 'model', 'masked_r_band'),
+    ('residual', 'residual', 'masked_r_band'),
+    ('raw_r_band', 'raw', 'raw_r_band'),
+)
+
+
+def get_quantize_percentiles(presets=None):
+    """Percentiles the codes of the masked and the raw r-band scaling reach up to"""
+    presets = list(presets or [])
+    return (
+        max([QUANTIZE_PERCENTILE] + [v for v, _ in presets]),
+        max([QUANTIZE_PERCENTILE] + [vr for _, vr in presets]),
+    )
+
+
+def panel_data_settings_key(colors, presets=None):
+    """Dependency settings key of the panel data file (see services/render_deps.py)"""
+    percentile, percentile_raw = get_quantize_percentiles(presets)
+    return f"{render_settings_key(colors)}-q{PANEL_DATA_VERSION}-{percentile}-{percentile_raw}"
+
+
+def quantize(data, vmax):
+    """
+    uint16 codes of a panel from its minimum up to vmax (clipped), NaN as NAN_CODE.
+    Returns: (codes, offset, scale)
+    """
+    data = np.asarray(data, dtype=np.float64)
+    offset = float(np.nanmin(data))
+    vmax = float(np.fmin(vmax, np.nanmax(data)))
+    scale = (vmax - offset) / (NAN_CODE - 1) if vmax > offset else 1.0
+    codes = np.rint((np.clip(data, offset, vmax) - offset) / scale)
+    codes = np.where(np.isfinite(data), codes, NAN_CODE).astype('<u2')
+    return codes, offset, scale
+
+
+def mask_contour_lines(mask):
+    """Vertices [x0, y0, x1, y1, ...] of the mask outline, the contour the masked panel draws at 0.5"""
+    from contourpy import contour_generator
+
+    lines = contour_generator(z=np.asarray(mask, dtype=np.float64), line_type='Separate').lines(0.5)
+    return [np.round(line, 2).ravel().tolist() for line in lines]
+
+
+def encode_panel_data(ctx, colors, presets=None):
+    """
+    Encode the FITS panels of a PanelContext.
+    Args:
+        ctx: PanelContext of the galaxy
+        colors: List of [cmap, ellipse_color, redshift_color]
+        presets: Contrast presets the codes must cover (e.g. config.CONTRAST_PRESETS)
+    Returns: Contents of the panel data file
+    """
+    percentile, percentile_raw = get_quantize_percentiles(presets)
+    vmax = {
+        'masked_r_band': ctx.masked_vmax(percentile),
+        'raw_r_band': ctx.raw_vmax(percentile_raw),
+    }
+    panels, blobs = [], []
+    for name, array, vmax_from in PANEL_ARRAYS:
+        codes, offset, scale = quantize(getattr(ctx, array), vmax[vmax_from])
+        panels.append({'name': name, 'offset': offset, 'scale': scale, 'vmax_from': vmax_from})
+        blobs.append(codes.tobytes())
+    height, width = ctx.raw.shape
+
+    # Overlays as drawn by _draw_panel()
+    galaxy = ctx.galaxy
+    ellipse_width = galaxy['r_r'] * 2 / 0.2
+    redshift = None
+    if galaxy['RedshiftX'] is not None and galaxy['RedshiftY'] is not None:
+        redshift = {'x': galaxy['RedshiftX'], 'y': galaxy['RedshiftY'], 'color': colors[2]}
+    header = {
+        'version': PANEL_DATA_VERSION,
+        'width': width,
+        'height': height,
+        'nan_code': NAN_CODE,
+        'panels': panels,
+        'cmap': colors[0],
+        # Canvas pixels per data pixel and dots per inch of the rendered PNGs, for the line widths
+        'pixel_scale': min(PANEL_WIDTH / width, PANEL_WIDTH * Y_AXIS_RATIO / height),
+        'dpi': OUTPUT_DPI,
+        'ellipse': {
+            'x': galaxy['X'], 'y': galaxy['Y'],
+            'width': ellipse_width, 'height': ellipse_width * galaxy['q'],
+            'angle': galaxy['PA'] + 90, 'color': colors[1],
+        },
+        'redshift': redshift,
+        'mask_contour': {'lines': mask_contour_lines(ctx.mask), 'color': colors[2]},
+    }
+    encoded = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    # Keep the codes aligned for typed array views
+    encoded += b' ' * (-(len(encoded) + 8) % 8)
+    return b''.join([PANEL_DATA_MAGIC, struct.pack('<I', len(encoded)), encoded] + blobs)
+
+
+@lru_cache(maxsize=8)
+def get_colormap_luts(names):
+    """
+    Lookup tables of colormaps for the browser.
+    Args:
+        names: Tuple of matplotlib colormap names
+    Returns: {name: base64 of 256 RGB triplets}
+    """
+    from matplotlib import colormaps
+
+    return {
+        name: base64.b64encode(colormaps[name].resampled(256)(np.arange(256), bytes=True)[:, :3].tobytes()).decode('ascii')
+        for name in names
+    }
+
+
+def _read_stored(store, galaxy_id, galaxy_dir):
+    """(bytes, mtime) of the stored panel data file, None if there is none"""
+    if store is not None:
+        entry = store.lookup(galaxy_id, PANEL_DATA_FILENAME)
+        data = store.read(galaxy_id, PANEL_DATA_FILENAME) if entry is not None else None
+        return None if data is None else (bytes(data), entry.mtime)
+    path = os.path.join(galaxy_dir, PANEL_DATA_FILENAME)
+    try:
+        with open(path, 'rb') as f:
+            return f.read(), os.fstat(f.fileno()).st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def get_panel_data(galaxy_id, data_dirs, colors=None, presets=None, galaxy_data=None, session=None):
+    """
+    Panel data file of a galaxy, encoded on first use and again when its sources changed.
+    Args:
+        galaxy_id: ID of the galaxy
+        data_dirs: Dictionary with paths to data directories
+        colors: List of [cmap, ellipse_color, redshift_color]
+        presets: Contrast presets the codes must cover
+        galaxy_data: Dictionary with galaxy parameters (if available)
+        session: SQLAlchemy session for database access
+    Returns: (bytes, mtime), None if the FITS data is not available
+    """
+    if colors is None:
+        colors = DEFAULT_COLORS
+    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
+    store = get_image_store()
+    settings_key = panel_data_settings_key(colors, presets)
+
+    stored = _read_stored(store, galaxy_id, galaxy_dir)
+    if stored is not None:
+        stale, _ = check_dependencies(read_galaxy_dependencies(galaxy_id, galaxy_dir), [PANEL_DATA_FILENAME], settings_key)
+        if not stale:
+            return stored
+
+    if galaxy_data is None:
+        galaxy_data = get_galaxy_data(galaxy_id=galaxy_id, session=session)
+    source_paths = get_source_paths(galaxy_id, galaxy_data['Nucleus'], data_dirs['base_dir'])
+    if stored is not None:
+        # Sources are known to have changed, do not trust earlier failures
+        missing_sources = get_negative_cache()
+        for path in source_paths.values():
+            missing_sources.forget(path)
+
+    from services.source_index import resolve_source_paths
+    ctx = PanelContext(galaxy_id, galaxy_data, resolve_source_paths(galaxy_id, galaxy_data['Nucleus'], data_dirs['base_dir']))
+    try:
+        data = encode_panel_data(ctx, colors, presets)
+    except Exception as e:
+        # Unreadable sources were marked bad by PanelContext; other errors are retried next time
+        if not isinstance(e, SourceUnavailable):
+            print(f"Error encoding panel data for {galaxy_id}: {e}")
+        return None
+    finally:
+        ctx.close()
+    render_counters['panel_data_encoded'] += 1
+
+    # A pack store gets the file through a private staging directory, like the renders
+    write_dir = galaxy_dir if store is None else get_staging_dir(data_dirs['output_dir'], galaxy_id)
+    ensure_dir(write_dir)
+    path = os.path.join(write_dir, PANEL_DATA_FILENAME)
+    tmp_path = make_tmp_path(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    if store is None:
+        record_dependencies(galaxy_dir, [('panel_data', PANEL_DATA_FILENAME)], source_paths, settings_key)
+    else:
+        with locked_dependencies(galaxy_dir):
+            # Re-read under the lock: another render may have packed its records since
+            record_dependencies(write_dir, [('panel_data', PANEL_DATA_FILENAME)], source_paths, settings_key,
+                                deps=read_galaxy_dependencies(galaxy_id, galaxy_dir))
+            store.pack_directory(galaxy_id, write_dir, [PANEL_DATA_FILENAME, DEPS_FILENAME])
+        shutil.rmtree(write_dir, ignore_errors=True)
+    return data, time.time()
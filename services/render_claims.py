@@ -0,0 +1,307 @@
+# services/render_claims.py
+#
+# Coordination helpers for running utils/generate_images.py on several
+# machines that share the same output directory.
+
+import os
+import json
+import time
+import shutil
+import socket
+import zlib
+import threading
+from contextlib import contextmanager
+
+CLAIMS_DIRNAME = '.claims'
+PROGRESS_DIRNAME = '.progress'
+DEFAULT_LEASE_SECONDS = 600
+
+
+def parse_shard(value):
+    """
+    Parse a shard specification of the form 'i/N'.
+    Args:
+        value: String like '0/4' (shard index is zero based)
+    Returns: (shard_index, shard_count)
+    """
+    try:
+        index_str, count_str = value.split('/')
+        index, count = int(index_str), int(count_str)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid shard '{value}', expected the form i/N")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{value}', index must be in [0, N)")
+    return index, count
+
+
+def galaxy_shard(galaxy_id, shard_count):
+    """Stable shard number of a galaxy (independent of process and host)"""
+    return zlib.crc32(galaxy_id.encode('utf-8')) % shard_count
+
+
+def default_node_name():
+    """Name identifying this worker in claim files and progress reports"""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def default_run_id():
+    """Identifier of a generation run started without an explicit one"""
+    return f"{time.strftime('%Y%m%dT%H%M%S')}-{_safe_name(default_node_name())}"
+
+
+def _safe_name(value):
+    return value.replace('/', '_').replace(os.sep, '_')
+
+
+class ClaimDirectory:
+    """
+    Lease based claims stored as lock files in a shared directory.
+
+    A claim is a file created with O_CREAT | O_EXCL, which is atomic on local
+    filesystems and on NFSv3+. Claims older than the lease are considered
+    abandoned (e.g. the node crashed) and can be taken over by another worker;
+    holders keep their lease alive with renew() (see keep_alive()).
+    """
+
+    def __init__(self, output_dir, node_name=None, lease_seconds=DEFAULT_LEASE_SECONDS):
+        self.claims_dir = os.path.join(output_dir, CLAIMS_DIRNAME)
+        self.node_name = node_name or default_node_name()
+        self.lease_seconds = lease_seconds
+        os.makedirs(self.claims_dir, exist_ok=True)
+
+    def _claim_path(self, galaxy_id):
+        return os.path.join(self.claims_dir, f"{_safe_name(galaxy_id)}.lock")
+
+    def _create(self, path):
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'node': self.node_name, 'claimed': time.time()}, f)
+
+    def _age(self, path):
+        """Seconds since the claim at path was created or renewed, None if there is none"""
+        try:
+            return time.time() - os.path.getmtime(path)
+        except FileNotFoundError:
+            return None
+
+    def _holder(self, path):
+        try:
+            with open(path) as f:
+                return json.load(f).get('node')
+        except (OSError, ValueError):
+            return None
+
+    def claim(self, galaxy_id):
+        """
+        Try to claim a galaxy.
+        Returns: True if this node now holds the claim, False if another
+                 node holds a live claim.
+        """
+        path = self._claim_path(galaxy_id)
+        try:
+            self._create(path)
+            return True
+        except FileExistsError:
+            pass
+
+        age = self._age(path)
+        if age is not None and age < self.lease_seconds:
+            return False
+
+        if age is not None:
+            # Expired lease. Removing it is only safe while nobody else can
+            # replace it in between (another contender may have judged the same
+            # claim expired and already re-created it), so takeovers of a
+            # claim are serialized by a second lock file and the age is checked
+            # again while holding it.
+            takeover_path = f"{path}.takeover"
+            try:
+                self._create(takeover_path)
+            except FileExistsError:
+                # A takeover left behind by a crash is cleared once it is as old as a lease
+                takeover_age = self._age(takeover_path)
+                if takeover_age is not None and takeover_age >= self.lease_seconds:
+                    self._remove(takeover_path)
+                return False
+            try:
+                age = self._age(path)
+                if age is not None and age < self.lease_seconds:
+                    return False
+                self._remove(path)
+            finally:
+                self._remove(takeover_path)
+
+        try:
+            self._create(path)
+            return True
+        except FileExistsError:
+            return False
+
+    def renew(self, galaxy_id):
+        """Extend the lease of a claim held by this node"""
+        try:
+            os.utime(self._claim_path(galaxy_id))
+        except FileNotFoundError:
+            pass
+
+    @contextmanager
+    def keep_alive(self, galaxy_id):
+        """Renew the claim of a galaxy in the background while the block runs (e.g. a long render)"""
+        stop = threading.Event()
+
+        def renew_loop():
+            while not stop.wait(self.lease_seconds / 3):
+                self.renew(galaxy_id)
+
+        thread = threading.Thread(target=renew_loop, name=f"claim-renew-{galaxy_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def release(self, galaxy_id):
+        """Drop a claim held by this node"""
+        path = self._claim_path(galaxy_id)
+        # Never drop a claim another node took over
+        if self._holder(path) == self.node_name:
+            self._remove(path)
+
+    def active_claims(self):
+        """Return number of live (non-expired) claims of all nodes"""
+        now = time.time()
+        count = 0
+        for entry in os.scandir(self.claims_dir):
+            if not entry.name.endswith('.lock'):
+                continue
+            try:
+                if now - entry.stat().st_mtime < self.lease_seconds:
+                    count += 1
+            except FileNotFoundError:
+                continue
+        return count
+
+
+def _done_dir(output_dir, run_id):
+    return os.path.join(output_dir, PROGRESS_DIRNAME, f"done-{_safe_name(run_id)}")
+
+
+def clear_progress(output_dir, run_id):
+    """
+    Remove the progress records and done markers of every run except run_id,
+    so a new run does not add up the counters of earlier ones.
+    """
+    progress_dir = os.path.join(output_dir, PROGRESS_DIRNAME)
+    if not os.path.isdir(progress_dir):
+        return
+    keep_done = os.path.basename(_done_dir(output_dir, run_id))
+    for name in os.listdir(progress_dir):
+        path = os.path.join(progress_dir, name)
+        if name.startswith('done-'):
+            if name != keep_done:
+                shutil.rmtree(path, ignore_errors=True)
+            continue
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(path) as f:
+                run = json.load(f).get('run')
+        except (OSError, ValueError):
+            continue
+        if run != run_id:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def mark_done(output_dir, run_id, galaxy_id):
+    """
+    Record that a galaxy has been dealt with in this run.
+    Returns: True if this worker is the first to report it, i.e. the one that
+             counts it in its progress record. Dynamic workers all walk the
+             whole catalog and would otherwise count galaxies finished by
+             another node again as skipped.
+    """
+    done_dir = _done_dir(output_dir, run_id)
+    os.makedirs(done_dir, exist_ok=True)
+    try:
+        fd = os.open(os.path.join(done_dir, _safe_name(galaxy_id)), os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+    except FileExistsError:
+        return False
+    os.close(fd)
+    return True
+
+
+def write_progress(output_dir, node_name, stats):
+    """
+    Atomically write the progress of one worker to the shared output directory.
+    Args:
+        output_dir: Shared output directory
+        node_name: Name of the worker
+        stats: Dictionary with counters (run, total, generated, skipped, errors, ...)
+    """
+    progress_dir = os.path.join(output_dir, PROGRESS_DIRNAME)
+    os.makedirs(progress_dir, exist_ok=True)
+    path = os.path.join(progress_dir, f"{_safe_name(node_name)}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(stats, node=node_name, updated=time.time()), f)
+    os.replace(tmp_path, path)
+
+
+def read_progress(output_dir, run_id=None):
+    """
+    Return list of progress records of the workers of one run.
+    Args:
+        output_dir: Shared output directory
+        run_id: Run to report, defaults to the most recently started one
+    """
+    progress_dir = os.path.join(output_dir, PROGRESS_DIRNAME)
+    if not os.path.isdir(progress_dir):
+        return []
+    records = []
+    for name in sorted(os.listdir(progress_dir)):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(progress_dir, name)) as f:
+                records.append(json.load(f))
+        except (OSError, ValueError):
+            continue  # Being replaced right now
+    if run_id is None and records:
+        run_id = max(records, key=lambda r: r.get('started', 0)).get('run')
+    return [r for r in records if r.get('run') == run_id]
+
+
+def merge_progress(records):
+    """
+    Merge the progress records of one run into a single summary.
+    Every galaxy is counted by one worker only (see mark_done()), so the
+    counters add up to at most the total.
+    Returns: Dictionary with summed counters and the per-worker records
+    """
+    counters = ('processed', 'generated', 'skipped', 'errors', 'claimed_elsewhere', 'done_elsewhere')
+    summary = {name: sum(r.get(name, 0) for r in records) for name in counters}
+
+    # Static shards each know the size of their own partition, dynamic
+    # workers all see the whole catalog.
+    shard_totals = {}
+    catalog_total = 0
+    for r in records:
+        if r.get('shard'):
+            shard_totals[r['shard']] = r.get('total', 0)
+        else:
+            catalog_total = max(catalog_total, r.get('total', 0))
+    summary['total'] = max(sum(shard_totals.values()), catalog_total)
+    summary['run'] = records[0].get('run') if records else None
+    summary['finished_workers'] = sum(1 for r in records if r.get('finished'))
+    summary['workers'] = records
+    return summary
@@ -0,0 +1,191 @@
+# services/render_deps.py
+#
+# Make-style dependency tracking of rendered images. Every galaxy directory
+# has a .deps.json recording, per rendered file, the (mtime, size) of the
+# source files it was made from and a key of the render settings. A variant
+# is stale when a source changed (e.g. GALFIT rerun replaced the imgblock),
+# appeared or disappeared, or when the settings or RENDER_ENGINE_VERSION
+# changed; only stale galaxies are rendered again.
+#
+# Updates of .deps.json are read-modify-write under an flock of the galaxy
+# directory, so concurrent renders of different panels keep each other's
+# records. Serving checks are cached for a short TTL (CheckCache).
+
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from services.atomic_files import make_tmp_path
+
+DEPS_FILENAME = '.deps.json'
+DEPS_LOCK_FILENAME = '.deps.lock'
+
+# Bump when a change of the rendering code should invalidate existing images
+RENDER_ENGINE_VERSION = 1
+
+# Source files each rendered panel is made from (keys of get_source_paths());
+# the colour panels are not rendered, see get_color_images()
+PANEL_SOURCES = {
+    'masked_r_band': ('imgblock', 'mask'),
+    'galfit_model': ('imgblock',),
+    'residual': ('imgblock',),
+    'raw_r_band': ('imgblock',),
+    'panel_data': ('imgblock', 'mask'),  # All four quantized, services/panel_data.py
+}
+
+
+def render_settings_key(colors, add_titles=False):
+    """Short hash of everything besides the sources and the contrast that changes a render"""
+    import config
+    payload = json.dumps({
+        'engine': RENDER_ENGINE_VERSION,
+        'colors': list(colors),
+        'titles': bool(add_titles),
+        'limits': config.FITS_PERCENTILE_LIMITS,
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def source_signature(path):
+    """[mtime_ns, size] of a source file, None if it does not exist"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_dependencies(galaxy_dir):
+    """Dependency records of a galaxy directory: {filename: entry}"""
+    try:
+        with open(os.path.join(galaxy_dir, DEPS_FILENAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+@contextmanager
+def locked_dependencies(galaxy_dir):
+    """Exclusive lock of a galaxy's dependency records across processes, held for a read-modify-write"""
+    import fcntl
+    os.makedirs(galaxy_dir, exist_ok=True)
+    with open(os.path.join(galaxy_dir, DEPS_LOCK_FILENAME), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        yield
+
+
+def record_dependencies(galaxy_dir, files, source_paths, settings_key, deps=None, used_paths=None, placeholders=()):
+    """
+    Record the current sources of rendered files.
+    Args:
+        galaxy_dir: Output directory of the galaxy
+        files: (base_name, filename) pairs of the files just rendered
+        source_paths: Result of get_source_paths() for the galaxy
+        settings_key: render_settings_key() used for the render
+        deps: Records to update; the caller must hold locked_dependencies() since reading
+              them. If None, they are read from galaxy_dir under the lock
+        used_paths: Source paths the render actually read (resolve_source_paths(), None for
+                    files it skipped); those sources are recorded as missing
+        placeholders: Filenames that hold a placeholder instead of a render; all their
+                      sources are recorded as missing, so they turn stale (and are
+                      retried) as long as the sources exist
+    """
+    if deps is None:
+        with locked_dependencies(galaxy_dir):
+            # Re-read under the lock: another render may have recorded its files since
+            _write_dependencies(galaxy_dir, read_dependencies(galaxy_dir), files, source_paths,
+                                settings_key, used_paths, placeholders)
+    else:
+        _write_dependencies(galaxy_dir, dict(deps), files, source_paths, settings_key, used_paths, placeholders)
+
+
+def _write_dependencies(galaxy_dir, deps, files, source_paths, settings_key, used_paths, placeholders):
+    signatures = {}
+    for base_name, filename in files:
+        sources = {}
+        for kind in PANEL_SOURCES[base_name]:
+            path = source_paths[kind]
+            if filename in placeholders or (used_paths is not None and used_paths[kind] is None):
+                sources[kind] = [path, None]
+                continue
+            if path not in signatures:
+                signatures[path] = source_signature(path)
+            sources[kind] = [path, signatures[path]]
+        deps[filename] = {'sources': sources, 'settings': settings_key}
+
+    path = os.path.join(galaxy_dir, DEPS_FILENAME)
+    tmp_path = make_tmp_path(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(deps, f)
+    os.replace(tmp_path, path)
+
+
+def check_dependencies(deps, filenames, settings_key):
+    """
+    Compare rendered files against their recorded sources.
+    Args:
+        deps: read_dependencies() of the galaxy directory
+        filenames: Existing rendered files to check
+        settings_key: render_settings_key() of the requested render
+    Returns: (stale filenames, filenames without a record)
+    """
+    stale, unknown = [], []
+    signatures = {}
+    for filename in filenames:
+        entry = deps.get(filename)
+        if entry is None:
+            unknown.append(filename)
+            continue
+        if entry.get('settings') != settings_key:
+            stale.append(filename)
+            continue
+        for path, signature in entry['sources'].values():
+            if path not in signatures:
+                signatures[path] = source_signature(path)
+            if signatures[path] != signature:
+                stale.append(filename)
+                break
+    return stale, unknown
+
+
+class CheckCache:
+    """
+    Rendered files recently found current, so serving them does not read
+    .deps.json and stat the sources on every request. Only current results
+    are cached: a stale file is rendered again, which records it as current.
+    A source replaced within the TTL is picked up once the entry expires.
+    """
+
+    def __init__(self, ttl, max_entries=100000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> checked_at
+        self._lock = threading.Lock()
+
+    def is_current(self, key):
+        with self._lock:
+            checked_at = self._entries.get(key)
+        return checked_at is not None and time.monotonic() - checked_at <= self.ttl
+
+    def add(self, key):
+        with self._lock:
+            self._entries[key] = time.monotonic()
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+_check_cache = None
+
+
+def get_check_cache():
+    """Return the process wide CheckCache"""
+    global _check_cache
+    if _check_cache is None:
+        import config
+        _check_cache = CheckCache(ttl=config.RENDER_DEPS_CHECK_TTL)
+    return _check_cache
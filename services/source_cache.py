@@ -0,0 +1,97 @@
+# services/source_cache.py
+#
+# Negative cache of source files (imgblocks, masks, colour images) that are
+# missing or could not be read. A render that finds its source in here skips
+# straight to the shared placeholder instead of probing the data disk again.
+#
+# Within the TTL an entry is trusted without touching the disk. After it, the
+# entry is revalidated with one stat: a missing file is looked up again (and
+# its directory mtime compared), an unreadable one is kept only while its
+# mtime and size are unchanged, so a GALFIT rerun replacing the file is
+# picked up on the next render after the TTL.
+
+import os
+import time
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL = 600  # seconds
+MAX_ENTRIES = 100000
+
+
+def _signature(path):
+    """What a cached failure is valid for: the file's (mtime, size), or its directory's mtime if missing"""
+    try:
+        st = os.stat(path)
+        return ('file', st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        pass
+    except OSError:
+        return ('error',)
+    try:
+        return ('missing', os.stat(os.path.dirname(path)).st_mtime_ns)
+    except OSError:
+        return ('missing', None)
+
+
+class NegativeCache:
+    """Source paths known to be missing or unreadable"""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_entries=MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self._entries = OrderedDict()  # path -> (checked_at, signature)
+        self._lock = threading.Lock()
+
+    def mark_bad(self, path):
+        """Remember that a source could not be used"""
+        entry = (time.monotonic(), _signature(path))
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def is_bad(self, path):
+        """True if the source is known to be missing or unreadable and has not changed since"""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return False
+
+        checked_at, signature = entry
+        now = time.monotonic()
+        if now - checked_at > self.ttl:
+            if _signature(path) != signature:
+                self.forget(path)
+                return False
+            with self._lock:
+                self._entries[path] = (now, signature)
+        self.hits += 1
+        return True
+
+    def forget(self, path):
+        with self._lock:
+            self._entries.pop(path, None)
+
+    def exists(self, path):
+        """os.path.exists() for sources, answered from the cache for known-missing files"""
+        if self.is_bad(path):
+            return False
+        if os.path.exists(path):
+            return True
+        self.mark_bad(path)
+        return False
+
+
+_cache = None
+
+
+def get_negative_cache():
+    """Return the process wide NegativeCache"""
+    global _cache
+    if _cache is None:
+        import config
+        _cache = NegativeCache(ttl=config.SOURCE_NEGATIVE_CACHE_TTL)
+    return _cache
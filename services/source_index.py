@@ -0,0 +1,189 @@
+# services/source_index.py
+#
+# Index of the source data under DATA_BASE_DIR (imgblocks, masks, colour
+# images) in the source_files table, filled by utils/index_sources.py.
+# A directory is only rescanned when its mtime changed (files were added,
+# removed or replaced by a rename), so after the first scan an update costs
+# one stat per directory. With SOURCE_INDEX_ENABLED, renders take source
+# availability from the index instead of discovering it by failing to open
+# files on the data disk.
+
+import os
+import re
+
+from sqlalchemy import select, func, exists, case, insert, update, delete, bindparam
+
+import config
+from models.galaxy import Galaxy, SourceFile, SourceDirectory
+
+SOURCE_KINDS = ('imgblock', 'unmasked_imgblock', 'mask', 'aplpy', 'lupton')
+
+_IMGBLOCK_PATTERN = re.compile(r'^imgblock_(.+)\.fits$')
+_MASK_PATTERN = re.compile(r'^mask(.+)\.fits$')
+_PNG_PATTERN = re.compile(r'^(.+)\.png$')
+
+
+def get_source_directories():
+    """
+    Directories holding source data, in the layout used by get_source_paths().
+    Returns: List of (relative directory, kind, component, filename pattern)
+    """
+    imgblocks = config.DATA_SUBDIRS['imgblocks']
+    directories = []
+    for component in ('single', 'double'):
+        directories.append((f"{imgblocks}/{component}_component", 'imgblock', component, _IMGBLOCK_PATTERN))
+        directories.append((f"{imgblocks}/{component}_component_unmasked", 'unmasked_imgblock', component, _IMGBLOCK_PATTERN))
+    directories.append((config.DATA_SUBDIRS['masks'], 'mask', None, _MASK_PATTERN))
+    directories.append((config.DATA_SUBDIRS['aplpy_images'], 'aplpy', None, _PNG_PATTERN))
+    directories.append((config.DATA_SUBDIRS['lupton_images'], 'lupton', None, _PNG_PATTERN))
+    return directories
+
+
+def component_of(nucleus):
+    """GALFIT component type of a galaxy, as in get_source_paths()"""
+    return 'double' if nucleus == 1 else 'single'
+
+
+def _scan_directory(base_dir, rel_dir, pattern):
+    """Source files of one directory: {relative path: (galaxy_id, size, mtime)}"""
+    found = {}
+    try:
+        entries = os.scandir(os.path.join(base_dir, rel_dir))
+    except FileNotFoundError:
+        return found
+    with entries:
+        for entry in entries:
+            m = pattern.match(entry.name)
+            if not m or not entry.is_file():
+                continue
+            st = entry.stat()
+            found[f"{rel_dir}/{entry.name}"] = (m.group(1), st.st_size, st.st_mtime)
+    return found
+
+
+def index_sources(session, base_dir, full=False):
+    """
+    Bring source_files up to date with the data directories.
+    Args:
+        session: SQLAlchemy session
+        base_dir: DATA_BASE_DIR
+        full: Rescan every directory, also those with an unchanged mtime
+              (needed after files were rewritten in place)
+    Returns: Dictionary of counts (directories scanned/skipped, files added/updated/removed)
+    """
+    stats = dict(scanned=0, skipped=0, added=0, updated=0, removed=0)
+    for rel_dir, kind, component, pattern in get_source_directories():
+        try:
+            dir_mtime = os.stat(os.path.join(base_dir, rel_dir)).st_mtime
+        except FileNotFoundError:
+            dir_mtime = 0.0
+        directory = session.get(SourceDirectory, rel_dir)
+        if not full and directory is not None and directory.mtime == dir_mtime:
+            stats['skipped'] += 1
+            continue
+
+        # The mtime is taken before scanning: files added meanwhile trigger the next rescan
+        found = _scan_directory(base_dir, rel_dir, pattern)
+        query = select(SourceFile.id, SourceFile.path, SourceFile.size, SourceFile.mtime).where(SourceFile.kind == kind)
+        if component is None:
+            query = query.where(SourceFile.component.is_(None))
+        else:
+            query = query.where(SourceFile.component == component)
+        existing = {row.path: row for row in session.execute(query)}
+
+        new_rows = [
+            dict(galaxy_id=galaxy_id, kind=kind, component=component, path=path, size=size, mtime=mtime)
+            for path, (galaxy_id, size, mtime) in found.items() if path not in existing
+        ]
+        if new_rows:
+            session.execute(insert(SourceFile), new_rows)
+        changed = [
+            dict(id=existing[path].id, size=size, mtime=mtime)
+            for path, (_, size, mtime) in found.items()
+            if path in existing and (existing[path].size, existing[path].mtime) != (size, mtime)
+        ]
+        if changed:
+            table = SourceFile.__table__
+            session.execute(
+                update(table).where(table.c.id == bindparam('row_id'))
+                .values(size=bindparam('new_size'), mtime=bindparam('new_mtime')),
+                [{'row_id': c['id'], 'new_size': c['size'], 'new_mtime': c['mtime']} for c in changed],
+            )
+        vanished = [row.id for path, row in existing.items() if path not in found]
+        for i in range(0, len(vanished), 500):
+            session.execute(delete(SourceFile).where(SourceFile.id.in_(vanished[i:i + 500])))
+
+        if directory is None:
+            directory = SourceDirectory(path=rel_dir)
+            session.add(directory)
+        directory.mtime = dir_mtime
+        directory.file_count = len(found)
+        session.commit()
+
+        stats['scanned'] += 1
+        stats['added'] += len(new_rows)
+        stats['updated'] += len(changed)
+        stats['removed'] += len(vanished)
+    return stats
+
+
+def lookup_source_paths(session, galaxy_id, nucleus, base_dir):
+    """
+    Indexed source files of a galaxy.
+    Returns: Dictionary with the keys of get_source_paths(); None where the file is not available
+    """
+    component = component_of(nucleus)
+    paths = dict.fromkeys(SOURCE_KINDS)
+    rows = session.execute(
+        select(SourceFile.kind, SourceFile.component, SourceFile.path).where(SourceFile.galaxy_id == galaxy_id)
+    )
+    for row in rows:
+        if row.component is None or row.component == component:
+            paths[row.kind] = os.path.join(base_dir, row.path)
+    return paths
+
+
+def resolve_source_paths(galaxy_id, nucleus, base_dir, session=None):
+    """
+    Source paths of a galaxy for rendering.
+    With SOURCE_INDEX_ENABLED, files missing from the index are None, so the
+    render skips them without touching the data disk; otherwise the paths of
+    get_source_paths() are returned as they are.
+    """
+    from services.fits_processor import get_source_paths
+    if not config.SOURCE_INDEX_ENABLED:
+        return get_source_paths(galaxy_id, nucleus, base_dir)
+
+    if session is not None:
+        return lookup_source_paths(session, galaxy_id, nucleus, base_dir)
+    from models.database import get_sessionmaker
+    with get_sessionmaker()() as session:
+        return lookup_source_paths(session, galaxy_id, nucleus, base_dir)
+
+
+def availability_report(session):
+    """
+    How many catalog galaxies lack each kind of source file.
+    Imgblocks count only for the galaxy's own component type.
+    Returns: Dictionary with the galaxy total, {kind: missing count} and the
+             number of indexed files whose galaxy is not in the catalog
+    """
+    galaxy_component = case((Galaxy.nucleus == True, 'double'), else_='single')  # noqa: E712
+    missing = {}
+    for kind in SOURCE_KINDS:
+        available = exists().where(
+            SourceFile.galaxy_id == Galaxy.id,
+            SourceFile.kind == kind,
+            (SourceFile.component.is_(None)) | (SourceFile.component == galaxy_component),
+        )
+        missing[kind] = session.scalar(select(func.count()).select_from(Galaxy).where(~available))
+
+    orphans = session.scalar(
+        select(func.count()).select_from(SourceFile)
+        .where(~exists().where(Galaxy.id == SourceFile.galaxy_id))
+    )
+    return {
+        'galaxies': session.scalar(select(func.count()).select_from(Galaxy)),
+        'missing': missing,
+        'orphan_files': orphans,
+    }
@@ -0,0 +1,214 @@
+# services/spatial.py
+#
+# Spatial index over galaxy coordinates for sky-region browsing.
+# Galaxies are kept sorted by declination, so a cone or box query is a binary
+# search for the declination band followed by a vectorised exact test on the
+# band only. Built per process from the catalog snapshot, and rebuilt when
+# get_catalog() reloads a rebuilt snapshot; without a snapshot it is built once
+# from the database.
+
+import threading
+
+import numpy as np
+
+from models.galaxy import Galaxy, Classification, SkippedGalaxy
+
+STATES = ('unclassified', 'classified', 'skipped')
+
+# Starting radius (degrees) of the expanding nearest-unclassified search
+NEAREST_START_RADIUS = 0.05
+
+
+def angular_distance(ra1, dec1, ra2, dec2):
+    """Great-circle distance in degrees (haversine), vectorised"""
+    ra1, dec1, ra2, dec2 = map(np.radians, (ra1, dec1, ra2, dec2))
+    a = (np.sin((dec2 - dec1) / 2) ** 2
+         + np.cos(dec1) * np.cos(dec2) * np.sin((ra2 - ra1) / 2) ** 2)
+    return np.degrees(2 * np.arcsin(np.sqrt(np.clip(a, 0, 1))))
+
+
+class SpatialIndex:
+    """Declination-sorted coordinate index"""
+
+    def __init__(self, ids, ra, dec, has_redshift):
+        order = np.argsort(dec, kind='stable')
+        self.ids = np.asarray(ids)[order]
+        self.ra = np.asarray(ra, dtype=np.float64)[order]
+        self.dec = np.asarray(dec, dtype=np.float64)[order]
+        self.has_redshift = np.asarray(has_redshift, dtype=bool)[order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def galaxy_id(self, row):
+        value = self.ids[row]
+        return value.decode('utf-8') if isinstance(value, bytes) else str(value)
+
+    def _dec_band(self, dec_min, dec_max):
+        start = np.searchsorted(self.dec, dec_min, side='left')
+        stop = np.searchsorted(self.dec, dec_max, side='right')
+        return np.arange(start, stop)
+
+    def cone(self, ra, dec, radius):
+        """
+        Rows within `radius` degrees of (ra, dec).
+        Returns: (rows, distances) sorted by distance
+        """
+        rows = self._dec_band(dec - radius, dec + radius)
+        distances = angular_distance(ra, dec, self.ra[rows], self.dec[rows])
+        inside = distances <= radius
+        rows, distances = rows[inside], distances[inside]
+        order = np.argsort(distances, kind='stable')
+        return rows[order], distances[order]
+
+    def box(self, ra_min, ra_max, dec_min, dec_max):
+        """
+        Rows inside an ra/dec box; ra_min > ra_max wraps through ra = 0.
+        Returns: rows sorted by declination
+        """
+        rows = self._dec_band(dec_min, dec_max)
+        ra = self.ra[rows]
+        if ra_min <= ra_max:
+            inside = (ra >= ra_min) & (ra <= ra_max)
+        else:
+            inside = (ra >= ra_min) | (ra <= ra_max)
+        return rows[inside]
+
+    def _encode_ids(self, galaxy_ids):
+        galaxy_ids = list(galaxy_ids)
+        if self.ids.dtype.kind == 'S':
+            return np.array([g.encode('utf-8') for g in galaxy_ids], dtype=self.ids.dtype)
+        return np.array(galaxy_ids, dtype=object)
+
+    def member_mask(self, rows, galaxy_ids):
+        """Boolean mask over rows, True where the galaxy ID is in galaxy_ids"""
+        if not galaxy_ids:
+            return np.zeros(len(rows), dtype=bool)
+        return np.isin(self.ids[rows], self._encode_ids(galaxy_ids))
+
+
+def _build_index(catalog):
+    if catalog is not None:
+        table = catalog.galaxies
+        return SpatialIndex(table['id'], table['ra'], table['dec'], catalog.has_redshift_mask())
+
+    from models.database import get_sessionmaker
+    with get_sessionmaker()() as session:
+        rows = session.query(
+            Galaxy.id, Galaxy.ra, Galaxy.dec, Galaxy.redshift_x, Galaxy.redshift_y
+        ).all()
+    return SpatialIndex(
+        [r.id for r in rows],
+        [r.ra for r in rows],
+        [r.dec for r in rows],
+        [r.redshift_x is not None and r.redshift_y is not None for r in rows],
+    )
+
+
+_index = None
+_index_catalog = None  # Snapshot the index was built from; a new one after every reload
+_index_lock = threading.Lock()
+
+
+def get_spatial_index():
+    """Return the process wide SpatialIndex, built on first use and after the catalog snapshot changed"""
+    global _index, _index_catalog
+    from services.catalog import get_catalog
+    catalog = get_catalog()  # Checks the manifest signature
+    if _index is None or catalog is not _index_catalog:
+        with _index_lock:
+            if _index is None or catalog is not _index_catalog:
+                _index = _build_index(catalog)
+                _index_catalog = catalog
+    return _index
+
+
+def get_user_state_ids(session, user_id):
+    """
+    IDs of the galaxies the user has classified and skipped.
+    Returns: (classified_ids, skipped_ids) as sets
+    """
+    classified = {r[0] for r in session.query(Classification.galaxy_id).filter(Classification.user_id == user_id)}
+    skipped = {r[0] for r in session.query(SkippedGalaxy.galaxy_id).filter(SkippedGalaxy.user_id == user_id)}
+    return classified, skipped
+
+
+def _row_states(index, rows, classified_ids, skipped_ids):
+    """Array of state names for rows; a classification wins over a skip"""
+    states = np.full(len(rows), 'unclassified', dtype=object)
+    states[index.member_mask(rows, skipped_ids)] = 'skipped'
+    states[index.member_mask(rows, classified_ids)] = 'classified'
+    return states
+
+
+def find_in_region(session, user_id, cone=None, box=None, state=None, with_redshift=None, limit=500):
+    """
+    List galaxies in a sky region.
+    Args:
+        session: SQLAlchemy session
+        user_id: ID of the user, for the classification state
+        cone: (ra, dec, radius) in degrees, results sorted by distance
+        box: (ra_min, ra_max, dec_min, dec_max) in degrees, results sorted by dec
+        state: None, 'unclassified', 'classified' or 'skipped'
+        with_redshift: None, True or False
+        limit: Maximum number of galaxies returned
+    Returns: Dictionary with the total number of matches and the galaxies
+    """
+    index = get_spatial_index()
+    distances = None
+    if cone is not None:
+        rows, distances = index.cone(*cone)
+    else:
+        rows = index.box(*box)
+
+    keep = np.ones(len(rows), dtype=bool)
+    if with_redshift is not None:
+        keep &= index.has_redshift[rows] == with_redshift
+
+    classified_ids, skipped_ids = get_user_state_ids(session, user_id)
+    states = _row_states(index, rows, classified_ids, skipped_ids)
+    if state is not None:
+        keep &= states == state
+
+    rows, states = rows[keep], states[keep]
+    if distances is not None:
+        distances = distances[keep]
+
+    galaxies = []
+    for i in range(min(limit, len(rows))):
+        row = rows[i]
+        item = {
+            'id': index.galaxy_id(row),
+            'ra': float(index.ra[row]),
+            'dec': float(index.dec[row]),
+            'has_redshift': bool(index.has_redshift[row]),
+            'state': states[i],
+        }
+        if distances is not None:
+            item['distance'] = float(distances[i])
+        galaxies.append(item)
+    return {'total': int(len(rows)), 'galaxies': galaxies}
+
+
+def find_nearest_unclassified(session, user_id, ra, dec, with_redshift=None):
+    """
+    Nearest galaxy to (ra, dec) the user has neither classified nor skipped.
+    The search radius doubles until a match is found or the whole sky is covered.
+    Returns: (galaxy_id, distance in degrees) or (None, None)
+    """
+    index = get_spatial_index()
+    classified_ids, skipped_ids = get_user_state_ids(session, user_id)
+    done_ids = classified_ids | skipped_ids
+
+    radius = NEAREST_START_RADIUS
+    while True:
+        rows, distances = index.cone(ra, dec, radius)
+        keep = ~index.member_mask(rows, done_ids)
+        if with_redshift is not None:
+            keep &= index.has_redshift[rows] == with_redshift
+        if keep.any():
+            first = np.argmax(keep)
+            return index.galaxy_id(rows[first]), float(distances[first])
+        if radius >= 180:
+            return None, None
+        radius = min(radius * 2, 180)
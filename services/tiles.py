@@ -0,0 +1,267 @@
+# services/tiles.py
+#
+# Deep-zoom tile pyramid of the raw r-band panel.
+# Level 0 shows the whole cutout in a single tile, every further level doubles
+# the resolution. Levels past the native resolution oversample the data so
+# classifiers can inspect faint outskirts pixel by pixel.
+
+import os
+import json
+import math
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from services.atomic_files import make_tmp_path
+
+TILE_SIZE = 256
+MAX_OVERZOOM_LEVELS = 2  # Levels beyond native resolution (x2, x4)
+
+
+def get_pyramid_geometry(height, width, tile_size=TILE_SIZE, overzoom=MAX_OVERZOOM_LEVELS):
+    """
+    Compute the zoom levels of a pyramid for an image of the given shape.
+    Returns: Dictionary with width, height, tile_size, native_level and max_level
+    """
+    native_level = max(0, math.ceil(math.log2(max(height, width) / tile_size)))
+    return {
+        'width': int(width),
+        'height': int(height),
+        'tile_size': tile_size,
+        'native_level': native_level,
+        'max_level': native_level + overzoom,
+    }
+
+
+def get_level_shape(geometry, level):
+    """Pixel shape (height, width) of the whole image at a zoom level"""
+    scale = 2.0 ** (level - geometry['native_level'])
+    return (max(1, round(geometry['height'] * scale)),
+            max(1, round(geometry['width'] * scale)))
+
+
+def get_tile_counts(geometry, level):
+    """Number of tiles (columns, rows) at a zoom level"""
+    height, width = get_level_shape(geometry, level)
+    tile_size = geometry['tile_size']
+    return math.ceil(width / tile_size), math.ceil(height / tile_size)
+
+
+class TileSource:
+    """
+    Colour mapped raw r-band data ready to be cut into tiles.
+    Normalisation uses the whole cutout, so neighbouring tiles match.
+    """
+
+    def __init__(self, data, vmax, cmap='viridis', tile_size=TILE_SIZE, overzoom=MAX_OVERZOOM_LEVELS):
+        from matplotlib import colormaps
+
+        data = np.asarray(data, dtype=np.float32)
+        vmin = float(np.nanmin(data))
+        span = (float(vmax) - vmin) or 1.0
+        normed = np.clip((data - vmin) / span, 0, 1)
+        # imshow draws NaN pixels transparent, keep them that way
+        self.rgba = colormaps[cmap](np.nan_to_num(normed), bytes=True)
+        self.rgba[np.isnan(data)] = 0
+        self.geometry = dict(
+            get_pyramid_geometry(data.shape[0], data.shape[1], tile_size, overzoom),
+            vmin=vmin, vmax=float(vmax), cmap=cmap,
+        )
+        # Levels up to native resolution; together about a third more than the cutout itself
+        self._levels = {}
+
+    def level_image(self, level):
+        """PIL image of the whole cutout resampled to a zoom level (at most native resolution)"""
+        from PIL import Image
+
+        level = min(level, self.geometry['native_level'])
+        if level not in self._levels:
+            height, width = get_level_shape(self.geometry, level)
+            image = Image.fromarray(self.rgba, 'RGBA')
+            if (height, width) != self.rgba.shape[:2]:
+                image = image.resize((width, height), Image.BOX)
+            self._levels[level] = image
+        return self._levels[level]
+
+    def render_tile(self, level, x, y):
+        """
+        Render one tile.
+        Returns: PIL image, or None if the tile lies outside of the pyramid
+        """
+        if not 0 <= level <= self.geometry['max_level']:
+            return None
+        columns, rows = get_tile_counts(self.geometry, level)
+        if not (0 <= x < columns and 0 <= y < rows):
+            return None
+        tile_size = self.geometry['tile_size']
+        height, width = get_level_shape(self.geometry, level)
+        box = (x * tile_size, y * tile_size,
+               min((x + 1) * tile_size, width), min((y + 1) * tile_size, height))
+        overzoom = level - self.geometry['native_level']
+        if overzoom <= 0:
+            return self.level_image(level).crop(box)
+
+        # Oversampled levels are never resampled whole (x4 is 16 times the
+        # cutout); the tile is cut from the native image and enlarged alone
+        from PIL import Image
+
+        factor = 2 ** overzoom
+        native_box = tuple(edge // factor for edge in box)
+        tile = self.level_image(level).crop(native_box)
+        return tile.resize((box[2] - box[0], box[3] - box[1]), Image.NEAREST)
+
+
+def source_signature(path):
+    """Signature of a source file that changes when it is rewritten (e.g. a GALFIT rerun)"""
+    st = os.stat(path)
+    return f"{st.st_mtime_ns}-{st.st_size}"
+
+
+def get_tile_path(tiles_dir, level, x, y):
+    return os.path.join(tiles_dir, str(level), f"{x}_{y}.png")
+
+
+def write_tile_meta(tiles_dir, geometry):
+    os.makedirs(tiles_dir, exist_ok=True)
+    tmp_path = make_tmp_path(os.path.join(tiles_dir, 'meta.json'))
+    with open(tmp_path, 'w') as f:
+        json.dump(geometry, f)
+    os.replace(tmp_path, os.path.join(tiles_dir, 'meta.json'))
+
+
+def read_tile_meta(tiles_dir):
+    try:
+        with open(os.path.join(tiles_dir, 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_current_meta(tiles_dir, signature):
+    """
+    Pyramid geometry of tiles_dir if its tiles were cut from the source with
+    the given signature (stored in meta.json). Tiles of an earlier version of
+    the source are removed and None is returned.
+    """
+    meta = read_tile_meta(tiles_dir)
+    if meta is not None and meta.get('source') == signature:
+        return meta
+    if os.path.isdir(tiles_dir):
+        for name in os.listdir(tiles_dir):
+            if name.isdigit():
+                shutil.rmtree(os.path.join(tiles_dir, name), ignore_errors=True)
+        try:
+            os.remove(os.path.join(tiles_dir, 'meta.json'))
+        except FileNotFoundError:
+            pass
+    return None
+
+
+def save_tile(tile, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = make_tmp_path(path)
+    tile.save(tmp_path, format='PNG')
+    os.replace(tmp_path, path)
+
+
+def generate_tile_pyramid(data, tiles_dir, vmax, cmap='viridis', signature=None):
+    """
+    Write all tiles of all levels for the given raw r-band data.
+    Args:
+        data: Raw r-band image (already scaled to flux units)
+        tiles_dir: Output directory (see fits_processor.get_tiles_dir)
+        vmax: Upper limit of the colour scale
+        cmap: Matplotlib colormap name
+        signature: source_signature() of the imgblock the data comes from
+    Returns: Pyramid geometry dictionary
+    """
+    source = TileSource(data, vmax, cmap)
+    geometry = dict(source.geometry, source=signature)
+    for level in range(geometry['max_level'] + 1):
+        columns, rows = get_tile_counts(geometry, level)
+        for y in range(rows):
+            for x in range(columns):
+                save_tile(source.render_tile(level, x, y), get_tile_path(tiles_dir, level, x, y))
+    write_tile_meta(tiles_dir, geometry)
+    return geometry
+
+
+class TileSourceCache:
+    """
+    Small LRU of decoded tile sources, so the tile requests of one zoom
+    gesture do not reopen the same FITS file.
+    """
+
+    def __init__(self, max_size=8):
+        self.max_size = max_size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, loader):
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        source = loader()
+        with self._lock:
+            self._items[key] = source
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+        return source
+
+
+_source_cache = TileSourceCache()
+
+
+def load_tile_source(imgblock_path, vmax_percentile_raw, cmap='viridis'):
+    """Decode raw r-band data of an imgblock into a TileSource"""
+    from astropy.io import fits
+    from services.fits_processor import ONE_JANSKY_ARCSEC_KIDS
+
+    data = fits.getdata(imgblock_path, ext=1) * ONE_JANSKY_ARCSEC_KIDS
+    vmax = np.percentile(data, vmax_percentile_raw)
+    return TileSource(data, vmax, cmap)
+
+
+def _get_tile_source(imgblock_path, signature, vmax_percentile_raw, cmap):
+    # The signature in the key drops sources decoded from an older imgblock
+    return _source_cache.get(
+        (imgblock_path, signature, vmax_percentile_raw, cmap),
+        lambda: load_tile_source(imgblock_path, vmax_percentile_raw, cmap),
+    )
+
+
+def get_tile(tiles_dir, imgblock_path, level, x, y, vmax_percentile_raw, cmap='viridis'):
+    """
+    Return path of a tile, rendering and caching it on first request.
+    Tiles cut from an earlier version of the imgblock are rendered again.
+    Returns: Path to the tile PNG, or None if the tile does not exist
+    """
+    signature = source_signature(imgblock_path)
+    meta = read_current_meta(tiles_dir, signature)
+    path = get_tile_path(tiles_dir, level, x, y)
+    if meta is not None and os.path.exists(path):
+        return path
+
+    source = _get_tile_source(imgblock_path, signature, vmax_percentile_raw, cmap)
+    tile = source.render_tile(level, x, y)
+    if tile is None:
+        return None
+    if meta is None:
+        # Before the tile, so other workers do not take it for a stale one
+        write_tile_meta(tiles_dir, dict(source.geometry, source=signature))
+    save_tile(tile, path)
+    return path
+
+
+def get_tile_meta(tiles_dir, imgblock_path, vmax_percentile_raw, cmap='viridis'):
+    """Return pyramid geometry, decoding the imgblock only if it was never tiled or changed since"""
+    signature = source_signature(imgblock_path)
+    meta = read_current_meta(tiles_dir, signature)
+    if meta is None:
+        source = _get_tile_source(imgblock_path, signature, vmax_percentile_raw, cmap)
+        meta = dict(source.geometry, source=signature)
+        write_tile_meta(tiles_dir, meta)
+    return meta
@@ -0,0 +1,94 @@
+# services/write_queue.py
+#
+# Optional group commit for classification writes (WRITE_QUEUE_ENABLED).
+# Request handlers hand their write to a single writer thread and wait on a
+# future; the writer collects the writes arriving within a short window and
+# commits them in one transaction. On SQLite this replaces one database lock
+# acquisition and fsync per submission with one per batch.
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from sqlalchemy.orm import sessionmaker
+
+_STOP = object()
+
+
+class WriteQueue:
+    """
+    Single writer thread committing queued writes in groups.
+    A write is a callable taking a SQLAlchemy session; it must not commit.
+    """
+
+    def __init__(self, engine, window_ms=5, max_batch=256):
+        self.Session = sessionmaker(bind=engine)
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self.commits = 0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='write-queue', daemon=True)
+        self._thread.start()
+
+    def submit(self, write):
+        """
+        Queue a write.
+        Returns: Future resolving to the write's return value once it is committed
+        """
+        future = Future()
+        self._queue.put((write, future))
+        return future
+
+    def close(self):
+        """Commit what is queued and stop the writer"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _collect(self):
+        """Block for the first write, then gather more until the window closes"""
+        item = self._queue.get()
+        if item is _STOP:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)
+                break
+            batch.append(item)
+        return batch
+
+    def _commit(self, batch):
+        """Apply and commit a batch; returns the results or raises"""
+        with self.Session() as session:
+            results = [write(session) for write, _ in batch]
+            session.commit()
+            self.commits += 1
+        return results
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            batch = [(write, future) for write, future in batch if future.set_running_or_notify_cancel()]
+            try:
+                results = self._commit(batch)
+            except Exception:
+                # One bad write must not fail the others: retry them one by one
+                for write, future in batch:
+                    try:
+                        future.set_result(self._commit([(write, future)])[0])
+                    except Exception as e:
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -157,7 +157,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
         
         if (isValid) {
-            document.getElementById('classification-form').submit();
+            submitClassification();
         }
     }
 
@@ -218,38 +218,40 @@ document.addEventListener('DOMContentLoaded', function() {
 
     updateQuickInputFromForm();
     
-    // Contrast button: cycle through server-generated PNGs and update vmax display
-    const vmaxPercentiles    = [99.0, 99.5, 99.9, 99.95, 80.0, 90.0,];
-    const vmaxRawPercentiles = [99.7, 99.7, 99.9, 99.95, 90.0, 99.0,];
+    // Contrast button: cycle through the presets (drawn in the browser, or server-generated PNGs) and update vmax display
+    // [vmax_percentile, vmax_percentile_raw] pairs, config.CONTRAST_PRESETS on the server
+    const contrastPresets = JSON.parse(classificationForm.dataset.contrastPresets);
+    // Widths of the downscaled copies rendered next to every panel, the last one is the panel itself
+    const srcsetWidths = JSON.parse(classificationForm.dataset.srcsetWidths);
+    const panelSizes = document.querySelector('.galaxy-image[sizes]')?.sizes || '100vw';
     let contrastIndex = 0;
-    const galaxyId = document.querySelector('input[name="galaxy_id"]').value;
+    let galaxyId = document.querySelector('input[name="galaxy_id"]').value;
 
     document.getElementById('contrast-btn').addEventListener('click', () => {
     // advance index
-    contrastIndex = (contrastIndex + 1) % vmaxPercentiles.length;
+    contrastIndex = (contrastIndex + 1) % contrastPresets.length;
+    // Drawn in the browser once the panel data is there, the rendered PNGs otherwise
+    const drawn = panelData !== null;
+    if (drawn) drawPanels();
 
     document.querySelectorAll('.galaxy-image[data-base-name]').forEach(img => {
         const base = img.dataset.baseName;
-        const v  = vmaxPercentiles[contrastIndex];
-        const vr = vmaxRawPercentiles[contrastIndex];
+        // Colour images do not change with the contrast
+        if (['aplpy', 'lupton'].includes(base)) return;
+        const [v, vr] = contrastPresets[contrastIndex];
         // update image src
-        img.src = `/static/galaxy_images/${galaxyId}/${getImageFilename(base, v, vr)}`;
+        if (!drawn) {
+            const url = `/static/galaxy_images/${galaxyId}/${getImageFilename(base, v, vr)}`;
+            img.srcset = getSrcset(url);
+            img.src = url;
+        }
         // update vmax-info text
         const small = document.querySelector(`.vmax-info[data-target-image="${base}"]`);
         if (small) {
-            // Decide on 1 or 2 decimal places: one place if decimal*10 is (nearly) an integer, else two places
-            const decimal = Math.abs(v % 1);
-            const isOneDecimal = Math.abs(decimal * 10 - Math.round(decimal * 10)) < 0.001;
-            const needed_decimal_places = isOneDecimal ? 1 : 2;
-
             if (['masked_r_band','galfit_model','residual'].includes(base)) {
-                small.textContent = `(${v.toFixed(needed_decimal_places)})`;
+                small.textContent = formatVmax(v);
             } else if (base === 'raw_r_band') {
-                // for raw_r_band, check vr's decimals similarly
-                const decRaw = Math.abs(vr % 1);
-                const isOneDecRaw = Math.abs(decRaw * 10 - Math.round(decRaw * 10)) < 0.001;
-                const placesRaw = isOneDecRaw ? 1 : 2;
-                small.textContent = `(${vr.toFixed(placesRaw)})`;
+                small.textContent = formatVmax(vr);
             } else {
                 small.textContent = '';
             }
@@ -257,6 +259,21 @@ document.addEventListener('DOMContentLoaded', function() {
     });
     });
 
+    function formatVmax(value) {
+        if (value === null || value === undefined) return '';
+        // Decide on 1 or 2 decimal places: one place if decimal*10 is (nearly) an integer, else two places
+        const decimal = Math.abs(value % 1);
+        const isOneDecimal = Math.abs(decimal * 10 - Math.round(decimal * 10)) < 0.001;
+        return `(${value.toFixed(isOneDecimal ? 1 : 2)})`;
+    }
+
+    function getSrcset(url) {
+        const stem = url.replace(/\.png$/, '');
+        const fullWidth = srcsetWidths[srcsetWidths.length - 1];
+        return srcsetWidths.slice(0, -1).map(w => `${stem}_w${w}.png ${w}w`)
+            .concat([`${url} ${fullWidth}w`]).join(', ');
+    }
+
     function slugify(value) {
         // ensure one decimal place, replace '.'→'p', '-'→'m'
         // Format to 1 decimal place normally, 2 places if needed for precision
@@ -276,6 +293,615 @@ document.addEventListener('DOMContentLoaded', function() {
     return `${baseName}.png`;
     }
 
+    // Client-side rendering: the quantized FITS panels of the galaxy
+    // (services/panel_data.py) are loaded once and drawn on a canvas with the
+    // contrast preset and colormap chosen, without renders or requests. Until
+    // the data is there, or if it cannot be loaded, the rendered PNGs are used.
+    const colormapSelect = document.getElementById('colormap-select');
+    const colormapLuts = {};
+    Object.entries(JSON.parse(classificationForm.dataset.colormaps)).forEach(([name, encoded]) => {
+        colormapLuts[name] = Uint8Array.from(atob(encoded), c => c.charCodeAt(0));
+    });
+    let panelDataUrl = classificationForm.dataset.panelDataUrl || null;
+    let panelData = null;
+    let panelDrawCount = 0;
+    const panelObjectUrls = {};
+
+    function parsePanelData(buffer) {
+        const view = new DataView(buffer);
+        const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+        if (magic !== 'LSBQ') throw new Error('Not a panel data file');
+        const headerLength = view.getUint32(4, true);
+        const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 8, headerLength)));
+        const size = header.width * header.height;
+        const panels = {};
+        header.panels.forEach((panel, i) => {
+            // Little endian like every browser platform, so the codes are viewed in place
+            panels[panel.name] = Object.assign({codes: new Uint16Array(buffer, 8 + headerLength + i * size * 2, size)}, panel);
+        });
+        return {header: header, panels: panels, vmax: {}};
+    }
+
+    function loadPanelData() {
+        const id = galaxyId;
+        if (!panelDataUrl || !colormapSelect || !window.HTMLCanvasElement) return;
+        fetch(panelDataUrl)
+            .then(response => response.ok ? response.arrayBuffer() : Promise.reject(response.status))
+            .then(buffer => {
+                if (id !== galaxyId) return;
+                panelData = parsePanelData(buffer);
+                colormapSelect.disabled = false;
+                // Shown as rendered until the user changes something
+                if (contrastIndex !== 0 || colormapSelect.value !== panelData.header.cmap) drawPanels();
+            })
+            .catch(() => { /* Keep the rendered PNGs */ });
+    }
+
+    function codeAtRank(cumulative, rank) {
+        let lo = 0, hi = cumulative.length - 1;
+        while (lo < hi) {
+            const mid = (lo + hi) >> 1;
+            if (cumulative[mid] > rank) hi = mid; else lo = mid + 1;
+        }
+        return lo;
+    }
+
+    function panelVmax(name, percentile) {
+        // np.percentile (linear interpolation) of a panel, from a histogram of its codes
+        const panel = panelData.panels[name];
+        const nanCode = panelData.header.nan_code;
+        if (!panel.cumulative) {
+            const counts = new Uint32Array(nanCode);
+            panel.codes.forEach(code => { if (code !== nanCode) counts[code]++; });
+            for (let i = 1; i < counts.length; i++) counts[i] += counts[i - 1];
+            panel.cumulative = counts;
+        }
+        const key = `${name}/${percentile}`;
+        if (!(key in panelData.vmax)) {
+            const count = panel.cumulative[panel.cumulative.length - 1];
+            const rank = percentile / 100 * (count - 1);
+            const below = Math.floor(rank);
+            const lower = codeAtRank(panel.cumulative, below);
+            const upper = codeAtRank(panel.cumulative, Math.min(below + 1, count - 1));
+            panelData.vmax[key] = panel.offset + (lower + (rank - below) * (upper - lower)) * panel.scale;
+        }
+        return panelData.vmax[key];
+    }
+
+    function drawPanel(name, cmap) {
+        const header = panelData.header;
+        const panel = panelData.panels[name];
+        const [v, vr] = contrastPresets[contrastIndex];
+        const vmax = panelVmax(panel.vmax_from, panel.vmax_from === 'raw_r_band' ? vr : v);
+
+        // Colour of every code, as matplotlib maps [vmin, vmax] onto 256 colours; NaN stays transparent
+        const lut = new Uint32Array(header.nan_code + 1);
+        const lutBytes = new Uint8Array(lut.buffer);
+        const colors = colormapLuts[cmap];
+        const span = (vmax - panel.offset) / panel.scale;
+        for (let code = 0; code < header.nan_code; code++) {
+            const index = span > 0 ? Math.max(0, Math.min(255, Math.floor(code / span * 256))) : 0;
+            lutBytes.set(colors.subarray(index * 3, index * 3 + 3), code * 4);
+            lutBytes[code * 4 + 3] = 255;
+        }
+        const pixels = new ImageData(header.width, header.height);
+        const pixels32 = new Uint32Array(pixels.data.buffer);
+        const codes = panel.codes;
+        for (let i = 0; i < codes.length; i++) pixels32[i] = lut[codes[i]];
+
+        const source = document.createElement('canvas');
+        source.width = header.width;
+        source.height = header.height;
+        source.getContext('2d').putImageData(pixels, 0, 0);
+
+        // Data pixel (x, y) is centred at ((x + 0.5) * k, (y + 0.5) * k), like imshow
+        const k = header.pixel_scale;
+        const points = header.dpi / 72;
+        const canvas = document.createElement('canvas');
+        canvas.width = Math.round(header.width * k);
+        canvas.height = Math.round(header.height * k);
+        const ctx = canvas.getContext('2d');
+        ctx.drawImage(source, 0, 0, canvas.width, canvas.height);
+        const toCanvas = (x, y) => [(x + 0.5) * k, (y + 0.5) * k];
+
+        if (name === 'masked_r_band') {
+            ctx.strokeStyle = header.mask_contour.color;
+            ctx.lineWidth = 1.5 * points;
+            header.mask_contour.lines.forEach(line => {
+                ctx.beginPath();
+                for (let i = 0; i < line.length; i += 2) ctx.lineTo(...toCanvas(line[i], line[i + 1]));
+                ctx.stroke();
+            });
+        }
+        const ellipse = header.ellipse;
+        ctx.strokeStyle = ellipse.color;
+        ctx.lineWidth = 1.5 * points;
+        ctx.beginPath();
+        // The y axis points down in both, so the angle keeps its sense
+        ctx.ellipse(...toCanvas(ellipse.x, ellipse.y), ellipse.width / 2 * k, ellipse.height / 2 * k,
+                    ellipse.angle * Math.PI / 180, 0, 2 * Math.PI);
+        ctx.stroke();
+        if (name === 'raw_r_band' && header.redshift) {
+            const [x0, y0] = toCanvas(ellipse.x, ellipse.y);
+            const [x1, y1] = toCanvas(header.redshift.x, header.redshift.y);
+            ctx.strokeStyle = header.redshift.color;
+            ctx.lineWidth = 2 * points;
+            ctx.setLineDash([3.7 * 2 * points, 1.6 * 2 * points]);
+            ctx.beginPath();
+            ctx.moveTo(x0, y0);
+            ctx.lineTo(x1, y1);
+            ctx.stroke();
+            ctx.setLineDash([]);
+            const arm = Math.sqrt(150) / 2 * points;
+            ctx.lineWidth = 1.5 * points;
+            ctx.beginPath();
+            ctx.moveTo(x1 - arm, y1 - arm);
+            ctx.lineTo(x1 + arm, y1 + arm);
+            ctx.moveTo(x1 - arm, y1 + arm);
+            ctx.lineTo(x1 + arm, y1 - arm);
+            ctx.stroke();
+        }
+        return canvas;
+    }
+
+    function drawPanels() {
+        const drawCount = ++panelDrawCount;
+        const cmap = colormapSelect.value;
+        panelData.header.panels.forEach(({name}) => {
+            drawPanel(name, cmap).toBlob(blob => {
+                // A later contrast or colormap change, or another galaxy, wins
+                if (drawCount !== panelDrawCount || !blob) return;
+                if (panelObjectUrls[name]) URL.revokeObjectURL(panelObjectUrls[name]);
+                panelObjectUrls[name] = URL.createObjectURL(blob);
+                document.querySelectorAll(`.galaxy-image[data-base-name="${name}"]`).forEach(img => {
+                    img.removeAttribute('srcset');
+                    img.src = panelObjectUrls[name];
+                });
+            });
+        });
+    }
+
+    function resetPanelData(url) {
+        panelData = null;
+        panelDrawCount++;
+        Object.keys(panelObjectUrls).forEach(name => {
+            URL.revokeObjectURL(panelObjectUrls[name]);
+            delete panelObjectUrls[name];
+        });
+        if (colormapSelect) colormapSelect.disabled = true;
+        panelDataUrl = url || null;
+        loadPanelData();
+    }
+
+    if (colormapSelect) {
+        colormapSelect.addEventListener('change', () => { if (panelData) drawPanels(); });
+    }
+    loadPanelData();
+
+    // Deep-zoom viewer: fetch only the 256px tiles of the raw r-band pyramid that are visible
+    const tileViewer = document.getElementById('tile-viewer');
+    const tileCanvas = document.getElementById('tile-viewer-canvas');
+    let tileState = null;
+
+    function tileLevelScale(level) {
+        return Math.pow(2, level - tileState.meta.native_level);
+    }
+
+    function renderTiles() {
+        const meta = tileState.meta;
+        const size = meta.tile_size;
+        const scale = tileLevelScale(tileState.level);
+        const levelWidth = Math.max(1, Math.round(meta.width * scale));
+        const levelHeight = Math.max(1, Math.round(meta.height * scale));
+        const columns = Math.ceil(levelWidth / size);
+        const rows = Math.ceil(levelHeight / size);
+
+        const viewWidth = tileCanvas.clientWidth;
+        const viewHeight = tileCanvas.clientHeight;
+        const x0 = Math.max(0, Math.floor(-tileState.offsetX / size));
+        const x1 = Math.min(columns - 1, Math.floor((viewWidth - tileState.offsetX - 1) / size));
+        const y0 = Math.max(0, Math.floor(-tileState.offsetY / size));
+        const y1 = Math.min(rows - 1, Math.floor((viewHeight - tileState.offsetY - 1) / size));
+
+        const visible = new Set();
+        for (let y = y0; y <= y1; y++) {
+            for (let x = x0; x <= x1; x++) {
+                const key = `${tileState.level}/${x}_${y}`;
+                visible.add(key);
+                let tile = tileState.tiles.get(key);
+                if (!tile) {
+                    tile = document.createElement('img');
+                    tile.src = `${tileState.base}/${key}.png`;
+                    tileState.tiles.set(key, tile);
+                    tileCanvas.appendChild(tile);
+                }
+                tile.style.left = `${tileState.offsetX + x * size}px`;
+                tile.style.top = `${tileState.offsetY + y * size}px`;
+            }
+        }
+        // Drop tiles that scrolled out of view or belong to another level
+        tileState.tiles.forEach((tile, key) => {
+            if (!visible.has(key)) {
+                tile.remove();
+                tileState.tiles.delete(key);
+            }
+        });
+        document.getElementById('tile-viewer-level').textContent =
+            `(zoom ${scale >= 1 ? scale : scale.toFixed(2)}x)`;
+    }
+
+    function zoomTiles(delta, centerX, centerY) {
+        const level = Math.min(tileState.meta.max_level, Math.max(0, tileState.level + delta));
+        if (level === tileState.level) return;
+        // Keep the image point under the cursor fixed
+        const factor = Math.pow(2, level - tileState.level);
+        tileState.offsetX = centerX - (centerX - tileState.offsetX) * factor;
+        tileState.offsetY = centerY - (centerY - tileState.offsetY) * factor;
+        tileState.level = level;
+        renderTiles();
+    }
+
+    function openTileViewer() {
+        const [v, vr] = contrastPresets[contrastIndex];
+        const variant = getImageFilename('raw_r_band', v, vr).replace('.png', '');
+        const base = `/tiles/${galaxyId}/${variant}`;
+        fetch(`${base}/meta.json`)
+            .then(response => response.ok ? response.json() : Promise.reject(response.status))
+            .then(meta => {
+                tileViewer.classList.remove('d-none');
+                tileCanvas.innerHTML = '';
+                tileState = {base: base, meta: meta, level: meta.native_level, offsetX: 0, offsetY: 0, tiles: new Map()};
+                // Start at native resolution, centred
+                tileState.offsetX = Math.round((tileCanvas.clientWidth - meta.width) / 2);
+                tileState.offsetY = Math.round((tileCanvas.clientHeight - meta.height) / 2);
+                renderTiles();
+            })
+            .catch(() => alert('Zoomable image is not available for this galaxy.'));
+    }
+
+    function closeTileViewer() {
+        tileViewer.classList.add('d-none');
+        tileCanvas.innerHTML = '';
+        tileState = null;
+    }
+
+    // Delegated, image cards get cloned when the layout changes
+    document.addEventListener('click', e => {
+        if (e.target.closest('.tile-zoom-btn')) openTileViewer();
+    });
+    document.getElementById('tile-viewer-close').addEventListener('click', closeTileViewer);
+    document.getElementById('tile-zoom-in').addEventListener('click', () =>
+        zoomTiles(1, tileCanvas.clientWidth / 2, tileCanvas.clientHeight / 2));
+    document.getElementById('tile-zoom-out').addEventListener('click', () =>
+        zoomTiles(-1, tileCanvas.clientWidth / 2, tileCanvas.clientHeight / 2));
+    document.addEventListener('keydown', e => {
+        if (tileState && e.key === 'Escape') closeTileViewer();
+    });
+
+    tileCanvas.addEventListener('wheel', e => {
+        e.preventDefault();
+        const rect = tileCanvas.getBoundingClientRect();
+        zoomTiles(e.deltaY < 0 ? 1 : -1, e.clientX - rect.left, e.clientY - rect.top);
+    }, {passive: false});
+
+    let tileDrag = null;
+    tileCanvas.addEventListener('pointerdown', e => {
+        tileDrag = {x: e.clientX, y: e.clientY};
+        tileCanvas.setPointerCapture(e.pointerId);
+    });
+    tileCanvas.addEventListener('pointermove', e => {
+        if (!tileDrag || !tileState) return;
+        tileState.offsetX += e.clientX - tileDrag.x;
+        tileState.offsetY += e.clientY - tileDrag.y;
+        tileDrag = {x: e.clientX, y: e.clientY};
+        renderTiles();
+    });
+    tileCanvas.addEventListener('pointerup', () => { tileDrag = null; });
+    window.addEventListener('resize', () => { if (tileState) renderTiles(); });
+
+    // In-page navigation: previous, next and history go through the JSON API,
+    // the page contents are swapped and the URL is updated with pushState.
+    // Classifications and skips are queued in localStorage and sent in batches,
+    // while the user continues with prefetched galaxies.
+    const apiClassifyUrl = classificationForm.dataset.apiClassify;
+    const apiBatchUrl = classificationForm.dataset.apiBatch;
+    const apiPrefetchUrl = classificationForm.dataset.apiPrefetch;
+    // Per user: another user logging in on the same browser must not send this one's queue
+    const QUEUE_STORAGE_KEY = 'lsbmorph-submission-queue:' + classificationForm.dataset.username;
+    const BATCH_SIZE = 50;
+    const PREFETCH_COUNT = 5;
+    const RETRY_MS = 5000;
+
+    const progressBar = document.getElementById('progress-bar');
+    const queueStatus = document.getElementById('submission-queue-status');
+    let progress = {
+        classified_count: Number(progressBar.dataset.classifiedCount),
+        total: Number(progressBar.dataset.total),
+    };
+    let currentClassified = classificationForm.dataset.classified === 'true';
+    let prefetched = [];
+    let prefetching = null;
+    let flushing = null;
+    let retryTimer = null;
+    let waitingForNext = false;
+    let memoryQueue = [];
+    let rejected = 0;
+
+    function fetchJson(url, options) {
+        return fetch(url, Object.assign({headers: {'Accept': 'application/json'}}, options))
+            .then(response => response.ok ? response.json() : Promise.reject(response.status));
+    }
+
+    function setNavLink(id, url) {
+        const link = document.getElementById(id);
+        link.href = url || '#';
+        link.classList.toggle('disabled', !url);
+    }
+
+    function showProgress() {
+        const percentage = progress.total > 0 ? progress.classified_count / progress.total * 100 : 0;
+        progressBar.style.width = `${percentage}%`;
+        progressBar.setAttribute('aria-valuenow', percentage);
+        progressBar.textContent = `${progress.classified_count}/${progress.total} (${Math.floor(percentage)}%)`;
+    }
+
+    function showGalaxy(payload, localProgress) {
+        if (tileState) closeTileViewer();
+        galaxyId = payload.galaxy.id;
+        contrastIndex = 0;
+        resetPanelData(payload.urls.panel_data);
+
+        document.querySelector('input[name="galaxy_id"]').value = galaxyId;
+        document.querySelectorAll('.galaxy-id').forEach(el => { el.textContent = galaxyId; });
+        classificationForm.action = payload.urls.submit;
+
+        // Form state from the existing classification
+        const current = payload.current_classification;
+        currentClassified = current !== null;
+        document.querySelectorAll('.lsb-radio, .morph-radio').forEach(radio => {
+            const value = current ? (radio.name === 'lsb_class' ? current.lsb_class : current.morphology) : null;
+            radio.checked = value !== null && Number(radio.value) === value;
+        });
+        document.getElementById('comments').value = current ? current.comments : '';
+        document.getElementById('awesome_flag').checked = current ? current.awesome_flag : false;
+        document.getElementById('valid_redshift').checked = current ? current.valid_redshift : false;
+        document.getElementById('lsb-classification-card').classList.remove('border-danger', 'bg-danger-subtle');
+        document.getElementById('morphology-card').classList.remove('border-danger', 'bg-danger-subtle');
+        updateQuickInputFromForm();
+
+        payload.images.forEach(image => {
+            document.querySelectorAll(`.galaxy-image[data-base-name="${image.base_name}"]`).forEach(img => {
+                img.srcset = image.srcset;
+                img.src = image.url;
+                img.classList.toggle('flip-vertical', image.flip);
+            });
+            document.querySelectorAll(`.vmax-info[data-target-image="${image.base_name}"]`).forEach(small => {
+                small.textContent = formatVmax(image.vmax);
+            });
+            if (image.base_name === 'raw_r_band') {
+                document.querySelectorAll('.tile-zoom-btn').forEach(btn => btn.classList.toggle('d-none', !image.success));
+            }
+        });
+
+        setNavLink('previous-btn', payload.urls.previous);
+        setNavLink('next-btn', payload.urls.next);
+        setNavLink('skip-btn', payload.urls.skip);
+        document.getElementById('aladin-btn').href = payload.urls.aladin;
+
+        // Prefetched payloads carry the progress of when they were fetched
+        if (!localProgress) {
+            progress = {classified_count: payload.progress.classified_count, total: payload.progress.total};
+        }
+        showProgress();
+
+        if (window.innerWidth > mobileBreakpoint) {
+            quickInput.focus();
+        }
+    }
+
+    function showNotFound() {
+        // Nothing left matching the filters, let the server render the "not found" page
+        const url = new URL(window.location.href);
+        url.searchParams.delete('id');
+        window.location.href = url.toString();
+    }
+
+    // Submission queue
+    function loadQueue() {
+        try {
+            const stored = localStorage.getItem(QUEUE_STORAGE_KEY);
+            return stored ? JSON.parse(stored) : [];
+        } catch (e) {
+            return memoryQueue;
+        }
+    }
+
+    function saveQueue(queue) {
+        try {
+            localStorage.setItem(QUEUE_STORAGE_KEY, JSON.stringify(queue));
+        } catch (e) {
+            memoryQueue = queue;
+        }
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+        return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+    }
+
+    function updateQueueStatus() {
+        const pending = loadQueue().length;
+        const messages = [];
+        if (pending) messages.push(`${pending} submission${pending > 1 ? 's' : ''} waiting to be sent`);
+        if (waitingForNext) messages.push('loading the next galaxy');
+        if (rejected) messages.push(`${rejected} submission${rejected > 1 ? 's were' : ' was'} rejected by the server`);
+        queueStatus.textContent = messages.join(', ');
+        queueStatus.classList.toggle('d-none', messages.length === 0);
+    }
+
+    function scheduleRetry() {
+        if (retryTimer) return;
+        retryTimer = setTimeout(() => {
+            retryTimer = null;
+            flushQueue();
+            if (waitingForNext) showPrefetchedOrWait();
+        }, RETRY_MS);
+    }
+
+    function flushQueue() {
+        if (flushing) return flushing;
+        const batch = loadQueue().slice(0, BATCH_SIZE);
+        if (batch.length === 0) return Promise.resolve();
+        flushing = fetchJson(apiBatchUrl, {
+            method: 'POST',
+            headers: {'Accept': 'application/json', 'Content-Type': 'application/json'},
+            body: JSON.stringify({items: batch}),
+        })
+            .then(data => {
+                const done = new Set(data.results.map(result => result.key));
+                rejected += data.results.filter(result => result.status === 'invalid').length;
+                saveQueue(loadQueue().filter(item => !done.has(item.key)));
+                flushing = null;
+                updateQueueStatus();
+                if (loadQueue().length) return flushQueue();
+            })
+            .catch(() => {
+                flushing = null;
+                scheduleRetry();
+            });
+        return flushing;
+    }
+
+    function refillPrefetch() {
+        if (prefetching) return prefetching;
+        if (prefetched.length >= 2) return Promise.resolve(true);
+        const last = prefetched.length ? prefetched[prefetched.length - 1].galaxy.id : galaxyId;
+        const params = new URLSearchParams(window.location.search);
+        params.delete('id');
+        params.set('after', last);
+        params.set('count', PREFETCH_COUNT);
+        prefetching = fetchJson(`${apiPrefetchUrl}?${params}`)
+            .then(data => {
+                data.galaxies.forEach(payload => {
+                    const id = payload.galaxy.id;
+                    if (id === galaxyId || prefetched.some(p => p.galaxy.id === id)) return;
+                    prefetched.push(payload);
+                    // Warm the browser cache with the size the page will pick
+                    payload.images.forEach(image => {
+                        const img = new Image();
+                        if (image.srcset) {
+                            img.sizes = panelSizes;
+                            img.srcset = image.srcset;
+                        }
+                        img.src = image.url;
+                    });
+                });
+                return true;
+            })
+            .catch(() => false)
+            .finally(() => { prefetching = null; });
+        return prefetching;
+    }
+
+    function showPrefetchedOrWait() {
+        const next = prefetched.shift();
+        if (next) {
+            waitingForNext = false;
+            updateQueueStatus();
+            showGalaxy(next, true);
+            history.pushState(null, '', next.urls.classify);
+            refillPrefetch();
+            return;
+        }
+        // Nothing prefetched (campaign mode, or the link is slow): send the queue first,
+        // the next galaxy depends on it
+        waitingForNext = true;
+        updateQueueStatus();
+        flushQueue()
+            .then(() => loadQueue().length ? false : refillPrefetch())
+            .then(ok => {
+                if (!waitingForNext) return;
+                if (prefetched.length) {
+                    showPrefetchedOrWait();
+                } else if (ok) {
+                    showNotFound();
+                } else {
+                    scheduleRetry();
+                }
+            });
+    }
+
+    function submitItem(item) {
+        if (waitingForNext) return;
+        if (item.type === 'classification' && !currentClassified) {
+            progress.classified_count += 1;
+        }
+        currentClassified = true;
+        item.key = newKey();
+        item.galaxy_id = galaxyId;
+        const queue = loadQueue();
+        queue.push(item);
+        saveQueue(queue);
+        updateQueueStatus();
+        flushQueue();
+        showPrefetchedOrWait();
+    }
+
+    function submitClassification() {
+        const lsbSelected = document.querySelector('input[name="lsb_class"]:checked');
+        const morphSelected = document.querySelector('input[name="morphology"]:checked');
+        submitItem({
+            type: 'classification',
+            lsb_class: Number(lsbSelected.value),
+            morphology: morphSelected ? Number(morphSelected.value) : null,
+            comments: document.getElementById('comments').value,
+            awesome_flag: document.getElementById('awesome_flag').checked,
+            valid_redshift: document.getElementById('valid_redshift').checked,
+        });
+    }
+
+    document.getElementById('skip-btn').addEventListener('click', e => {
+        e.preventDefault();
+        if (e.currentTarget.classList.contains('disabled')) return;
+        submitItem({type: 'skip', comments: document.getElementById('comments').value});
+    });
+
+    function showFromServer(search, pushUrl, fallback) {
+        // Send queued submissions first, so the page reflects them
+        flushQueue()
+            .then(() => fetchJson(apiClassifyUrl + search))
+            .then(payload => {
+                waitingForNext = false;
+                updateQueueStatus();
+                showGalaxy(payload);
+                if (pushUrl) history.pushState(null, '', pushUrl);
+                prefetched = [];
+                refillPrefetch();
+            })
+            .catch(fallback);
+    }
+
+    ['previous-btn', 'next-btn'].forEach(id => {
+        document.getElementById(id).addEventListener('click', e => {
+            e.preventDefault();
+            const link = e.currentTarget;
+            if (link.classList.contains('disabled')) return;
+            const target = new URL(link.href);
+            showFromServer(target.search, target.pathname + target.search,
+                           () => { window.location.href = link.href; });
+        });
+    });
+
+    window.addEventListener('popstate', () => {
+        showFromServer(window.location.search, null, () => window.location.reload());
+    });
+
+    window.addEventListener('online', flushQueue);
+    // Leftovers from an earlier visit
+    updateQueueStatus();
+    flushQueue();
+    refillPrefetch();
+
     const mainContentContainer = document.getElementById('main-content-container');
     const classificationFormRow = document.getElementById('classification-form-row');
     const formContainer = document.getElementById('classification-form-container');
@@ -0,0 +1,18 @@
+# tests/conftest.py
+#
+# The settings in config.py are read from the environment on import, so the
+# tests point them at a scratch directory before anything imports config.
+
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+_scratch_dir = tempfile.mkdtemp(prefix='lsbmorph-tests-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_scratch_dir, 'lsbmorph.db')}"
+os.environ['LSBMORPH_DATA_DIR'] = os.path.join(_scratch_dir, 'data')
+os.environ['LSBMORPH_CATALOG_DIR'] = os.path.join(_scratch_dir, 'catalog')
+os.environ.pop('LSBMORPH_IMAGE_STORE', None)
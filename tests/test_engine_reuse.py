@@ -0,0 +1,40 @@
+# tests/test_engine_reuse.py
+#
+# The render fallbacks look galaxies up in the database; they must reuse the
+# process wide engine of models/database.py instead of creating one per call.
+
+import pytest
+
+import config
+from models.database import get_engine, get_sessionmaker, engine_count
+from models.galaxy import Base, Galaxy
+from services.fits_processor import get_galaxy_data, ensure_galaxy_panels
+
+GALAXY_ID = 'TEST_0001'
+
+
+@pytest.fixture(scope='module')
+def galaxy():
+    Base.metadata.create_all(get_engine())
+    with get_sessionmaker()() as s:
+        if s.get(Galaxy, GALAXY_ID) is None:
+            s.add(Galaxy(id=GALAXY_ID, ra=10.0, dec=-20.0, x=50.0, y=50.0,
+                         r_r=3.0, q=0.8, pa=30.0, nucleus=False))
+            s.commit()
+    return GALAXY_ID
+
+
+def test_get_galaxy_data_reuses_engine(galaxy):
+    before = engine_count()
+    for _ in range(3):
+        assert get_galaxy_data(galaxy)['ID'] == galaxy
+    assert engine_count() == before
+
+
+def test_ensure_galaxy_panels_reuses_engine(galaxy, tmp_path):
+    data_dirs = {'output_dir': str(tmp_path / 'galaxy_images'), 'base_dir': config.DATA_BASE_DIR}
+    before = engine_count()
+    # The FITS sources do not exist, so nothing renders, but the galaxy is looked up
+    for _ in range(2):
+        ensure_galaxy_panels(galaxy, data_dirs, panels=['raw_r_band'])
+    assert engine_count() == before
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# bench_async_images.py
+# Load test: latency of cached image requests while cold renders are running.
+#
+# Start the server under test first, e.g.
+#     gunicorn -w 4 app:app -b 127.0.0.1:8000        (synchronous Flask path)
+#     uvicorn asgi:application --port 8001            (async image path)
+# then run
+#     python -m utils.bench_async_images --url http://127.0.0.1:8000 --cold 8
+
+import os
+import time
+import random
+import asyncio
+import argparse
+from urllib.parse import urlsplit, quote
+
+import config
+from services.fits_processor import get_image_filename
+
+
+async def fetch(host, port, path):
+    """Minimal HTTP/1.1 GET, returns (status, seconds)"""
+    start = time.perf_counter()
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(f"GET {quote(path)} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n".encode())
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()  # Drain headers and body
+    writer.close()
+    elapsed = time.perf_counter() - start
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, elapsed
+
+
+def find_cached_images(output_dir, limit):
+    """Existing default-contrast images to use as the cached workload"""
+    paths = []
+    for galaxy_id in sorted(os.listdir(output_dir)):
+        if galaxy_id.startswith('.'):
+            continue
+        filename = get_image_filename('residual', config.VMAX_PERCENTILE, config.VMAX_PERCENTILE_RAW)
+        if os.path.exists(os.path.join(output_dir, galaxy_id, filename)):
+            paths.append(f"/static/galaxy_images/{galaxy_id}/{filename}")
+        if len(paths) >= limit:
+            break
+    return paths
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    index = min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))
+    return values[index]
+
+
+async def run(url, cold, concurrency, duration):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+
+    cached_paths = find_cached_images(config.GALAXY_IMAGES_FOLDER, 200)
+    if not cached_paths:
+        raise SystemExit("No cached images found, run utils/generate_images.py first")
+    galaxy_ids = [p.split('/')[3] for p in cached_paths]
+
+    # Cold renders: contrast variants that are not on disk yet
+    cold_paths = []
+    for i in range(cold):
+        vmax = round(random.uniform(90, 98.9), 2)
+        filename = get_image_filename('masked_r_band', vmax, config.VMAX_PERCENTILE_RAW)
+        cold_paths.append(f"/static/galaxy_images/{galaxy_ids[i % len(galaxy_ids)]}/{filename}")
+
+    latencies = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def cached_worker():
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            status, elapsed = await fetch(host, port, random.choice(cached_paths))
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    async def cold_worker(path):
+        status, elapsed = await fetch(host, port, path)
+        return status, elapsed
+
+    cold_tasks = [asyncio.create_task(cold_worker(p)) for p in cold_paths]
+    await asyncio.gather(*[cached_worker() for _ in range(concurrency)])
+    cold_results = await asyncio.gather(*cold_tasks)
+
+    print(f"Server: {url}")
+    print(f"Cached requests: {len(latencies)} ok, {errors} errors, "
+          f"{len(latencies) / duration:.1f} req/s over {duration}s with {concurrency} clients")
+    for p in (50, 90, 99, 99.9):
+        print(f"  p{p:<5} {percentile(latencies, p) * 1000:8.1f} ms")
+    print(f"  max    {max(latencies) * 1000:8.1f} ms")
+    cold_ok = [e for s, e in cold_results if s == 200]
+    if cold_ok:
+        print(f"Cold renders: {len(cold_ok)}/{len(cold_results)} ok, "
+              f"median {percentile(cold_ok, 50):.2f} s, max {max(cold_ok):.2f} s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tail latency of cached images under concurrent cold renders")
+    parser.add_argument('--url', default='http://127.0.0.1:8000', help="Base URL of the server under test")
+    parser.add_argument('--cold', type=int, default=8, help="Number of concurrent cold renders")
+    parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients requesting cached images")
+    parser.add_argument('--duration', type=float, default=20.0, help="Duration of the cached workload in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.url, args.cold, args.concurrency, args.duration))
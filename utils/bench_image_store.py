@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# bench_image_store.py
+# Lookup and read latency of rendered images, one file per image versus the
+# pack store (IMAGE_STORE = 'pack'). Builds a synthetic cache of
+# galaxies x 4 FITS panels x contrast variants in a temporary directory, in
+# both layouts, and times random existence checks, misses and full reads.
+# The page cache is warm; drop it (as root) between build and run for cold
+# disk numbers.
+#
+#     python -m utils.bench_image_store --galaxies 20000 --variants 3
+
+import os
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import statistics
+
+from services.fits_processor import get_image_filename, FITS_IMAGE_NAMES
+from services.image_store import PackStore
+
+VARIANTS = [(99.0, 99.7), (99.5, 99.7), (99.9, 99.9), (99.95, 99.95), (80.0, 90.0), (90.0, 99.0)]
+
+
+def build(root, galaxies, variants, size, shards):
+    """Write the same synthetic images as files and into a pack store; returns (output_dir, store, images)"""
+    blob = os.urandom(size)
+    output_dir = os.path.join(root, 'galaxy_images')
+    store = PackStore(os.path.join(root, 'packs'), shard_count=shards)
+    images = []
+    for i in range(galaxies):
+        galaxy_id = f"KiDSDR4_J{100000 + i:06d}.000+000000.00"
+        filenames = [get_image_filename(name, v, vr) for v, vr in VARIANTS[:variants] for name in FITS_IMAGE_NAMES]
+        filenames = list(dict.fromkeys(filenames))
+        galaxy_dir = os.path.join(output_dir, galaxy_id)
+        os.makedirs(galaxy_dir)
+        for filename in filenames:
+            with open(os.path.join(galaxy_dir, filename), 'wb') as f:
+                f.write(blob)
+        store.put(galaxy_id, {filename: blob for filename in filenames})
+        images.extend((galaxy_id, filename) for filename in filenames)
+    return output_dir, store, images
+
+
+def timed(func, items):
+    """Per-call latencies of func over items, in microseconds"""
+    latencies = []
+    for item in items:
+        start = time.perf_counter()
+        func(*item)
+        latencies.append((time.perf_counter() - start) * 1e6)
+    return latencies
+
+
+def read_file(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))]
+    print(f"  {label:<22} mean {statistics.mean(latencies):8.1f} us   p50 {statistics.median(latencies):8.1f} us   "
+          f"p95 {p95:8.1f} us")
+
+
+def main(galaxies, variants, size, lookups, shards):
+    root = tempfile.mkdtemp(prefix='bench_image_store_')
+    try:
+        start = time.time()
+        output_dir, store, images = build(root, galaxies, variants, size, shards)
+        print(f"Built {len(images):,} images of {galaxies:,} galaxies ({size:,} bytes each) "
+              f"in {time.time() - start:.1f}s")
+        file_count = sum(len(files) + len(dirs) for _, dirs, files in os.walk(output_dir))
+        pack_count = len(os.listdir(store.root))
+        print(f"Directory layout: {file_count:,} files and directories; pack store: {pack_count} files")
+
+        hits = random.sample(images, min(lookups, len(images)))
+        misses = [(galaxy_id, get_image_filename('residual', 42.0, 42.0)) for galaxy_id, _ in hits]
+
+        print("Files:")
+        report('exists (hit)', timed(lambda g, f: os.path.exists(os.path.join(output_dir, g, f)), hits))
+        report('exists (miss)', timed(lambda g, f: os.path.exists(os.path.join(output_dir, g, f)), misses))
+        report('read', timed(lambda g, f: read_file(os.path.join(output_dir, g, f)), hits))
+        print("Pack store:")
+        report('lookup (hit)', timed(store.lookup, hits))
+        report('lookup (miss)', timed(store.lookup, misses))
+        report('read (mmap)', timed(store.read, hits))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark image lookups: files versus pack store")
+    p.add_argument("--galaxies", type=int, default=2000, help="Number of synthetic galaxies")
+    p.add_argument("--variants", type=int, default=2, choices=range(1, len(VARIANTS) + 1),
+                   help="Contrast variants per galaxy")
+    p.add_argument("--size", type=int, default=16 * 1024, help="Bytes per image")
+    p.add_argument("--lookups", type=int, default=5000, help="Number of timed lookups per test")
+    p.add_argument("--shards", type=int, default=64, help="Pack files of the store")
+    args = p.parse_args()
+    main(args.galaxies, args.variants, args.size, args.lookups, args.shards)
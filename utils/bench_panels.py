@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# bench_panels.py
+# Panels drawn per image request: per-panel rendering (the image routes
+# render only the panel asked for) versus re-rendering all four FITS panels
+# whenever one is missing, as before. Replays on a few galaxies, in a scratch
+# output directory,
+#   - the contrast button cycling through its steps (one request per panel)
+#   - single panels evicted by the cache collector and requested again
+# and reports panels drawn, panels avoided, imgblocks opened and time.
+# Then pre-renders all contrast presets, once per preset and in one pass,
+# and encodes the panel data the browser draws every preset from instead.
+#
+#     python -m utils.bench_panels --galaxies 5
+
+import os
+import time
+import shutil
+import argparse
+import tempfile
+
+import config
+from models.database import get_sessionmaker
+from models.galaxy import Galaxy
+from services.fits_processor import (
+    ensure_galaxy_panels, generate_galaxy_images, get_source_paths, galaxy_data_to_dict, get_image_filename,
+    render_counters, ensure_dir, DEFAULT_COLORS, FITS_IMAGE_NAMES
+)
+from services.panel_data import get_panel_data
+
+CONTRAST_STEPS = config.CONTRAST_PRESETS
+
+
+def request_panel(mode, galaxy_data, data_dirs, base_name, vmax_percentile, vmax_percentile_raw):
+    """One image request for a panel that may not be rendered yet"""
+    galaxy_id = galaxy_data['ID']
+    if mode == 'panel':
+        ensure_galaxy_panels(galaxy_id, data_dirs, panels=[base_name], galaxy_data=galaxy_data,
+                             vmax_percentile=vmax_percentile, vmax_percentile_raw=vmax_percentile_raw)
+        return
+    filename = get_image_filename(base_name, vmax_percentile, vmax_percentile_raw)
+    galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
+    if not os.path.exists(os.path.join(galaxy_dir, filename)):
+        ensure_dir(galaxy_dir)
+        generate_galaxy_images(galaxy_id, galaxy_dir, galaxy_data, data_dirs, DEFAULT_COLORS,
+                               vmax_percentile=vmax_percentile, vmax_percentile_raw=vmax_percentile_raw)
+
+
+def replay(mode, galaxies, base_dir):
+    """Run both scenarios in a fresh output directory; returns the counter deltas and seconds"""
+    output_dir = tempfile.mkdtemp(prefix='bench_panels_')
+    data_dirs = {'output_dir': output_dir, 'base_dir': base_dir}
+    try:
+        # The classification page renders the default contrast before any image request
+        for galaxy_data in galaxies:
+            ensure_galaxy_panels(galaxy_data['ID'], data_dirs, galaxy_data=galaxy_data,
+                                 vmax_percentile=config.VMAX_PERCENTILE, vmax_percentile_raw=config.VMAX_PERCENTILE_RAW)
+
+        before = dict(render_counters)
+        start = time.perf_counter()
+        for galaxy_data in galaxies:
+            for vmax_percentile, vmax_percentile_raw in CONTRAST_STEPS + CONTRAST_STEPS[:1]:
+                for base_name in FITS_IMAGE_NAMES:
+                    request_panel(mode, galaxy_data, data_dirs, base_name, vmax_percentile, vmax_percentile_raw)
+
+            # The collector evicted one variant, the next visit asks for it again
+            for base_name in FITS_IMAGE_NAMES:
+                vmax_percentile, vmax_percentile_raw = CONTRAST_STEPS[2]
+                filename = get_image_filename(base_name, vmax_percentile, vmax_percentile_raw)
+                os.remove(os.path.join(output_dir, galaxy_data['ID'], filename))
+                request_panel(mode, galaxy_data, data_dirs, base_name, vmax_percentile, vmax_percentile_raw)
+        elapsed = time.perf_counter() - start
+        return {key: render_counters[key] - before.get(key, 0) for key in render_counters}, elapsed
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def prerender(mode, galaxies, base_dir):
+    """Render every contrast preset of all panels (or the panel data); returns the counter deltas and seconds"""
+    output_dir = tempfile.mkdtemp(prefix='bench_panels_')
+    data_dirs = {'output_dir': output_dir, 'base_dir': base_dir}
+    try:
+        before = dict(render_counters)
+        start = time.perf_counter()
+        for galaxy_data in galaxies:
+            if mode == 'client':
+                get_panel_data(galaxy_data['ID'], data_dirs, presets=CONTRAST_STEPS, galaxy_data=galaxy_data)
+                continue
+            if mode == 'batch':
+                ensure_galaxy_panels(galaxy_data['ID'], data_dirs, galaxy_data=galaxy_data, presets=CONTRAST_STEPS)
+                continue
+            for vmax_percentile, vmax_percentile_raw in CONTRAST_STEPS:
+                ensure_galaxy_panels(galaxy_data['ID'], data_dirs, galaxy_data=galaxy_data,
+                                     vmax_percentile=vmax_percentile, vmax_percentile_raw=vmax_percentile_raw)
+        elapsed = time.perf_counter() - start
+        return {key: render_counters[key] - before.get(key, 0) for key in render_counters}, elapsed
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
+
+
+def main(count, base_dir):
+    with get_sessionmaker()() as session:
+        galaxies = []
+        for galaxy in session.query(Galaxy).order_by(Galaxy.id):
+            if os.path.exists(get_source_paths(galaxy.id, galaxy.nucleus, base_dir)['imgblock']):
+                galaxies.append(galaxy_data_to_dict(galaxy))
+            if len(galaxies) >= count:
+                break
+    if not galaxies:
+        raise SystemExit(f"No galaxies with an imgblock under {base_dir}")
+
+    print(f"{len(galaxies)} galaxies, {len(CONTRAST_STEPS)} contrast steps, one evicted panel per galaxy and panel")
+    for mode, label in (('full', 'All panels per miss'), ('panel', 'Requested panel only')):
+        counts, elapsed = replay(mode, galaxies, base_dir)
+        print(f"  {label:<22} {counts['panels_rendered']:4d} panels drawn, {counts['panels_avoided']:4d} avoided, "
+              f"{counts['fits_loads']:4d} imgblocks opened, {elapsed:6.1f}s")
+
+    print(f"Pre-rendering all {len(CONTRAST_STEPS)} contrast presets")
+    for mode, label in (('preset', 'One call per preset'), ('batch', 'One pass'), ('client', 'Panel data (browser)')):
+        counts, elapsed = prerender(mode, galaxies, base_dir)
+        print(f"  {label:<22} {counts['panels_rendered']:4d} panels drawn, {counts['figures']:4d} figures laid out, "
+              f"{counts['fits_loads']:4d} imgblocks opened, {elapsed:6.1f}s")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Compare per-panel rendering with re-rendering all panels")
+    p.add_argument("--galaxies", type=int, default=5, help="Number of galaxies to replay")
+    p.add_argument("--base-dir", default=config.DATA_BASE_DIR, help="Source data directory")
+    args = p.parse_args()
+    main(args.galaxies, args.base_dir)
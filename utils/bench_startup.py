@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# bench_startup.py
+# Measure web worker startup: interpreter + `import app` (which creates the
+# app) and the first request, each in a fresh process.
+#
+#     python -m utils.bench_startup --runs 5
+#     python -m utils.bench_startup --path /static/galaxy_images/<id>/aplpy.png
+
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules a worker serving cached pages and images should not need
+HEAVY_MODULES = ('matplotlib', 'astropy', 'PIL', 'numpy')
+
+CHILD = """
+import sys, time, json
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+response = client.get(sys.argv[1])
+response.close()
+done = time.perf_counter()
+print(json.dumps({
+    'import_s': imported - start,
+    'first_request_s': done - imported,
+    'status': response.status_code,
+    'loaded': [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+def measure(path):
+    """One fresh-process run; returns the child's measurements plus the process wall time"""
+    env = dict(os.environ, PYTHONPATH=BASE_DIR)
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD, path, *HEAVY_MODULES],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    result = json.loads(out.strip().splitlines()[-1])
+    result['process_s'] = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark web worker startup time")
+    p.add_argument("--runs", type=int, default=5, help="Fresh processes to start")
+    p.add_argument("--path", default="/", help="URL of the first request")
+    args = p.parse_args()
+
+    results = [measure(args.path) for _ in range(args.runs)]
+    print(f"{args.runs} runs, first request GET {args.path} -> {results[-1]['status']}")
+    for key, label in (('import_s', 'import app'), ('first_request_s', 'first request'),
+                       ('process_s', 'whole process')):
+        values = [r[key] * 1000 for r in results]
+        print(f"{label:<15} median {statistics.median(values):8.1f} ms   min {min(values):8.1f} ms")
+    print(f"heavy modules loaded: {', '.join(results[-1]['loaded']) or 'none'}")
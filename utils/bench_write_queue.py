@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# bench_write_queue.py
+# Compare per-request commits with the group-commit write queue on a scratch
+# SQLite database: commits/sec, submissions/sec and submit latency.
+#
+#     python -m utils.bench_write_queue --clients 50 --duration 10
+
+import os
+import time
+import random
+import argparse
+import tempfile
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from models.galaxy import Galaxy, User, Classification, upgrade_schema
+from services.write_queue import WriteQueue
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return float('nan')
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+
+def create_database(path, galaxies, users):
+    engine = create_engine(f"sqlite:///{path}")
+    upgrade_schema(engine)
+    with sessionmaker(bind=engine)() as session:
+        session.add_all([
+            Galaxy(id=f"G{i:07d}", ra=random.uniform(0, 360), dec=random.uniform(-30, 30), position=i)
+            for i in range(galaxies)
+        ])
+        session.add_all([User(username=f"user{i}") for i in range(users)])
+        session.commit()
+    return engine
+
+
+def classification_write(user_id, galaxy_id):
+    def write(session):
+        Classification.create_or_update(
+            session=session, user_id=user_id, galaxy_id=galaxy_id,
+            lsb_class=random.choice((-1, 0, 1)), morphology=random.choice((-1, 0, 1, 2)),
+            comments='', awesome_flag=False, valid_redshift=False,
+        )
+    return write
+
+
+def run(engine, clients, duration, galaxies, write_queue=None):
+    """Each client thread submits classifications back to back, like a busy request handler"""
+    Session = sessionmaker(bind=engine)
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client(user_id):
+        nonlocal errors
+        local_latencies = []
+        local_errors = 0
+        while time.perf_counter() < deadline:
+            write = classification_write(user_id, f"G{random.randrange(galaxies):07d}")
+            start = time.perf_counter()
+            try:
+                if write_queue is not None:
+                    write_queue.submit(write).result()
+                else:
+                    with Session() as session:
+                        write(session)
+                        session.commit()
+                local_latencies.append(time.perf_counter() - start)
+            except Exception:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    threads = [threading.Thread(target=client, args=(i + 1,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    commits = write_queue.commits if write_queue is not None else len(latencies)
+    return {
+        'submissions': len(latencies),
+        'errors': errors,
+        'submissions_per_s': len(latencies) / elapsed,
+        'commits_per_s': commits / elapsed,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def report(name, result):
+    print(f"{name:<22} {result['submissions_per_s']:9.1f} {result['commits_per_s']:9.1f} "
+          f"{result['p50_ms']:9.1f} {result['p99_ms']:9.1f} {result['errors']:7d}")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Benchmark per-request commits against the group-commit write queue")
+    p.add_argument("--clients", type=int, default=50, help="Concurrent submitting clients")
+    p.add_argument("--duration", type=float, default=10.0, help="Seconds per run")
+    p.add_argument("--galaxies", type=int, default=20000, help="Galaxies in the scratch database")
+    p.add_argument("--window-ms", type=float, default=5.0, help="Group-commit window")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"{args.clients} clients, {args.duration:.0f}s per run, SQLite in {tmp}")
+        print(f"{'path':<22} {'submit/s':>9} {'commit/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+
+        engine = create_database(os.path.join(tmp, 'direct.sqlite'), args.galaxies, args.clients)
+        report("commit per request", run(engine, args.clients, args.duration, args.galaxies))
+        engine.dispose()
+
+        engine = create_database(os.path.join(tmp, 'queued.sqlite'), args.galaxies, args.clients)
+        write_queue = WriteQueue(engine, window_ms=args.window_ms)
+        report(f"write queue ({args.window_ms:g} ms)",
+               run(engine, args.clients, args.duration, args.galaxies, write_queue=write_queue))
+        write_queue.close()
+        engine.dispose()
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+# build_catalog.py
+# Write the memory-mapped catalog snapshot used by the web workers.
+# Run after utils/init_db.py has ingested (or reordered) the catalog.
+
+import time
+import argparse
+from models.database import get_sessionmaker
+
+import config
+from models.galaxy import Galaxy
+from services.catalog import write_catalog_snapshot, CatalogSnapshot
+
+
+def build_catalog(db_url, snapshot_dir):
+    """Dump the galaxies table into a catalog snapshot"""
+    Session = get_sessionmaker(db_url)
+    start = time.time()
+    with Session() as session:
+        galaxies = session.query(Galaxy).order_by(Galaxy.position).all()
+        count = write_catalog_snapshot(galaxies, snapshot_dir)
+
+    snapshot = CatalogSnapshot(snapshot_dir)
+    size = snapshot.galaxies.nbytes + snapshot.index.nbytes
+    print(f"Wrote {count} galaxies to {snapshot_dir} "
+          f"({size / 1024 ** 2:.1f} MiB) in {time.time() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Build the memory-mapped catalog snapshot")
+    p.add_argument("--db-url", default=config.SQLALCHEMY_DATABASE_URI,
+                   help="SQLAlchemy database URL (defaults to the app config)")
+    p.add_argument("--out", default=config.CATALOG_SNAPSHOT_DIR,
+                   help="Snapshot directory (defaults to CATALOG_SNAPSHOT_DIR)")
+    args = p.parse_args()
+    build_catalog(args.db_url, args.out)
@@ -2,8 +2,7 @@ import os
 import argparse
 from datetime import datetime
 from astropy.table import Table
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from models.database import get_sessionmaker
 
 # adjust this import to point at your actual model
 from models.galaxy import Classification  
@@ -14,8 +13,7 @@ def export_to_fits(db_url, output_fits, overwrite=False):
     Connects to the database, fetches all Classification rows,
     and writes them to output_fits as a FITS table.
     """
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
+    Session = get_sessionmaker(db_url)
     with Session() as session:
         records = session.query(Classification).all()
 
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# gc_images.py
+# Enforce a disk budget on the rendered galaxy image cache
+
+import argparse
+
+import config
+from services.image_cache import collect_garbage, parse_size, format_size
+from services.image_store import get_image_store
+
+
+def main(budget, dry_run=False):
+    """Run the garbage collector once and print a report"""
+    budget_bytes = parse_size(budget)
+    report = collect_garbage(
+        config.GALAXY_IMAGES_FOLDER,
+        budget_bytes,
+        default_vmax_percentile=config.VMAX_PERCENTILE,
+        default_vmax_percentile_raw=config.VMAX_PERCENTILE_RAW,
+        dry_run=dry_run,
+        store=get_image_store(),
+    )
+
+    print(f"Image cache: {config.GALAXY_IMAGES_FOLDER}")
+    if config.IMAGE_STORE == 'pack':
+        print(f"Pack store:  {config.IMAGE_PACK_FOLDER}")
+    print(f"Total size:      {format_size(report['total_bytes'])}")
+    print(f"Pinned defaults: {format_size(report['pinned_bytes'])}")
+    print(f"Evictable:       {format_size(report['evictable_bytes'])}")
+    print(f"Budget:          {format_size(report['budget_bytes'])}")
+    action = "Would reclaim" if dry_run else "Reclaimed"
+    print(f"{action}:   {format_size(report['reclaimed_bytes'])} "
+          f"({report['reclaimed_bytes']} bytes, {report['evicted_files']} files)")
+    if report['over_budget']:
+        print("Warning: pinned default variants alone exceed the budget")
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Evict least recently served non-default contrast variants from the image cache"
+    )
+    parser.add_argument('--budget', default=config.IMAGE_CACHE_BUDGET,
+                        required=config.IMAGE_CACHE_BUDGET is None,
+                        help="Disk budget for the image cache, e.g. 500M or 20G")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Only report how many bytes would be reclaimed")
+    args = parser.parse_args()
+    main(args.budget, dry_run=args.dry_run)
@@ -6,8 +6,7 @@ import os
 import sys
 import time
 import argparse
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.orm import scoped_session
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # Add web directory to path if needed
@@ -18,16 +17,23 @@ if web_dir not in sys.path:
 
 # Import from web application
 import config
+from models.database import get_sessionmaker
 from models.galaxy import Galaxy
 from services.fits_processor import (
-    get_galaxy_images, get_image_filename, galaxy_data_to_dict
+    get_galaxy_images, panel_variants, get_scaled_filenames, galaxy_data_to_dict, get_tiles_dir, read_galaxy_dependencies,
+    DEFAULT_COLORS, FITS_IMAGE_NAMES
+)
+from services.render_deps import check_dependencies, render_settings_key
+from services.image_store import get_image_store
+from services.render_claims import (
+    ClaimDirectory, parse_shard, galaxy_shard, default_node_name, default_run_id,
+    clear_progress, mark_done, write_progress, read_progress, merge_progress, DEFAULT_LEASE_SECONDS
 )
 
 
 def setup_database_session_class():
     """Establish a connection to the database and return a session"""
-    engine = create_engine(config.SQLALCHEMY_DATABASE_URI)
-    Session = scoped_session(sessionmaker(bind=engine))
+    Session = scoped_session(get_sessionmaker(config.SQLALCHEMY_DATABASE_URI))
     return Session
 
 
@@ -36,44 +42,52 @@ def get_all_galaxy_ids(db_session):
     return [galaxy.id for galaxy in db_session.query(Galaxy.id).all()]
 
 
-def check_existing_images(galaxy_id, output_dir, vmax_percentile, vmax_percentile_raw):
-    """Check if images already exist for this galaxy with these settings"""
-    base_image_names = [
-        "masked_r_band", "galfit_model", "residual", 
-        "raw_r_band", "aplpy", "lupton"
-    ]
-    
+def check_existing_images(galaxy_id, output_dir, vmax_percentile, vmax_percentile_raw, tiles=False, presets=None):
+    """
+    Check if images already exist for this galaxy with these settings (and the
+    contrast presets, if given) and are newer than their sources
+    """
     galaxy_dir = os.path.join(output_dir, galaxy_id)
+    store = get_image_store()
     
-    if not os.path.exists(galaxy_dir):
+    if store is None and not os.path.exists(galaxy_dir):
         return False
     
-    expected_images = {
-        name: get_image_filename(name, vmax_percentile, vmax_percentile_raw)
-        for name in base_image_names
-    }
+    expected_images = list(panel_variants(FITS_IMAGE_NAMES, [(vmax_percentile, vmax_percentile_raw)] + list(presets or [])))
+    # Downscaled copies too, so that caches rendered before they existed are completed
+    expected_files = expected_images + [name for img in expected_images for name in get_scaled_filenames(img)]
     
-    all_exist = all(os.path.exists(os.path.join(galaxy_dir, img)) 
-                   for img in expected_images.values())
-    return all_exist
+    if store is not None:
+        packed = store.list(galaxy_id)
+        all_exist = all(img in packed for img in expected_files)
+    else:
+        all_exist = all(os.path.exists(os.path.join(galaxy_dir, img)) 
+                       for img in expected_files)
+    if tiles:
+        all_exist = all_exist and os.path.exists(
+            os.path.join(get_tiles_dir(galaxy_dir, vmax_percentile_raw), 'meta.json'))
+    if not all_exist:
+        return False
+
+    # Images without a dependency record (rendered before tracking) count as current
+    stale, _ = check_dependencies(
+        read_galaxy_dependencies(galaxy_id, galaxy_dir), expected_images, render_settings_key(DEFAULT_COLORS)
+    )
+    return not stale
 
 
-def process_galaxy(galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw, force=False):
-    """Process a single galaxy and generate its images"""
+def process_galaxy(galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw, force=False, tiles=False, presets=None):
+    """Process a single galaxy and generate its images (all contrast presets in one pass if given)"""
     try:
         galaxy_id = galaxy_data['ID']
-        galaxy_dir = os.path.join(data_dirs['output_dir'], galaxy_id)
         
         # Check if images already exist
         if not force and check_existing_images(
             galaxy_id, data_dirs['output_dir'], 
-            vmax_percentile, vmax_percentile_raw
+            vmax_percentile, vmax_percentile_raw, tiles, presets
         ):
             return galaxy_id, True, "Already exists"
         
-        # Make sure the directory exists
-        os.makedirs(galaxy_dir, exist_ok=True)
-        
         # Generate images
         get_galaxy_images(
             galaxy_id=galaxy_id,
@@ -82,21 +96,83 @@ def process_galaxy(galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw,
             vmax_percentile_raw=vmax_percentile_raw,
             galaxy_data=galaxy_data,
             session=None,
+            generate_tiles=tiles,
+            presets=presets,
         )
         return galaxy_id, True, "Generated"
     except Exception as e:
         return galaxy_id, False, str(e)
 
-def main(num_workers=1, vmax_percentile=99.0, vmax_percentile_raw=99.7, force=False):
+def process_galaxy_claimed(galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw, force,
+                           tiles, node_name, lease_seconds, presets=None):
+    """Claim a galaxy in the shared output directory, then process it"""
+    galaxy_id = galaxy_data['ID']
+
+    # Cheap check first so finished galaxies do not churn claim files
+    if not force and check_existing_images(
+        galaxy_id, data_dirs['output_dir'],
+        vmax_percentile, vmax_percentile_raw, tiles, presets
+    ):
+        return galaxy_id, True, "Already exists"
+
+    claims = ClaimDirectory(data_dirs['output_dir'], node_name=node_name, lease_seconds=lease_seconds)
+    if not claims.claim(galaxy_id):
+        return galaxy_id, True, "Claimed elsewhere"
+    try:
+        # Images may have been finished by the node whose claim we replaced
+        with claims.keep_alive(galaxy_id):
+            return process_galaxy(galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw, force, tiles, presets)
+    finally:
+        claims.release(galaxy_id)
+
+
+def print_progress_report(output_dir, run_id=None):
+    """Print progress merged from all workers of a run (default: the latest) writing to output_dir"""
+    summary = merge_progress(read_progress(output_dir, run_id))
+    if not summary['workers']:
+        print(f"No progress records found in {output_dir}")
+        return summary
+
+    print(f"Run: {summary['run']}")
+
+    now = time.time()
+    print(f"{'Worker':<32} {'Shard':<7} {'Processed':>9} {'Generated':>9} {'Skipped':>8} "
+          f"{'Errors':>7} {'Status':<10}")
+    for r in summary['workers']:
+        if r.get('finished'):
+            status = 'finished'
+        elif now - r.get('updated', 0) > 2 * DEFAULT_LEASE_SECONDS:
+            status = 'stale'
+        else:
+            status = 'running'
+        print(f"{r['node']:<32} {r.get('shard') or 'dyn':<7} {r.get('processed', 0):>9} "
+              f"{r.get('generated', 0):>9} {r.get('skipped', 0):>8} {r.get('errors', 0):>7} {status:<10}")
+
+    total = summary['total']
+    done = summary['generated'] + summary['skipped']
+    progress = done / total * 100 if total else 0
+    print(f"\nTotal: {total} galaxies, Generated: {summary['generated']}, "
+          f"Skipped: {summary['skipped']}, Errors: {summary['errors']} "
+          f"({progress:.2f}%), Finished workers: {summary['finished_workers']}/{len(summary['workers'])}")
+    return summary
+
+
+def main(num_workers=1, vmax_percentile=99.0, vmax_percentile_raw=99.7, force=False, tiles=False,
+         shard=None, dynamic=False, lease_seconds=DEFAULT_LEASE_SECONDS, node_name=None, presets=None,
+         run_id=None, clear_old_progress=False):
     """Main function to orchestrate the process"""
     print(f"Starting image generation with {num_workers} workers")
     print(f"Using vmax_percentile={vmax_percentile}, vmax_percentile_raw={vmax_percentile_raw}")
+    if presets:
+        print(f"Rendering {len(presets)} contrast presets per galaxy in one pass")
     
     # Setup data directories
     data_dirs = {
         'output_dir': config.GALAXY_IMAGES_FOLDER,
         'base_dir': config.DATA_BASE_DIR,
     }
+    node_name = node_name or default_node_name()
+    run_id = run_id or default_run_id()
     
     # Setup database session
     Session = setup_database_session_class()
@@ -104,71 +180,107 @@ def main(num_workers=1, vmax_percentile=99.0, vmax_percentile_raw=99.7, force=Fa
         # Fetch full Galaxy objects and convert to dicts
         galaxies = db_session.query(Galaxy).all()
         galaxy_data_list = [galaxy_data_to_dict(g) for g in galaxies]
-        total_galaxies = len(galaxy_data_list)
-        print(f"Found {total_galaxies} galaxies in the database")
+        print(f"Found {len(galaxy_data_list)} galaxies in the database")
+
+    shard_label = None
+    if shard is not None:
+        shard_index, shard_count = parse_shard(shard)
+        shard_label = f"{shard_index}/{shard_count}"
+        galaxy_data_list = [
+            g for g in galaxy_data_list
+            if galaxy_shard(g['ID'], shard_count) == shard_index
+        ]
+        print(f"Shard {shard_label}: {len(galaxy_data_list)} galaxies")
+
+    if dynamic:
+        # Start every node at a different offset to reduce claim contention
+        offset = galaxy_shard(node_name, max(len(galaxy_data_list), 1))
+        galaxy_data_list = galaxy_data_list[offset:] + galaxy_data_list[:offset]
+        print(f"Dynamic mode: node {node_name}, lease {lease_seconds}s")
+
+    total_galaxies = len(galaxy_data_list)
     
     # Process galaxies
     start_time = time.time()
-    processed = errors = skipped = 0
-    
-    if num_workers > 1:
-        # Use multiprocessing for faster processing
-        with ProcessPoolExecutor(max_workers=num_workers) as executor:
-            futures = {
-                executor.submit(
-                    process_galaxy,
-                    galaxy_data,
-                    data_dirs,
-                    vmax_percentile,
-                    vmax_percentile_raw,
-                    force
-                ): galaxy_data['ID']
-                for galaxy_data in galaxy_data_list
-            }
-            for future in as_completed(futures):
-                galaxy_id, success, message = future.result()
-                processed += 1
-                if not success:
-                    errors += 1
-                    print(f"Error processing {galaxy_id}: {message}")
-                elif message == "Already exists":
-                    skipped += 1
-                if processed % 10 == 0 or processed == total_galaxies:
-                    elapsed = time.time() - start_time
-                    progress = processed / total_galaxies * 100
-                    print(f"Progress: {processed}/{total_galaxies} "
-                          f"({progress:.2f}%) – Generated: {processed - errors - skipped}, "
-                          f"Skipped: {skipped}, Errors: {errors}, Elapsed: {elapsed:.2f}s")
-    else:
-        # Single‑threaded processing
-        for galaxy_data in galaxy_data_list:
-            _, success, message = process_galaxy(
-                galaxy_data,
-                data_dirs,
-                vmax_percentile,
-                vmax_percentile_raw,
-                force
-            )
-            processed += 1
+    stats = dict(run=run_id, total=total_galaxies, shard=shard_label, processed=0, generated=0,
+                 skipped=0, errors=0, claimed_elsewhere=0, done_elsewhere=0, started=start_time, finished=False)
+    if clear_old_progress:
+        clear_progress(data_dirs['output_dir'], run_id)
+    write_progress(data_dirs['output_dir'], node_name, stats)
+    print(f"Run {run_id}")
+
+    def task_args(galaxy_data):
+        if dynamic:
+            return (process_galaxy_claimed, galaxy_data, data_dirs, vmax_percentile,
+                    vmax_percentile_raw, force, tiles, node_name, lease_seconds, presets)
+        return (process_galaxy, galaxy_data, data_dirs, vmax_percentile, vmax_percentile_raw, force, tiles, presets)
+
+    def record(galaxy_id, success, message):
+        """Update counters; returns True if the galaxy has to be retried later"""
+        if message == "Claimed elsewhere":
+            stats['claimed_elsewhere'] += 1
+            return True
+        if not success:
+            print(f"Error processing {galaxy_id}: {message}")
+        if dynamic and not mark_done(data_dirs['output_dir'], run_id, galaxy_id):
+            # Dynamic workers all walk the whole catalog; another one already counted it
+            stats['done_elsewhere'] += 1
+        else:
+            stats['processed'] += 1
             if not success:
-                errors += 1
-                print(f"Error processing {galaxy_data['ID']}: {message}")
+                stats['errors'] += 1
             elif message == "Already exists":
-                skipped += 1
-            if processed % 10 == 0 or processed == total_galaxies:
-                elapsed = time.time() - start_time
-                progress = processed / total_galaxies * 100
-                print(f"Progress: {processed}/{total_galaxies} "
-                      f"({progress:.2f}%) – Generated: {processed - errors - skipped}, "
-                      f"Skipped: {skipped}, Errors: {errors}, Elapsed: {elapsed:.2f}s")
+                stats['skipped'] += 1
+            else:
+                stats['generated'] += 1
+        seen = stats['processed'] + stats['done_elsewhere']
+        if seen % 10 == 0 or seen == total_galaxies:
+            elapsed = time.time() - start_time
+            progress = seen / total_galaxies * 100
+            print(f"Progress: {seen}/{total_galaxies} "
+                  f"({progress:.2f}%) – Generated: {stats['generated']}, "
+                  f"Skipped: {stats['skipped']}, Errors: {stats['errors']}, Elapsed: {elapsed:.2f}s")
+            write_progress(data_dirs['output_dir'], node_name, stats)
+        return False
+
+    pending = galaxy_data_list
+    while pending:
+        retry = []
+        if num_workers > 1:
+            # Use multiprocessing for faster processing
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                futures = {
+                    executor.submit(*task_args(galaxy_data)): galaxy_data
+                    for galaxy_data in pending
+                }
+                for future in as_completed(futures):
+                    if record(*future.result()):
+                        retry.append(futures[future])
+        else:
+            # Single‑threaded processing
+            for galaxy_data in pending:
+                func, *args = task_args(galaxy_data)
+                if record(*func(*args)):
+                    retry.append(galaxy_data)
+
+        if retry and ClaimDirectory(data_dirs['output_dir'], node_name, lease_seconds).active_claims():
+            # Other nodes hold live claims; wait for them to finish or for their leases to expire
+            print(f"{len(retry)} galaxies claimed by other nodes, rechecking in {min(lease_seconds, 30)}s")
+            time.sleep(min(lease_seconds, 30))
+        pending = retry
+
+    stats['finished'] = True
+    write_progress(data_dirs['output_dir'], node_name, stats)
     
     # Final report
     total_time = time.time() - start_time
     print(f"\nImage generation complete!")
     print(f"Total: {total_galaxies} galaxies")
-    print(f"Generated: {processed - errors - skipped}")
-    print(f"Skipped (already exist): {skipped}")
-    print(f"Errors: {errors}")
+    print(f"Generated: {stats['generated']}")
+    print(f"Skipped (already exist): {stats['skipped']}")
+    if stats['done_elsewhere']:
+        print(f"Done by other workers: {stats['done_elsewhere']}")
+    print(f"Errors: {stats['errors']}")
     print(f"Time: {total_time:.2f} seconds")
 
 
@@ -181,12 +293,51 @@ if __name__ == "__main__":
     parser.add_argument('--vmax-raw', type=float, default=99.7, 
                         help="vmax percentile for raw images")
     parser.add_argument('--force', action='store_true', 
-                        help="Force regeneration of existing images")
+                        help="Force regeneration of existing images (without it, only missing images and "
+                             "images whose source files or render settings changed are generated)")
+    parser.add_argument('--tiles', action='store_true', default=config.GENERATE_TILES,
+                        help="Also generate the deep-zoom tile pyramid of the raw r-band panel")
+    parser.add_argument('--shard', metavar='i/N',
+                        help="Only process galaxies whose stable ID hash falls into shard i of N")
+    parser.add_argument('--dynamic', action='store_true',
+                        help="Claim galaxies through lock files in the shared output directory")
+    parser.add_argument('--lease', type=int, default=DEFAULT_LEASE_SECONDS,
+                        help="Seconds after which a claim of a crashed node can be taken over")
+    parser.add_argument('--node', help="Worker name used in claims and progress reports")
+    parser.add_argument('--run-id',
+                        help="Identifier of this generation run; all workers of a multi-node run must pass "
+                             "the same one. With --report, the run to report (default: the latest)")
+    parser.add_argument('--clear-progress', action='store_true',
+                        help="Remove the progress records of all other runs at start. Only pass it when no "
+                             "other run is still writing to the output directory")
+    parser.add_argument('--presets', action='store_true',
+                        help="Render every contrast preset of the contrast button (config.CONTRAST_PRESETS) "
+                             "from one imgblock load per galaxy")
+    parser.add_argument('--report', action='store_true',
+                        help="Print merged progress of all workers sharing the output directory and exit")
     args = parser.parse_args()
+
+    if args.report:
+        print_progress_report(config.GALAXY_IMAGES_FOLDER, args.run_id)
+        sys.exit(0)
+
+    if args.shard:
+        try:
+            parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
     
     main(
         num_workers=args.workers, 
         vmax_percentile=args.vmax, 
         vmax_percentile_raw=args.vmax_raw,
-        force=args.force
-    )
\ No newline at end of file
+        force=args.force,
+        tiles=args.tiles,
+        shard=args.shard,
+        dynamic=args.dynamic,
+        lease_seconds=args.lease,
+        node_name=args.node,
+        presets=config.CONTRAST_PRESETS if args.presets else None,
+        run_id=args.run_id,
+        clear_old_progress=args.clear_progress
+    )
@@ -1,18 +1,16 @@
 import argparse
 from datetime import datetime
 from astropy.table import Table
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from models.database import get_sessionmaker
 
 # adjust this import if your Classification lives elsewhere
-from models.galaxy import Classification, User  
+from models.galaxy import Classification, Galaxy, User  
 
 def import_from_fits(db_url, input_fits, overwrite=False, user_id=None):
     """
     Reads classifications from a FITS table and updates/inserts into the DB.
     """
-    engine = create_engine(db_url)
-    Session = sessionmaker(bind=engine)
+    Session = get_sessionmaker(db_url)
     table = Table.read(input_fits, format='fits')
 
     with Session() as session:
@@ -34,6 +32,8 @@ def import_from_fits(db_url, input_fits, overwrite=False, user_id=None):
             if obj is None:
                 obj = Classification(user_id=user_id, galaxy_id=gid)
                 session.add(obj)
+                # Keep the denormalised count used by the least-voted ordering in step
+                Galaxy.add_vote(session, gid)
                 inserted += 1
             else:
                 if overwrite:
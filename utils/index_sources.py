@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+# index_sources.py
+# Index the source data under DATA_BASE_DIR into the source_files table and
+# report which galaxies are missing files. Run it again (e.g. from cron) to
+# pick up new or replaced files; unchanged directories are skipped.
+#
+#     python -m utils.index_sources             # incremental update + report
+#     python -m utils.index_sources --full      # rescan every directory
+#     python -m utils.index_sources --report    # report only, no scan
+
+import time
+import argparse
+
+import config
+from models.database import get_engine, get_sessionmaker
+from models.galaxy import upgrade_schema
+from services.source_index import index_sources, availability_report
+
+KIND_LABELS = {
+    'imgblock': 'imgblock',
+    'unmasked_imgblock': 'unmasked imgblock',
+    'mask': 'mask',
+    'aplpy': 'APLpy colour image',
+    'lupton': 'Lupton colour image',
+}
+
+
+def print_report(report):
+    print(f"{report['galaxies']:,} galaxies in the catalog")
+    for kind, count in report['missing'].items():
+        print(f"  {count:,} galaxies have no {KIND_LABELS[kind]}")
+    if report['orphan_files']:
+        print(f"  {report['orphan_files']:,} indexed files belong to galaxies not in the catalog")
+
+
+def main(db_url, base_dir, full=False, report_only=False):
+    upgrade_schema(get_engine(db_url))
+    with get_sessionmaker(db_url)() as session:
+        if not report_only:
+            start = time.time()
+            stats = index_sources(session, base_dir, full=full)
+            print(f"Indexed {base_dir} in {time.time() - start:.2f}s: "
+                  f"{stats['scanned']} directories scanned, {stats['skipped']} unchanged; "
+                  f"{stats['added']} files added, {stats['updated']} updated, {stats['removed']} removed")
+        print_report(availability_report(session))
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Index source data files and report missing ones")
+    p.add_argument("--db-url", default=config.SQLALCHEMY_DATABASE_URI,
+                   help="SQLAlchemy database URL (defaults to the app config)")
+    p.add_argument("--base-dir", default=config.DATA_BASE_DIR, help="Source data directory")
+    p.add_argument("--full", action="store_true",
+                   help="Rescan all directories, also those whose mtime did not change")
+    p.add_argument("--report", action="store_true", help="Only print the availability report")
+    args = p.parse_args()
+    main(args.db_url, args.base_dir, full=args.full, report_only=args.report)
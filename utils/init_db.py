@@ -1,6 +1,5 @@
-from models.galaxy import Base, Galaxy, User, Classification
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
+from models.galaxy import Base, Galaxy, User, Classification, upgrade_schema
+from models.database import get_engine, get_sessionmaker
 from config import SQLALCHEMY_DATABASE_URI
 import os
 from astropy.io import fits
@@ -8,9 +7,13 @@ import argparse
 
 def init_db():
     """Initialize the database schema"""
-    engine = create_engine(SQLALCHEMY_DATABASE_URI)
-    Base.metadata.create_all(engine)
+    upgrade_schema(get_engine(SQLALCHEMY_DATABASE_URI))
     print("Database tables created.")
+    Session = get_sessionmaker(SQLALCHEMY_DATABASE_URI)
+    with Session() as session:
+        # Classifications imported before the importer kept the counts up to date
+        Galaxy.recount_votes(session)
+        session.commit()
 
 def load_galaxies_from_fits(fits_path):
     """Load galaxy data from FITS catalog into the database"""
@@ -22,8 +25,7 @@ def load_galaxies_from_fits(fits_path):
         with fits.open(fits_path) as hdul:
             data = hdul[1].data
             
-            engine = create_engine(SQLALCHEMY_DATABASE_URI)
-            Session = sessionmaker(bind=engine)
+            Session = get_sessionmaker(SQLALCHEMY_DATABASE_URI)
             session = Session()
             
             # Count galaxies before insertion
@@ -61,6 +63,7 @@ def load_galaxies_from_fits(fits_path):
                     nucleus=bool(row['Nucleus']) if 'Nucleus' in column_names else False,
                     previous_id=prev_id,
                     next_id=next_id,
+                    position=idx,
                 )
 
                 # Check if galaxy already exists
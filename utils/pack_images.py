@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# pack_images.py
+# Move rendered images between the directory layout of GALAXY_IMAGES_FOLDER
+# and the pack store used with IMAGE_STORE = 'pack' (services/image_store.py).
+# Stop the web app (or keep IMAGE_STORE = 'files') while migrating.
+#
+#     python -m utils.pack_images               # pack every galaxy directory
+#     python -m utils.pack_images --keep        # pack, but leave the files in place
+#     python -m utils.pack_images --compact     # drop superseded bytes from the packs
+#     python -m utils.pack_images --unpack      # back to one file per image
+
+import os
+import time
+import argparse
+
+import config
+from services.fits_processor import (
+    parse_image_filename, split_scaled_filename, get_placeholder_paths, link_placeholder, ensure_dir, FITS_IMAGE_NAMES
+)
+from services.render_deps import DEPS_FILENAME
+from services.image_store import PackStore
+from services.panel_data import PANEL_DATA_FILENAME
+from services.image_cache import format_size
+
+
+def packable_files(galaxy_dir):
+    """
+    Rendered FITS panels with their downscaled copies, the panel data for
+    the browser and the dependency record of a galaxy directory (colour
+    images and tiles stay)
+    """
+    filenames = []
+    for entry in os.scandir(galaxy_dir):
+        if entry.is_symlink() or not entry.is_file():
+            continue
+        if entry.name in (DEPS_FILENAME, PANEL_DATA_FILENAME):
+            filenames.append(entry.name)
+        elif entry.name.endswith('.png') and parse_image_filename(split_scaled_filename(entry.name)[0])[0] in FITS_IMAGE_NAMES:
+            filenames.append(entry.name)
+    return filenames
+
+
+def pack(store, output_dir, keep=False):
+    """Pack all galaxy directories of output_dir"""
+    placeholders = get_placeholder_paths(output_dir)
+    start = time.time()
+    galaxies = files = 0
+    for entry in os.scandir(output_dir):
+        if entry.name.startswith('.') or not entry.is_dir():
+            continue
+        stored = store.pack_directory(entry.name, entry.path, packable_files(entry.path),
+                                      placeholders=placeholders, remove=not keep)
+        if not keep:
+            try:
+                os.rmdir(entry.path)
+            except OSError:
+                pass  # Tiles or colour images left
+        galaxies += stored > 0
+        files += stored
+        if galaxies and galaxies % 1000 == 0 and stored:
+            print(f"  {galaxies:,} galaxies, {files:,} files packed")
+    print(f"Packed {files:,} files of {galaxies:,} galaxies in {time.time() - start:.1f}s")
+
+
+def unpack(store, output_dir):
+    """Write every stored image back to output_dir/<galaxy_id>/ and empty the store"""
+    start = time.time()
+    galaxy_ids = store.galaxy_ids()
+    files = 0
+    for galaxy_id in galaxy_ids:
+        galaxy_dir = os.path.join(output_dir, galaxy_id)
+        ensure_dir(galaxy_dir)
+        for filename, entry in store.list(galaxy_id).items():
+            path = os.path.join(galaxy_dir, filename)
+            if entry.pack is None:
+                link_placeholder(entry.placeholder, path)
+            else:
+                with open(path, 'wb') as f:
+                    f.write(store.read_entry(entry))
+            files += 1
+        store.delete(galaxy_id)
+    compact(store)
+    print(f"Unpacked {files:,} files of {len(galaxy_ids):,} galaxies in {time.time() - start:.1f}s")
+
+
+def compact(store):
+    """Rewrite every shard without superseded images"""
+    reclaimed = sum(store.compact(shard) for shard in range(store.shard_count))
+    print(f"Compacted {store.shard_count} shards, reclaimed {format_size(reclaimed)}")
+
+
+def print_stats(store):
+    stats = store.stats()
+    print(f"Pack store: {store.root}")
+    print(f"  {stats['images']:,} entries and {stats['placeholders']:,} placeholder links of {stats['galaxies']:,} galaxies "
+          f"in {stats['packs']} pack files")
+    print(f"  {format_size(stats['live_bytes'])} live of {format_size(stats['pack_bytes'])} on disk")
+
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Migrate rendered images between galaxy directories and pack files")
+    p.add_argument("--output-dir", default=config.GALAXY_IMAGES_FOLDER, help="Directory layout of rendered images")
+    p.add_argument("--pack-dir", default=config.IMAGE_PACK_FOLDER, help="Pack store directory")
+    p.add_argument("--shards", type=int, default=config.IMAGE_PACK_SHARDS,
+                   help="Number of pack files of a new store (an existing store keeps its own)")
+    action = p.add_mutually_exclusive_group()
+    action.add_argument("--keep", action="store_true", help="Pack without removing the files")
+    action.add_argument("--compact", action="store_true", help="Only compact the pack files")
+    action.add_argument("--unpack", action="store_true", help="Move all images back into galaxy directories")
+    args = p.parse_args()
+
+    store = PackStore(args.pack_dir, shard_count=args.shards)
+    if args.compact:
+        compact(store)
+    elif args.unpack:
+        unpack(store, args.output_dir)
+    else:
+        pack(store, args.output_dir, keep=args.keep)
+    print_stats(store)